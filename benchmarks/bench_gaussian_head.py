@@ -0,0 +1,67 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Microbenchmark of the closed-form diagonal Gaussian head of `ActorCritic` against `torch.distributions.Normal`.
+
+Times sampling, log-probability, entropy, mean and std of a batch of action means, without the actor network.
+
+Usage: python benchmarks/bench_gaussian_head.py [--num-envs 4096] [--num-actions 12] [--device cpu]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import torch
+from torch.distributions import Normal
+
+from rsl_rl.modules import ActorCritic
+
+
+def timeit(fn, repeats, device):
+    for _ in range(20):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-envs", type=int, default=4096)
+    parser.add_argument("--num-actions", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=500)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(1, 1, args.num_actions, actor_hidden_dims=[1], critic_hidden_dims=[1]).to(args.device)
+    mean = torch.randn(args.num_envs, args.num_actions, device=args.device, requires_grad=True)
+
+    def distribution():
+        normal = Normal(mean, mean * 0.0 + actor_critic.std)
+        actions = normal.sample()
+        return normal.log_prob(actions).sum(dim=-1), normal.entropy().sum(dim=-1), normal.mean, normal.stddev
+
+    def closed_form():
+        actor_critic.distribution_mean = mean
+        actions = actor_critic.sample()
+        return (
+            actor_critic.get_actions_log_prob(actions),
+            actor_critic.entropy,
+            actor_critic.action_mean,
+            actor_critic.action_std,
+        )
+
+    for name, fn in (("torch.distributions.Normal", distribution), ("closed form", closed_form)):
+        seconds = timeit(fn, args.repeats, args.device)
+        print(f"{name} ({args.num_envs}x{args.num_actions}, {args.device}): {seconds * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
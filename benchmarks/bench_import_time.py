@@ -0,0 +1,65 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Import-time benchmark of the subpackages of rsl_rl, measured with `python -X importtime` in fresh interpreters.
+
+Torch is imported first in every interpreter, the reported time is the cumulative time of the `rsl_rl` modules
+including the dependencies they pull in. Inference-only consumers import `rsl_rl.modules`, the runner modules are
+imported directly since the lazy attributes of `rsl_rl.runners` load them through `importlib`, which `-X importtime`
+does not report.
+
+Usage: python benchmarks/bench_import_time.py [--repeats 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import pathlib
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+MODULES = [
+    "rsl_rl",
+    "rsl_rl.modules",
+    "rsl_rl.utils",
+    "rsl_rl.runners",
+    "rsl_rl.algorithms",
+    "rsl_rl.runners.on_policy_runner",
+    "rsl_rl.runners.amp_on_policy_runner",
+]
+
+
+def import_time(module):
+    """Returns the import time of `module` and its `rsl_rl` parents in seconds after torch."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import torch\nimport {module}"],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    seconds = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # only the top-level entries, nested imports are indented
+        if name.startswith(" rsl_rl"):
+            seconds += int(cumulative) * 1e-6
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        seconds = statistics.median(import_time(module) for _ in range(args.repeats))
+        print(f"import {module}: {seconds * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
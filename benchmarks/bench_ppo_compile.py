@@ -0,0 +1,83 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark of the eager PPO update against the update with the compiled loss (`compile_update`).
+
+Fills the rollout storage with random transitions and times `PPO.update` on it. The first compiled update includes the
+compilation and is reported separately.
+
+Usage: python benchmarks/bench_ppo_compile.py [--num-envs 1024] [--num-steps 24] [--device cpu]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic
+
+
+def fill_storage(alg, num_envs, num_steps, num_obs):
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(num_steps):
+            obs = torch.randn(num_envs, num_obs, device=alg.device)
+            alg.act(obs, obs)
+            dones = (torch.rand(num_envs, device=alg.device) < 0.02).long()
+            alg.process_env_step(torch.randn(num_envs, device=alg.device), dones, {})
+        alg.compute_returns(torch.randn(num_envs, num_obs, device=alg.device))
+
+
+def time_update(alg, args):
+    fill_storage(alg, args.num_envs, args.num_steps, args.num_obs)
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    alg.update()
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-envs", type=int, default=1024)
+    parser.add_argument("--num-steps", type=int, default=24)
+    parser.add_argument("--num-obs", type=int, default=48)
+    parser.add_argument("--num-actions", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    for compile_update in (False, True):
+        torch.manual_seed(0)
+        actor_critic = ActorCritic(
+            args.num_obs,
+            args.num_obs,
+            args.num_actions,
+            actor_hidden_dims=[512, 256, 128],
+            critic_hidden_dims=[512, 256, 128],
+        )
+        alg = PPO(
+            actor_critic,
+            num_learning_epochs=5,
+            num_mini_batches=4,
+            schedule="adaptive",
+            device=args.device,
+            compile_update=compile_update,
+        )
+        alg.init_storage(args.num_envs, args.num_steps, [args.num_obs], [None], [args.num_actions])
+
+        first_seconds = time_update(alg, args)
+        seconds = sum(time_update(alg, args) for _ in range(args.repeats)) / args.repeats
+        name = "compiled" if compile_update else "eager"
+        print(
+            f"{name} PPO update ({args.num_envs}x{args.num_steps}, {args.device}): {seconds * 1e3:.1f} ms"
+            f" (first update {first_seconds:.2f} s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
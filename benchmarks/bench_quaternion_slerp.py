@@ -0,0 +1,105 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Microbenchmark of the branch-free quaternion slerp against the masked version it replaced.
+
+Both versions interpolate the same batch of random quaternion pairs. The masked version scales its inputs in place, so
+it gets fresh copies on every call and the time of the copies is subtracted. With `--compile` the branch-free version
+is also timed under `torch.compile`, the compile time is reported separately.
+
+Usage: python benchmarks/bench_quaternion_slerp.py [--num 1000000] [--device cpu] [--compile]
+"""
+
+from __future__ import annotations
+
+import argparse
+import numpy as np
+import time
+import torch
+
+from rsl_rl.utils.utils import quaternion_slerp
+
+_EPS = np.finfo(float).eps * 4.0
+
+
+def baseline_quaternion_slerp(q0, q1, fraction, spin=0, shortestpath=True):
+    """Batch quaternion spherical linear interpolation, the masked version of rsl_rl before the branch-free one."""
+
+    out = torch.zeros_like(q0)
+
+    zero_mask = torch.isclose(fraction, torch.zeros_like(fraction)).squeeze()
+    ones_mask = torch.isclose(fraction, torch.ones_like(fraction)).squeeze()
+    out[zero_mask] = q0[zero_mask]
+    out[ones_mask] = q1[ones_mask]
+
+    d = torch.sum(q0 * q1, dim=-1, keepdim=True)
+    dist_mask = (torch.abs(torch.abs(d) - 1.0) < _EPS).squeeze()
+    out[dist_mask] = q0[dist_mask]
+
+    if shortestpath:
+        d_old = torch.clone(d)
+        d = torch.where(d_old < 0, -d, d)
+        q1 = torch.where(d_old < 0, -q1, q1)
+
+    angle = torch.acos(d) + spin * torch.pi
+    angle_mask = (torch.abs(angle) < _EPS).squeeze()
+    out[angle_mask] = q0[angle_mask]
+
+    final_mask = torch.logical_or(zero_mask, ones_mask)
+    final_mask = torch.logical_or(final_mask, dist_mask)
+    final_mask = torch.logical_or(final_mask, angle_mask)
+    final_mask = torch.logical_not(final_mask)
+
+    isin = 1.0 / angle
+    q0 *= torch.sin((1.0 - fraction) * angle) * isin
+    q1 *= torch.sin(fraction * angle) * isin
+    q0 += q1
+    out[final_mask] = q0[final_mask]
+    return out
+
+
+def timeit(fn, repeats, device):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=1_000_000, help="Number of quaternion pairs.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--compile", action="store_true", help="Also time the branch-free version compiled.")
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    q0, q1 = torch.randn(2, args.num, 4, generator=generator).to(args.device).unbind(0)
+    q0, q1 = q0 / q0.norm(dim=-1, keepdim=True), q1 / q1.norm(dim=-1, keepdim=True)
+    fraction = torch.rand(args.num, 1, generator=generator).to(args.device)
+
+    copy_seconds = timeit(lambda: (q0.clone(), q1.clone()), args.repeats, args.device)
+    baseline_seconds = timeit(
+        lambda: baseline_quaternion_slerp(q0.clone(), q1.clone(), fraction), args.repeats, args.device
+    )
+    baseline_seconds -= copy_seconds
+    print(f"masked quaternion_slerp ({args.num} pairs, {args.device}): {baseline_seconds * 1e3:.2f} ms")
+    seconds = timeit(lambda: quaternion_slerp(q0, q1, fraction), args.repeats, args.device)
+    print(f"branch-free quaternion_slerp ({args.num} pairs, {args.device}): {seconds * 1e3:.2f} ms")
+
+    if args.compile:
+        compiled_slerp = torch.compile(quaternion_slerp, dynamic=True)
+        start = time.perf_counter()
+        compiled_slerp(q0, q1, fraction)
+        compile_seconds = time.perf_counter() - start
+        seconds = timeit(lambda: compiled_slerp(q0, q1, fraction), args.repeats, args.device)
+        print(f"compiled quaternion_slerp: {seconds * 1e3:.2f} ms (compiled in {compile_seconds:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,21 @@
 
 """Main module for the rsl_rl package."""
 
+import importlib
+
 __version__ = "2.0.1"
 __license__ = "BSD-3"
+
+# Subpackages are imported on first attribute access (PEP 562). This keeps `import rsl_rl` and inference-only
+# imports such as `rsl_rl.modules` free of the training dependencies (tensorboard, GitPython, AMP datasets).
+_SUBPACKAGES = ["algorithms", "datasets", "env", "modules", "runners", "storage", "utils"]
+
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _SUBPACKAGES)
@@ -35,6 +35,7 @@ import torch.optim as optim
 from rsl_rl.modules import ActorCritic
 from rsl_rl.storage import RolloutStorage
 from rsl_rl.storage.replay_buffer import ReplayBuffer
+from rsl_rl.utils.utils import reduce_gradients
 
 class AMPPPO:
     actor_critic: ActorCritic
@@ -58,13 +59,25 @@ class AMPPPO:
                  device='cpu',
                  amp_replay_buffer_size=100000,
                  min_std=None,
+                 compile_update=False,
+                 mixed_precision=False,
+                 target_kl_stop=None,
+                 num_micro_batches=1,
+                 distributed=False,
                  ):
 
         self.device = device
+        # data-parallel training, every rank collects its own rollouts and the gradients are averaged over the ranks
+        self.distributed = distributed
+        self.world_size = torch.distributed.get_world_size() if distributed else 1
+        self.mixed_precision = mixed_precision
 
         self.desired_kl = desired_kl
         self.schedule = schedule
         self.learning_rate = learning_rate
+        # the update stops early once the mean KL of a mini-batch exceeds this threshold
+        self.target_kl_stop = target_kl_stop
+        self.num_learning_epochs_run = num_learning_epochs
         self.min_std = min_std
 
         # Discriminator components
@@ -88,13 +101,16 @@ class AMPPPO:
              'weight_decay': 10e-4, 'name': 'amp_trunk'},
             {'params': self.discriminator.amp_linear.parameters(),
              'weight_decay': 10e-2, 'name': 'amp_head'}]
-        self.optimizer = optim.Adam(params, lr=learning_rate)
+        # the adaptive schedule sets the learning rate as a device tensor, a capturable Adam reads it without host syncs
+        self.optimizer = optim.Adam(params, lr=learning_rate, capturable=torch.device(device).type == "cuda")
         self.transition = RolloutStorage.Transition()
 
         # PPO parameters
         self.clip_param = clip_param
         self.num_learning_epochs = num_learning_epochs
         self.num_mini_batches = num_mini_batches
+        # every mini-batch is processed in micro-batches that accumulate their gradients, bounding the update memory
+        self.num_micro_batches = num_micro_batches
         self.value_loss_coef = value_loss_coef
         self.entropy_coef = entropy_coef
         self.gamma = gamma
@@ -102,7 +118,23 @@ class AMPPPO:
         self.max_grad_norm = max_grad_norm
         self.use_clipped_value_loss = use_clipped_value_loss
 
+        # the mini-batches of the feed-forward generators have static shapes, the loss is compiled once
+        self.compute_losses = self._compute_losses
+        if compile_update:
+            if self.actor_critic.is_recurrent:
+                print("AMPPPO: compiled updates are not supported for recurrent policies, using eager mode.")
+            else:
+                self.compute_losses = torch.compile(self._compute_losses, dynamic=False)
+
     def init_storage(self, num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape):
+        if self.num_micro_batches > 1:
+            # the micro-batches only add up to their mini-batch if the samples split evenly
+            num_batches = self.num_mini_batches * self.num_micro_batches
+            batch_size = num_envs if self.actor_critic.is_recurrent else num_envs * num_transitions_per_env
+            if batch_size % num_batches != 0:
+                raise ValueError(
+                    f"The batch size ({batch_size} {'environments' if self.actor_critic.is_recurrent else 'samples'})"
+                    f" is not divisible by num_mini_batches * num_micro_batches ({num_batches}).")
         self.storage = RolloutStorage(
             num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device)
 
@@ -114,11 +146,14 @@ class AMPPPO:
 
     def act(self, obs, critic_obs, amp_obs):
         if self.actor_critic.is_recurrent:
-            self.transition.hidden_states = self.actor_critic.get_hidden_states()
+            self.storage.add_hidden_states(self.actor_critic.get_hidden_states())
         # Compute the actions and values
-        aug_obs, aug_critic_obs = obs.detach(), critic_obs.detach()
-        self.transition.actions = self.actor_critic.act(aug_obs).detach()
-        self.transition.values = self.actor_critic.evaluate(aug_critic_obs).detach()
+        aug_obs = obs.detach()
+        # keep a shared actor/critic input shared so that the actor critic can fuse their input layers
+        aug_critic_obs = aug_obs if critic_obs is obs else critic_obs.detach()
+        actions, values = self.actor_critic.act_and_evaluate(aug_obs, aug_critic_obs)
+        self.transition.actions = actions.detach()
+        self.transition.values = values.detach()
         self.transition.actions_log_prob = self.actor_critic.get_actions_log_prob(self.transition.actions).detach()
         self.transition.action_mean = self.actor_critic.action_mean.detach()
         self.transition.action_sigma = self.actor_critic.action_std.detach()
@@ -151,142 +186,85 @@ class AMPPPO:
         self.storage.compute_returns(last_values, self.gamma, self.lam)
 
     def update(self):
-        mean_value_loss = 0
-        mean_surrogate_loss = 0
-        mean_amp_loss = 0
-        mean_grad_pen_loss = 0
-        mean_policy_pred = 0
-        mean_expert_pred = 0
+        # the statistics and the learning rate stay on the device and are read once after the update
+        mean_value_loss = torch.zeros((), device=self.device)
+        mean_surrogate_loss = torch.zeros((), device=self.device)
+        mean_amp_loss = torch.zeros((), device=self.device)
+        mean_grad_pen_loss = torch.zeros((), device=self.device)
+        mean_policy_pred = torch.zeros((), device=self.device)
+        mean_expert_pred = torch.zeros((), device=self.device)
+        learning_rate = torch.tensor(self.learning_rate, device=self.device)
+        num_updates = 0
         if self.actor_critic.is_recurrent:
-            generator = self.storage.reccurent_mini_batch_generator(self.num_mini_batches, self.num_learning_epochs)
+            generator = self.storage.reccurent_mini_batch_generator(
+                self.num_mini_batches * self.num_micro_batches, self.num_learning_epochs)
         else:
-            generator = self.storage.mini_batch_generator(self.num_mini_batches, self.num_learning_epochs)
+            generator = self.storage.mini_batch_generator(
+                self.num_mini_batches * self.num_micro_batches, self.num_learning_epochs)
 
         amp_policy_generator = self.amp_storage.feed_forward_generator(
-            self.num_learning_epochs * self.num_mini_batches,
+            self.num_learning_epochs * self.num_mini_batches * self.num_micro_batches,
             self.storage.num_envs * self.storage.num_transitions_per_env //
-                self.num_mini_batches)
+                (self.num_mini_batches * self.num_micro_batches))
         amp_expert_generator = self.amp_data.feed_forward_generator(
-            self.num_learning_epochs * self.num_mini_batches,
+            self.num_learning_epochs * self.num_mini_batches * self.num_micro_batches,
             self.storage.num_envs * self.storage.num_transitions_per_env //
-                self.num_mini_batches)
-        for sample, sample_amp_policy, sample_amp_expert in zip(generator, amp_policy_generator, amp_expert_generator):
-            (
-                obs_batch,
-                critic_obs_batch,
-                actions_batch,
-                target_values_batch,
-                advantages_batch,
-                returns_batch,
-                old_actions_log_prob_batch,
-                old_mu_batch,
-                old_sigma_batch,
-                hid_states_batch,
-                masks_batch,
-            ) = sample
-            aug_obs_batch = obs_batch.detach()
-            self.actor_critic.act(
-                aug_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0]
-            )
-            actions_log_prob_batch = self.actor_critic.get_actions_log_prob(
-                actions_batch
-            )
-            aug_critic_obs_batch = critic_obs_batch.detach()
-            value_batch = self.actor_critic.evaluate(
-                aug_critic_obs_batch,
-                masks=masks_batch,
-                hidden_states=hid_states_batch[1],
-            )
-            mu_batch = self.actor_critic.action_mean
-            sigma_batch = self.actor_critic.action_std
-            entropy_batch = self.actor_critic.entropy
-
-            # KL
-            if self.desired_kl != None and self.schedule == "adaptive":
-                with torch.inference_mode():
-                    kl = torch.sum(
-                        torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
-                        + (
-                            torch.square(old_sigma_batch)
-                            + torch.square(old_mu_batch - mu_batch)
-                        )
-                        / (2.0 * torch.square(sigma_batch))
-                        - 0.5,
-                        axis=-1,
+                (self.num_mini_batches * self.num_micro_batches))
+        # consecutive micro-batches of the finer generators make up one mini-batch
+        micro_batches = zip(generator, amp_policy_generator, amp_expert_generator)
+        for mini_batch in zip(*[micro_batches] * self.num_micro_batches):
+            # the gradients of the micro-batches add up to the gradient of their mini-batch
+            self.optimizer.zero_grad()
+            value_loss = surrogate_loss = amp_loss = grad_pen_loss = policy_pred = expert_pred = kl_mean = 0.0
+            policy_states, expert_states = [], []
+            for sample, sample_amp_policy, sample_amp_expert in mini_batch:
+                (
+                    micro_loss,
+                    micro_value_loss,
+                    micro_surrogate_loss,
+                    micro_amp_loss,
+                    policy_d,
+                    expert_d,
+                    policy_state,
+                    expert_state,
+                    micro_kl_mean,
+                ) = self.compute_losses(sample, sample_amp_policy, sample_amp_expert)
+                # the gradient penalty needs a double backward, which compiled graphs do not support
+                with self._autocast():
+                    micro_grad_pen_loss = self.discriminator.compute_grad_pen(
+                        *sample_amp_expert, lambda_=10
                     )
-                    kl_mean = torch.mean(kl)
+                ((micro_loss + micro_grad_pen_loss) / self.num_micro_batches).backward()
 
-                    if kl_mean > self.desired_kl * 2.0:
-                        self.learning_rate = max(1e-5, self.learning_rate / 1.5)
-                    elif kl_mean < self.desired_kl / 2.0 and kl_mean > 0.0:
-                        self.learning_rate = min(1e-2, self.learning_rate * 1.5)
+                value_loss += micro_value_loss.detach() / self.num_micro_batches
+                surrogate_loss += micro_surrogate_loss.detach() / self.num_micro_batches
+                amp_loss += micro_amp_loss.detach() / self.num_micro_batches
+                grad_pen_loss += micro_grad_pen_loss.detach() / self.num_micro_batches
+                policy_pred += policy_d.detach().mean() / self.num_micro_batches
+                expert_pred += expert_d.detach().mean() / self.num_micro_batches
+                kl_mean += micro_kl_mean / self.num_micro_batches
+                policy_states.append(policy_state)
+                expert_states.append(expert_state)
+            if self.distributed:
+                # the ranks adapt the learning rate and stop on the same KL
+                torch.distributed.all_reduce(kl_mean)
+                kl_mean /= self.world_size
 
-                    for param_group in self.optimizer.param_groups:
-                        param_group["lr"] = self.learning_rate
-
-            # Surrogate loss
-            ratio = torch.exp(
-                actions_log_prob_batch - torch.squeeze(old_actions_log_prob_batch)
-            )
-            surrogate = -torch.squeeze(advantages_batch) * ratio
-            surrogate_clipped = -torch.squeeze(advantages_batch) * torch.clamp(
-                ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
-            )
-            surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
-
-            # Value function loss
-            if self.use_clipped_value_loss:
-                value_clipped = target_values_batch + (
-                    value_batch - target_values_batch
-                ).clamp(-self.clip_param, self.clip_param)
-                value_losses = (value_batch - returns_batch).pow(2)
-                value_losses_clipped = (value_clipped - returns_batch).pow(2)
-                value_loss = torch.max(value_losses, value_losses_clipped).mean()
-            else:
-                value_loss = (returns_batch - value_batch).pow(2).mean()
+            # KL early stopping, this syncs with the host once per mini-batch
+            if self.target_kl_stop is not None and kl_mean.item() > self.target_kl_stop:
+                break
 
-            # Discriminator loss.
-            policy_state, policy_next_state = sample_amp_policy
-            expert_state, expert_next_state = sample_amp_expert
-            if self.amp_normalizer is not None:
+            # KL
+            if self.desired_kl != None and self.schedule == "adaptive":
                 with torch.no_grad():
-                    policy_state = self.amp_normalizer.normalize_torch(policy_state)
-                    policy_next_state = self.amp_normalizer.normalize_torch(
-                        policy_next_state
-                    )
-                    expert_state = self.amp_normalizer.normalize_torch(expert_state)
-                    expert_next_state = self.amp_normalizer.normalize_torch(
-                        expert_next_state
-                    )
-            policy_d = self.discriminator(
-                torch.cat([policy_state, policy_next_state], dim=-1)
-            )
-            expert_d = self.discriminator(
-                torch.cat([expert_state, expert_next_state], dim=-1)
-            )
-            expert_loss = torch.nn.MSELoss()(
-                expert_d, torch.ones(expert_d.size(), device=self.device)
-            )
-            policy_loss = torch.nn.MSELoss()(
-                policy_d, -1 * torch.ones(policy_d.size(), device=self.device)
-            )
-            amp_loss = 0.5 * (expert_loss + policy_loss)
-            grad_pen_loss = self.discriminator.compute_grad_pen(
-                *sample_amp_expert, lambda_=10
-            )
-
-            # Compute total loss.
-            loss = (
-                surrogate_loss
-                + self.value_loss_coef * value_loss
-                - self.entropy_coef * entropy_batch.mean()
-                + amp_loss
-                + grad_pen_loss
-            )
+                    learning_rate = self._adapt_learning_rate(learning_rate, kl_mean)
+                    for param_group in self.optimizer.param_groups:
+                        param_group["lr"] = learning_rate
 
             # Gradient step
-            self.optimizer.zero_grad()
-            loss.backward()
+            if self.distributed:
+                # the optimizer holds the parameters of the actor critic and the discriminator
+                reduce_gradients(param for group in self.optimizer.param_groups for param in group["params"])
             nn.utils.clip_grad_norm_(self.actor_critic.parameters(), self.max_grad_norm)
             self.optimizer.step()
 
@@ -295,18 +273,24 @@ class AMPPPO:
                     min=self.min_std
                 )
 
+            # the micro-batches are normalized with the same statistics, they are updated once per mini-batch
             if self.amp_normalizer is not None:
-                self.amp_normalizer.update(policy_state)
-                self.amp_normalizer.update(expert_state)
+                self.amp_normalizer.update(torch.cat(policy_states))
+                self.amp_normalizer.update(torch.cat(expert_states))
 
-            mean_value_loss += value_loss.item()
-            mean_surrogate_loss += surrogate_loss.item()
-            mean_amp_loss += amp_loss.item()
-            mean_grad_pen_loss += grad_pen_loss.item()
-            mean_policy_pred += policy_d.mean().item()
-            mean_expert_pred += expert_d.mean().item()
+            mean_value_loss += value_loss
+            mean_surrogate_loss += surrogate_loss
+            mean_amp_loss += amp_loss
+            mean_grad_pen_loss += grad_pen_loss
+            mean_policy_pred += policy_pred
+            mean_expert_pred += expert_pred
+            num_updates += 1
+        # the optimizer steps changed the input layers fused for the rollout
+        self.actor_critic.invalidate_fused_input_layer()
 
-        num_updates = self.num_learning_epochs * self.num_mini_batches
+        # the mini-batches are drawn epoch by epoch, a started epoch counts as run
+        self.num_learning_epochs_run = -(-num_updates // self.num_mini_batches)
+        num_updates = max(num_updates, 1)
         mean_value_loss /= num_updates
         mean_surrogate_loss /= num_updates
         mean_amp_loss /= num_updates
@@ -314,5 +298,165 @@ class AMPPPO:
         mean_policy_pred /= num_updates
         mean_expert_pred /= num_updates
         self.storage.clear()
+        *mean_losses, self.learning_rate = torch.stack(
+            [
+                mean_value_loss,
+                mean_surrogate_loss,
+                mean_amp_loss,
+                mean_grad_pen_loss,
+                mean_policy_pred,
+                mean_expert_pred,
+                learning_rate,
+            ]
+        ).tolist()
+        # the learning rate tensor only lives through the update, the optimizer state (and checkpoint) holds a float
+        for param_group in self.optimizer.param_groups:
+            param_group["lr"] = self.learning_rate
+
+        return tuple(mean_losses)
+
+    def broadcast_parameters(self):
+        """Copies the parameters and buffers of the actor critic and the discriminator of rank 0 to all ranks."""
+        for module in (self.actor_critic, self.discriminator):
+            for tensor in module.state_dict().values():
+                torch.distributed.broadcast(tensor, src=0)
+
+    def _compute_losses(self, sample, sample_amp_policy, sample_amp_expert):
+        """Computes the PPO and discriminator losses of a mini-batch, without the gradient penalty.
+
+        Returns:
+            Tuple: The total loss, the value function loss, the surrogate loss, the AMP loss, the discriminator
+                predictions for the policy and the expert transitions, the (normalized) policy and
+                expert states and the mean KL divergence between the old and the new policy.
+        """
+        (
+            obs_batch,
+            critic_obs_batch,
+            actions_batch,
+            target_values_batch,
+            advantages_batch,
+            returns_batch,
+            old_actions_log_prob_batch,
+            old_mu_batch,
+            old_sigma_batch,
+            hid_states_batch,
+            masks_batch,
+        ) = sample
+        aug_obs_batch = obs_batch.detach()
+        aug_critic_obs_batch = aug_obs_batch if critic_obs_batch is obs_batch else critic_obs_batch.detach()
+        # the loss only needs the distribution of the stored actions, no actions are sampled
+        with self._autocast():
+            self.actor_critic.update_distribution(
+                aug_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0]
+            )
+            value_batch = self.actor_critic.evaluate(
+                aug_critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1]
+            )
+        # the log-probabilities, the KL and the loss reductions are computed in fp32
+        value_batch = value_batch.float()
+        actions_log_prob_batch = self.actor_critic.get_actions_log_prob(
+            actions_batch
+        )
+        mu_batch = self.actor_critic.action_mean.float()
+        sigma_batch = self.actor_critic.action_std
+        entropy_batch = self.actor_critic.entropy
+
+        # KL
+        with torch.no_grad():
+            kl = torch.sum(
+                torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
+                + (
+                    torch.square(old_sigma_batch)
+                    + torch.square(old_mu_batch - mu_batch)
+                )
+                / (2.0 * torch.square(sigma_batch))
+                - 0.5,
+                axis=-1,
+            )
+            kl_mean = torch.mean(kl)
+
+        # Surrogate loss
+        # only the trailing dimension is squeezed, micro-batches of recurrent policies can hold a single environment
+        ratio = torch.exp(
+            actions_log_prob_batch - old_actions_log_prob_batch.squeeze(-1)
+        )
+        surrogate = -advantages_batch.squeeze(-1) * ratio
+        surrogate_clipped = -advantages_batch.squeeze(-1) * torch.clamp(
+            ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
+        )
+        surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
+
+        # Value function loss
+        if self.use_clipped_value_loss:
+            value_clipped = target_values_batch + (
+                value_batch - target_values_batch
+            ).clamp(-self.clip_param, self.clip_param)
+            value_losses = (value_batch - returns_batch).pow(2)
+            value_losses_clipped = (value_clipped - returns_batch).pow(2)
+            value_loss = torch.max(value_losses, value_losses_clipped).mean()
+        else:
+            value_loss = (returns_batch - value_batch).pow(2).mean()
+
+        # Discriminator loss.
+        policy_state, policy_next_state = sample_amp_policy
+        expert_state, expert_next_state = sample_amp_expert
+        if self.amp_normalizer is not None:
+            with torch.no_grad():
+                policy_state = self.amp_normalizer.normalize_torch(policy_state)
+                policy_next_state = self.amp_normalizer.normalize_torch(
+                    policy_next_state
+                )
+                expert_state = self.amp_normalizer.normalize_torch(expert_state)
+                expert_next_state = self.amp_normalizer.normalize_torch(
+                    expert_next_state
+                )
+        with self._autocast():
+            policy_d = self.discriminator(
+                torch.cat([policy_state, policy_next_state], dim=-1)
+            )
+            expert_d = self.discriminator(
+                torch.cat([expert_state, expert_next_state], dim=-1)
+            )
+        policy_d = policy_d.float()
+        expert_d = expert_d.float()
+        expert_loss = torch.nn.MSELoss()(
+            expert_d, torch.ones(expert_d.size(), device=self.device)
+        )
+        policy_loss = torch.nn.MSELoss()(
+            policy_d, -1 * torch.ones(policy_d.size(), device=self.device)
+        )
+        amp_loss = 0.5 * (expert_loss + policy_loss)
+
+        # Compute total loss.
+        loss = (
+            surrogate_loss
+            + self.value_loss_coef * value_loss
+            - self.entropy_coef * entropy_batch.mean()
+            + amp_loss
+        )
+        return (
+            loss,
+            value_loss,
+            surrogate_loss,
+            amp_loss,
+            policy_d,
+            expert_d,
+            policy_state,
+            expert_state,
+            kl_mean,
+        )
+
+    def _autocast(self):
+        """Runs the network forwards of the update in bf16 if mixed precision is enabled."""
+        return torch.autocast(torch.device(self.device).type, dtype=torch.bfloat16, enabled=self.mixed_precision)
 
-        return mean_value_loss, mean_surrogate_loss, mean_amp_loss, mean_grad_pen_loss, mean_policy_pred, mean_expert_pred
+    def _adapt_learning_rate(self, learning_rate, kl_mean):
+        """Adaptive KL schedule, evaluated on the device to avoid a host sync per mini-batch."""
+        learning_rate = torch.where(
+            kl_mean > self.desired_kl * 2.0, torch.clamp(learning_rate / 1.5, min=1e-5), learning_rate
+        )
+        return torch.where(
+            (kl_mean < self.desired_kl / 2.0) & (kl_mean > 0.0),
+            torch.clamp(learning_rate * 1.5, max=1e-2),
+            learning_rate,
+        )
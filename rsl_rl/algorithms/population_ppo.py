@@ -0,0 +1,218 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import math
+import torch
+import torch.optim as optim
+
+from rsl_rl.algorithms.ppo import PPO
+from rsl_rl.modules import ActorCriticPopulation
+from rsl_rl.utils.utils import reduce_gradients
+
+
+class PopulationPPO(PPO):
+    """PPO for a population of independent agents trained in one process.
+
+    The agents are the members of an `ActorCriticPopulation` and the environments are partitioned into contiguous
+    blocks, one per member. Every member is updated exactly as by `PPO` on its own environments: the advantages are
+    normalized, the gradients are clipped and the learning rate is adapted to the KL divergence per member.
+
+    The learning rate, the entropy coefficient and the desired KL divergence can be given per member as sequences
+    to train hyperparameter variants.
+    """
+
+    actor_critic: ActorCriticPopulation
+
+    def __init__(self, actor_critic, learning_rate=1e-3, entropy_coef=0.0, desired_kl=0.01, **kwargs):
+        if kwargs.get("target_kl_stop") is not None:
+            raise ValueError("KL early stopping is not supported for populations, the members would stop apart.")
+        if kwargs.get("num_micro_batches", 1) != 1:
+            raise ValueError("Micro-batching is not supported for populations.")
+        self.population_size = actor_critic.population_size
+        learning_rates = self._per_member(learning_rate, kwargs.get("device", "cpu"))
+        super().__init__(
+            actor_critic,
+            learning_rate=learning_rates.mean().item(),
+            entropy_coef=entropy_coef,
+            desired_kl=desired_kl,
+            **kwargs,
+        )
+        self.entropy_coef = self._per_member(entropy_coef, self.device)
+        if self.desired_kl is not None:
+            self.desired_kl = self._per_member(desired_kl, self.device)
+        # every stacked parameter holds the parameters of all members, the optimizer adapts them independently
+        self.optimizer = PopulationAdam(self.actor_critic.parameters(), lr=learning_rates)
+
+    @property
+    def learning_rates(self):
+        """Learning rates of the members. Shape: (population_size,)"""
+        return self.optimizer.param_groups[0]["lr"]
+
+    def init_storage(self, num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape):
+        if num_envs % self.population_size != 0:
+            raise ValueError(
+                f"The number of environments ({num_envs}) is not divisible by the population size"
+                f" ({self.population_size})."
+            )
+        super().init_storage(num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape)
+
+    def compute_returns(self, last_critic_obs):
+        super().compute_returns(last_critic_obs)
+        # normalize the advantages per member
+        advantages = self.storage.returns - self.storage.values
+        advantages = advantages.view(advantages.shape[0], self.population_size, -1)
+        mean = advantages.mean(dim=(0, 2), keepdim=True)
+        std = advantages.std(dim=(0, 2), keepdim=True)
+        self.storage.advantages = ((advantages - mean) / (std + 1e-8)).view_as(self.storage.values)
+
+    def update(self):
+        mean_value_loss = torch.zeros(self.population_size, device=self.device)
+        mean_surrogate_loss = torch.zeros(self.population_size, device=self.device)
+        generator = self.storage.population_mini_batch_generator(
+            self.population_size, self.num_mini_batches, self.num_learning_epochs
+        )
+        for (
+            obs_batch,
+            critic_obs_batch,
+            actions_batch,
+            target_values_batch,
+            advantages_batch,
+            returns_batch,
+            old_actions_log_prob_batch,
+            old_mu_batch,
+            old_sigma_batch,
+            hid_states_batch,
+            masks_batch,
+        ) in generator:
+            with self._autocast():
+                self.actor_critic.update_distribution(obs_batch)
+                value_batch = self.actor_critic.evaluate(critic_obs_batch)
+            value_batch = value_batch.float()
+            actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
+            mu_batch = self.actor_critic.action_mean.float()
+            sigma_batch = self.actor_critic.action_std
+            entropy_batch = self.actor_critic.entropy
+
+            # KL
+            if self.desired_kl is not None and self.schedule == "adaptive":
+                with torch.inference_mode():
+                    kl = torch.sum(
+                        torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
+                        + (torch.square(old_sigma_batch) + torch.square(old_mu_batch - mu_batch))
+                        / (2.0 * torch.square(sigma_batch))
+                        - 0.5,
+                        axis=-1,
+                    )
+                    kl_mean = self._member_mean(kl)
+                    if self.distributed:
+                        torch.distributed.all_reduce(kl_mean)
+                        kl_mean /= self.world_size
+
+                    # the schedule is elementwise, every member adapts its learning rate to its own KL
+                    self.learning_rates.copy_(self._adapt_learning_rate(self.learning_rates, kl_mean))
+
+            # Surrogate loss
+            ratio = torch.exp(actions_log_prob_batch - old_actions_log_prob_batch.squeeze(-1))
+            surrogate = -advantages_batch.squeeze(-1) * ratio
+            surrogate_clipped = -advantages_batch.squeeze(-1) * torch.clamp(
+                ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
+            )
+            surrogate_loss = self._member_mean(torch.max(surrogate, surrogate_clipped))
+
+            # Value function loss
+            if self.use_clipped_value_loss:
+                value_clipped = target_values_batch + (value_batch - target_values_batch).clamp(
+                    -self.clip_param, self.clip_param
+                )
+                value_losses = (value_batch - returns_batch).pow(2)
+                value_losses_clipped = (value_clipped - returns_batch).pow(2)
+                value_loss = self._member_mean(torch.max(value_losses, value_losses_clipped))
+            else:
+                value_loss = self._member_mean((returns_batch - value_batch).pow(2))
+
+            # the members are independent, the sum keeps the gradient of every member unscaled
+            loss = surrogate_loss + self.value_loss_coef * value_loss - self.entropy_coef * self._member_mean(
+                entropy_batch
+            )
+
+            # Gradient step
+            self.optimizer.zero_grad()
+            loss.sum().backward()
+            if self.distributed:
+                reduce_gradients(self.actor_critic.parameters())
+            self._clip_grad_norm_per_member(self.max_grad_norm)
+            self.optimizer.step()
+
+            mean_value_loss += value_loss.detach()
+            mean_surrogate_loss += surrogate_loss.detach()
+
+        num_updates = self.num_learning_epochs * self.num_mini_batches
+        mean_value_loss /= num_updates
+        mean_surrogate_loss /= num_updates
+        self.storage.clear()
+        self.learning_rate = self.learning_rates.mean().item()
+
+        return mean_value_loss.mean().item(), mean_surrogate_loss.mean().item()
+
+    """
+    Helper functions.
+    """
+
+    def _per_member(self, value, device):
+        """Returns a hyperparameter given as a scalar or a sequence as a tensor with one entry per member."""
+        value = torch.as_tensor(value, dtype=torch.float, device=device)
+        if value.dim() == 0:
+            value = value.repeat(self.population_size)
+        if value.shape != (self.population_size,):
+            raise ValueError(f"Expected a scalar or {self.population_size} values, got {value.tolist()}.")
+        return value
+
+    def _member_mean(self, x):
+        """Mean over the samples of every member of a member-major batch."""
+        return x.reshape(self.population_size, -1).mean(dim=1)
+
+    def _clip_grad_norm_per_member(self, max_norm):
+        grads = [param.grad for param in self.actor_critic.parameters() if param.grad is not None]
+        total_norm = torch.stack([grad.flatten(1).pow(2).sum(dim=1) for grad in grads]).sum(dim=0).sqrt()
+        clip_coef = torch.clamp(max_norm / (total_norm + 1e-6), max=1.0)
+        for grad in grads:
+            grad.mul_(clip_coef.view(-1, *([1] * (grad.dim() - 1))))
+
+
+class PopulationAdam(optim.Optimizer):
+    """Adam for stacked parameters with one learning rate per member (leading dimension).
+
+    Adam adapts every element independently, so this is identical to one `torch.optim.Adam` per member.
+    """
+
+    def __init__(self, params, lr, betas=(0.9, 0.999), eps=1e-8):
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for param in group["params"]:
+                if param.grad is None:
+                    continue
+                state = self.state[param]
+                if len(state) == 0:
+                    state["step"] = 0
+                    state["exp_avg"] = torch.zeros_like(param)
+                    state["exp_avg_sq"] = torch.zeros_like(param)
+                state["step"] += 1
+                exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+                exp_avg.lerp_(param.grad, 1.0 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(param.grad, param.grad, value=1.0 - beta2)
+                bias_correction1 = 1.0 - beta1 ** state["step"]
+                bias_correction2 = 1.0 - beta2 ** state["step"]
+                denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group["eps"])
+                step_size = (group["lr"] / bias_correction1).view(-1, *([1] * (param.dim() - 1)))
+                param.sub_(step_size * exp_avg / denom)
+        return loss
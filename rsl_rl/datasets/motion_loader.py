@@ -6,19 +6,53 @@ from typing import List
 
 import torch
 import numpy as np
-from pybullet_utils import transformations
 
 from rsl_rl.utils import utils
-from rsl_rl.datasets import pose3d
-from rsl_rl.datasets import motion_util
-import yaml
-import matplotlib.pyplot as plt
 
-constants_path = "source/constants.yaml"
-with open(constants_path, "r") as file:
-    constants = yaml.safe_load(file)
-JOINT_UNITREE_TO_ISAAC_LAB_MAPPING = constants["JOINT_UNITREE_TO_ISAAC_LAB_MAPPING"]
-QUAT_PYBULLET_TO_ISAAC_LAB_MAPPING = constants["QUAT_PYBULLET_TO_ISAAC_LAB_MAPPING"]
+DEFAULT_CONSTANTS_PATH = "source/constants.yaml"
+
+
+def load_joint_mappings(constants_path=DEFAULT_CONSTANTS_PATH):
+    """Reads the joint and quaternion orderings from pybullet to isaac lab from a yaml file.
+
+    Returns:
+        Tuple[List[int], List[int]]: The joint mapping and the quaternion mapping.
+    """
+    import yaml
+
+    with open(constants_path, "r") as file:
+        constants = yaml.safe_load(file)
+    return constants["JOINT_UNITREE_TO_ISAAC_LAB_MAPPING"], constants["QUAT_PYBULLET_TO_ISAAC_LAB_MAPPING"]
+
+
+def build_alias_table(probs):
+    """Builds the Walker alias table for sampling from a discrete distribution in O(1) per sample.
+
+    Sampling draws a uniform bucket `i` and keeps it with probability `prob[i]`, otherwise it returns `alias[i]`.
+
+    Args:
+        probs (np.ndarray): Normalized probabilities of the outcomes.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The acceptance probabilities and the alias of each bucket.
+    """
+    num_outcomes = len(probs)
+    scaled_probs = np.asarray(probs, dtype=np.float64) * num_outcomes
+    prob = np.ones(num_outcomes, dtype=np.float64)
+    alias = np.arange(num_outcomes, dtype=np.int64)
+    small = [i for i in range(num_outcomes) if scaled_probs[i] < 1.0]
+    large = [i for i in range(num_outcomes) if scaled_probs[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled_probs[s]
+        alias[s] = l
+        scaled_probs[l] = scaled_probs[l] + scaled_probs[s] - 1.0
+        if scaled_probs[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    # the remaining buckets are full up to numerical errors
+    return prob, alias
 
 
 # from original gym amp implementation:
@@ -59,49 +93,6 @@ class AMPLoader:
     TAR_TOE_VEL_LOCAL_START_IDX = JOINT_VEL_END_IDX
     TAR_TOE_VEL_LOCAL_END_IDX = TAR_TOE_VEL_LOCAL_START_IDX + TAR_TOE_VEL_LOCAL_SIZE
 
-    print(
-        "ROOT_POS_START_IDX:", ROOT_POS_START_IDX, "ROOT_POS_END_IDX:", ROOT_POS_END_IDX
-    )
-    print(
-        "ROOT_ROT_START_IDX:", ROOT_ROT_START_IDX, "ROOT_ROT_END_IDX:", ROOT_ROT_END_IDX
-    )
-    print(
-        "JOINT_POSE_START_IDX:",
-        JOINT_POSE_START_IDX,
-        "JOINT_POSE_END_IDX:",
-        JOINT_POSE_END_IDX,
-    )
-    print(
-        "TAR_TOE_POS_LOCAL_START_IDX:",
-        TAR_TOE_POS_LOCAL_START_IDX,
-        "TAR_TOE_POS_LOCAL_END_IDX:",
-        TAR_TOE_POS_LOCAL_END_IDX,
-    )
-    print(
-        "LINEAR_VEL_START_IDX:",
-        LINEAR_VEL_START_IDX,
-        "LINEAR_VEL_END_IDX:",
-        LINEAR_VEL_END_IDX,
-    )
-    print(
-        "ANGULAR_VEL_START_IDX:",
-        ANGULAR_VEL_START_IDX,
-        "ANGULAR_VEL_END_IDX:",
-        ANGULAR_VEL_END_IDX,
-    )
-    print(
-        "JOINT_VEL_START_IDX:",
-        JOINT_VEL_START_IDX,
-        "JOINT_VEL_END_IDX:",
-        JOINT_VEL_END_IDX,
-    )
-    print(
-        "TAR_TOE_VEL_LOCAL_START_IDX:",
-        TAR_TOE_VEL_LOCAL_START_IDX,
-        "TAR_TOE_VEL_LOCAL_END_IDX:",
-        TAR_TOE_VEL_LOCAL_END_IDX,
-    )
-    
     # ROOT_POS_START_IDX: 0 ROOT_POS_END_IDX: 3
     # ROOT_ROT_START_IDX: 3 ROOT_ROT_END_IDX: 7
     # JOINT_POSE_START_IDX: 7 JOINT_POSE_END_IDX: 19
@@ -118,35 +109,58 @@ class AMPLoader:
             data_dir='',
             preload_transitions=False,
             num_preload_transitions=1000000,
-            motion_files=glob.glob('datasets/motion_files2/*'),
-            amp_data: List[str] =["JOINT_POS", "JOINT_VEL"] # order must correspond to data returned by get_amp_observations() of the environment
+            motion_files=None,
+            amp_data: List[str] =["JOINT_POS", "JOINT_VEL"], # order must correspond to data returned by get_amp_observations() of the environment
+            joint_mapping=None,
+            quat_mapping=None,
+            constants_path=DEFAULT_CONSTANTS_PATH,
+            seed=None,
             ):
         """Expert dataset provides AMP observations from Dog mocap dataset.
 
         time_between_frames: Amount of time in seconds between transition.
+        joint_mapping, quat_mapping: Reordering of joints and quaternion from pybullet to isaac lab. If not given,
+            they are read from `constants_path`.
+        seed: Seed of the loader's random generator. If not given, the generator is seeded non-deterministically.
         """
+        # deferred imports, these are only needed for loading the motion files
+        from rsl_rl.datasets import motion_util, pose3d
+
+        if motion_files is None:
+            motion_files = glob.glob('datasets/motion_files2/*')
+        if joint_mapping is None or quat_mapping is None:
+            loaded_joint_mapping, loaded_quat_mapping = load_joint_mappings(constants_path)
+            joint_mapping = loaded_joint_mapping if joint_mapping is None else joint_mapping
+            quat_mapping = loaded_quat_mapping if quat_mapping is None else quat_mapping
+        self.joint_mapping = joint_mapping
+        self.quat_mapping = quat_mapping
 
-        self.amp_data_indices = self.get_amp_data_indices(amp_data)
+        self.amp_data_indices = torch.tensor(self.get_amp_data_indices(amp_data), dtype=torch.long, device=device)
 
         self.device = device
         self.time_between_frames = time_between_frames
+        # dedicated generator, sampling does not depend on (or advance) the global random state
+        self.generator = torch.Generator(device=device)
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        else:
+            self.generator.seed()
 
         # Values to store for each trajectory.
-        self.trajectories = []
-        self.trajectories_full = []
         self.trajectory_names = []
         self.trajectory_idxs = []
         self.trajectory_lens = []  # Traj length in seconds.
         self.trajectory_weights = []
         self.trajectory_frame_durations = []
         self.trajectory_num_frames = []
+        motion_frames = []
 
         for i, motion_file in enumerate(motion_files):
             self.trajectory_names.append(motion_file.split('.')[0])
             with open(motion_file, "r") as f:
                 motion_json = json.load(f)
                 motion_data = np.array(motion_json["Frames"])
-                motion_data = self.reorder_from_pybullet_to_isaac_lab(motion_data)
+                motion_data = self.reorder_from_pybullet_to_isaac_lab(motion_data, self.joint_mapping, self.quat_mapping)
 
                 # Normalize and standardize quaternions.
                 for f_i in range(motion_data.shape[0]):
@@ -159,14 +173,7 @@ class AMPLoader:
                             (AMPLoader.POS_SIZE +
                              AMPLoader.ROT_SIZE)] = root_rot
 
-                self.trajectories.append(torch.tensor(
-                    motion_data[
-                        :,
-                        self.amp_data_indices
-                    ], dtype=torch.float32, device=device))
-                self.trajectories_full.append(torch.tensor(
-                        motion_data[:, :AMPLoader.JOINT_VEL_END_IDX],
-                        dtype=torch.float32, device=device))
+                motion_frames.append(motion_data)
                 self.trajectory_idxs.append(i)
                 self.trajectory_weights.append(
                     float(motion_json["MotionWeight"]))
@@ -180,22 +187,33 @@ class AMPLoader:
 
         # Trajectory weights are used to sample some trajectories more than others.
         self.trajectory_weights = np.array(self.trajectory_weights) / np.sum(self.trajectory_weights)
-        self.trajectory_frame_durations = np.array(self.trajectory_frame_durations)
-        self.trajectory_lens = np.array(self.trajectory_lens)
-        self.trajectory_num_frames = np.array(self.trajectory_num_frames)
-
-        # Preload transitions.
+        alias_prob, alias_idx = build_alias_table(self.trajectory_weights)
+        self.trajectory_alias_prob = torch.tensor(alias_prob, dtype=torch.float32, device=device)
+        self.trajectory_alias_idx = torch.tensor(alias_idx, dtype=torch.long, device=device)
+        self.trajectory_frame_durations = torch.tensor(self.trajectory_frame_durations, dtype=torch.float32, device=device)
+        self.trajectory_lens = torch.tensor(self.trajectory_lens, dtype=torch.float32, device=device)
+        self.trajectory_num_frames = torch.tensor(self.trajectory_num_frames, dtype=torch.float32, device=device)
+
+        # All clips are concatenated into a single frame store, the per-trajectory tensors are views into it.
+        # AMP features are gathered from the store with `amp_data_indices` when frames are sampled.
+        self.motion_frames = torch.tensor(np.concatenate(motion_frames, axis=0), dtype=torch.float32, device=device)
+        self.trajectory_frame_starts = torch.zeros(self.num_motions, dtype=torch.long, device=device)
+        self.trajectory_frame_starts[1:] = torch.cumsum(self.trajectory_num_frames[:-1].long(), dim=0)
+        self.all_trajectories_full = self.motion_frames[:, :AMPLoader.JOINT_VEL_END_IDX]
+        self.trajectories_full = [self.get_trajectory(traj_idx) for traj_idx in self.trajectory_idxs]
+
+        # Preload transitions. Only the AMP features are kept, full frames are blended from the frame store at the
+        # preloaded sample times when requested, instead of keeping two full copies of every transition.
         self.preload_transitions = preload_transitions
         if self.preload_transitions:
             print(f'Preloading {num_preload_transitions} transitions')
-            traj_idxs = self.weighted_traj_idx_sample_batch(num_preload_transitions)
-            times = self.traj_time_sample_batch(traj_idxs)
-            self.preloaded_s = self.get_full_frame_at_time_batch(traj_idxs, times)
-            self.preloaded_s_next = self.get_full_frame_at_time_batch(traj_idxs, times + self.time_between_frames)
+            self.preloaded_traj_idxs = self.weighted_traj_idx_sample_batch(num_preload_transitions)
+            self.preloaded_times = self.traj_time_sample_batch(self.preloaded_traj_idxs)
+            self.preloaded_s = self.get_frame_at_time_batch(self.preloaded_traj_idxs, self.preloaded_times)
+            self.preloaded_s_next = self.get_frame_at_time_batch(
+                self.preloaded_traj_idxs, self.preloaded_times + self.time_between_frames)
             print(f'Finished preloading')
 
-        self.all_trajectories_full = torch.vstack(self.trajectories_full)
-
     def get_amp_data_indices(self, amp_data):
         # string to index mapping
         index_map = {
@@ -231,18 +249,18 @@ class AMPLoader:
         return amp_data_indices
 
     @staticmethod
-    def reorder_from_pybullet_to_isaac_lab(motion_data):
+    def reorder_from_pybullet_to_isaac_lab(motion_data, joint_mapping, quat_mapping):
         """Joint order is different from isaac lab to isaac gym. This function arranges joints order from pybullet to isaac lab order."""
         
         root_pos = AMPLoader.get_root_pos_batch(motion_data)
-        root_rot = AMPLoader.get_root_rot_batch(motion_data)[:,QUAT_PYBULLET_TO_ISAAC_LAB_MAPPING]
+        root_rot = AMPLoader.get_root_rot_batch(motion_data)[:,quat_mapping]
         
         lin_vel = AMPLoader.get_linear_vel_batch(motion_data)
         ang_vel = AMPLoader.get_angular_vel_batch(motion_data)
 
-        joint_pos = AMPLoader.get_joint_pose_batch(motion_data)[:, JOINT_UNITREE_TO_ISAAC_LAB_MAPPING]
+        joint_pos = AMPLoader.get_joint_pose_batch(motion_data)[:, joint_mapping]
         
-        joint_vel =  AMPLoader.get_joint_vel_batch(motion_data)[:,JOINT_UNITREE_TO_ISAAC_LAB_MAPPING]
+        joint_vel =  AMPLoader.get_joint_vel_batch(motion_data)[:,joint_mapping]
         
         # TODO check if foot pos and vel get the correct order!
         fv_fr, fv_fl, fv_rr, fv_rl = np.split(
@@ -259,93 +277,87 @@ class AMPLoader:
         
     def weighted_traj_idx_sample(self):
         """Get traj idx via weighted sampling."""
-        return np.random.choice(
-            self.trajectory_idxs, p=self.trajectory_weights)
+        return int(self.weighted_traj_idx_sample_batch(1).item())
 
     def weighted_traj_idx_sample_batch(self, size):
-        """Batch sample traj idxs."""
-        return np.random.choice(
-            self.trajectory_idxs, size=size, p=self.trajectory_weights,
-            replace=True)
+        """Batch sample traj idxs (alias method)."""
+        buckets = torch.randint(
+            self.num_motions, (size,), device=self.device, generator=self.generator)
+        accept = torch.rand(size, device=self.device, generator=self.generator) < self.trajectory_alias_prob[buckets]
+        return torch.where(accept, buckets, self.trajectory_alias_idx[buckets])
 
     def traj_time_sample(self, traj_idx):
         """Sample random time for traj."""
-        subst = self.time_between_frames + self.trajectory_frame_durations[traj_idx]
-        return max(
-            0, (self.trajectory_lens[traj_idx] * np.random.uniform() - subst))
+        return float(self.traj_time_sample_batch(torch.tensor([traj_idx], device=self.device)).item())
 
     def traj_time_sample_batch(self, traj_idxs):
         """Sample random time for multiple trajectories."""
         subst = self.time_between_frames + self.trajectory_frame_durations[traj_idxs]
-        time_samples = self.trajectory_lens[traj_idxs] * np.random.uniform(size=len(traj_idxs)) - subst
-        return np.maximum(np.zeros_like(time_samples), time_samples)
+        uniform = torch.rand(len(traj_idxs), device=self.device, generator=self.generator)
+        time_samples = self.trajectory_lens[traj_idxs] * uniform - subst
+        return torch.clamp(time_samples, min=0.0)
 
     def slerp(self, val0, val1, blend):
         return (1.0 - blend) * val0 + blend * val1
 
     def get_trajectory(self, traj_idx):
-        """Returns trajectory of AMP observations."""
-        return self.trajectories_full[traj_idx]
+        """Returns the full frames of the trajectory, a view into the frame store."""
+        start = int(self.trajectory_frame_starts[traj_idx])
+        end = start + int(self.trajectory_num_frames[traj_idx])
+        return self.all_trajectories_full[start:end]
+
+    def get_frame_rows_batch(self, traj_idxs, times):
+        """Returns the rows of the frame store enclosing the given times and the blend between them."""
+        p = times / self.trajectory_lens[traj_idxs]
+        n = self.trajectory_num_frames[traj_idxs]
+        idx_low, idx_high = torch.floor(p * n), torch.ceil(p * n)
+        frame_starts = self.trajectory_frame_starts[traj_idxs]
+        rows_low = frame_starts + idx_low.long()
+        rows_high = frame_starts + idx_high.long()
+        blend = (p * n - idx_low).unsqueeze(-1)
+        return rows_low, rows_high, blend
 
     def get_frame_at_time(self, traj_idx, time):
         """Returns frame for the given trajectory at the specified time."""
-        p = float(time) / self.trajectory_lens[traj_idx]
-        n = self.trajectories[traj_idx].shape[0]
-        idx_low, idx_high = int(np.floor(p * n)), int(np.ceil(p * n))
-        frame_start = self.trajectories[traj_idx][idx_low]
-        frame_end = self.trajectories[traj_idx][idx_high]
-        blend = p * n - idx_low
-        return self.slerp(frame_start, frame_end, blend)
+        traj_idxs = torch.tensor([traj_idx], device=self.device)
+        times = torch.tensor([float(time)], device=self.device)
+        return self.get_frame_at_time_batch(traj_idxs, times).squeeze(0)
 
     def get_frame_at_time_batch(self, traj_idxs, times):
         """Returns frame for the given trajectory at the specified time."""
-        p = times / self.trajectory_lens[traj_idxs]
-        n = self.trajectory_num_frames[traj_idxs]
-        idx_low, idx_high = np.floor(p * n).astype(np.int_), np.ceil(p * n).astype(np.int_)
-        all_frame_starts = torch.zeros(len(traj_idxs), self.observation_dim, device=self.device)
-        all_frame_ends = torch.zeros(len(traj_idxs), self.observation_dim, device=self.device)
-        for traj_idx in set(traj_idxs):
-            trajectory = self.trajectories[traj_idx]
-            traj_mask = traj_idxs == traj_idx
-            all_frame_starts[traj_mask] = trajectory[idx_low[traj_mask]]
-            all_frame_ends[traj_mask] = trajectory[idx_high[traj_mask]]
-        blend = torch.tensor(p * n - idx_low, device=self.device, dtype=torch.float32).unsqueeze(-1)
+        rows_low, rows_high, blend = self.get_frame_rows_batch(traj_idxs, times)
+        # gather only the AMP features of the enclosing frames
+        all_frame_starts = self.motion_frames[rows_low.unsqueeze(-1), self.amp_data_indices]
+        all_frame_ends = self.motion_frames[rows_high.unsqueeze(-1), self.amp_data_indices]
         return self.slerp(all_frame_starts, all_frame_ends, blend)
 
     def get_full_frame_at_time(self, traj_idx, time):
         """Returns full frame for the given trajectory at the specified time."""
-        p = float(time) / self.trajectory_lens[traj_idx]
-        n = self.trajectories_full[traj_idx].shape[0]
+        p = float(time) / float(self.trajectory_lens[traj_idx])
+        trajectory = self.get_trajectory(traj_idx)
+        n = trajectory.shape[0]
         idx_low, idx_high = int(np.floor(p * n)), int(np.ceil(p * n))
-        frame_start = self.trajectories_full[traj_idx][idx_low]
-        frame_end = self.trajectories_full[traj_idx][idx_high]
+        frame_start = trajectory[idx_low]
+        frame_end = trajectory[idx_high]
         blend = p * n - idx_low
         return self.blend_frame_pose(frame_start, frame_end, blend)
 
     def get_full_frame_at_time_batch(self, traj_idxs, times):
-        p = times / self.trajectory_lens[traj_idxs]
-        n = self.trajectory_num_frames[traj_idxs]
-        idx_low, idx_high = np.floor(p * n).astype(np.int_), np.ceil(p * n).astype(np.int_)
-        all_frame_pos_starts = torch.zeros(len(traj_idxs), AMPLoader.POS_SIZE, device=self.device)
-        all_frame_pos_ends = torch.zeros(len(traj_idxs), AMPLoader.POS_SIZE, device=self.device)
-        all_frame_rot_starts = torch.zeros(len(traj_idxs), AMPLoader.ROT_SIZE, device=self.device)
-        all_frame_rot_ends = torch.zeros(len(traj_idxs), AMPLoader.ROT_SIZE, device=self.device)
-        all_frame_amp_starts = torch.zeros(len(traj_idxs), AMPLoader.JOINT_VEL_END_IDX - AMPLoader.JOINT_POSE_START_IDX, device=self.device)
-        all_frame_amp_ends = torch.zeros(len(traj_idxs),  AMPLoader.JOINT_VEL_END_IDX - AMPLoader.JOINT_POSE_START_IDX, device=self.device)
-        for traj_idx in set(traj_idxs):
-            trajectory = self.trajectories_full[traj_idx]
-            traj_mask = traj_idxs == traj_idx
-            all_frame_pos_starts[traj_mask] = AMPLoader.get_root_pos_batch(trajectory[idx_low[traj_mask]])
-            all_frame_pos_ends[traj_mask] = AMPLoader.get_root_pos_batch(trajectory[idx_high[traj_mask]])
-            all_frame_rot_starts[traj_mask] = AMPLoader.get_root_rot_batch(trajectory[idx_low[traj_mask]])
-            all_frame_rot_ends[traj_mask] = AMPLoader.get_root_rot_batch(trajectory[idx_high[traj_mask]])
-            all_frame_amp_starts[traj_mask] = trajectory[idx_low[traj_mask]][:, AMPLoader.JOINT_POSE_START_IDX:AMPLoader.JOINT_VEL_END_IDX]
-            all_frame_amp_ends[traj_mask] = trajectory[idx_high[traj_mask]][:, AMPLoader.JOINT_POSE_START_IDX:AMPLoader.JOINT_VEL_END_IDX]
-        blend = torch.tensor(p * n - idx_low, device=self.device, dtype=torch.float32).unsqueeze(-1)
-
-        pos_blend = self.slerp(all_frame_pos_starts, all_frame_pos_ends, blend)
-        rot_blend = utils.quaternion_slerp(all_frame_rot_starts, all_frame_rot_ends, blend)
-        amp_blend = self.slerp(all_frame_amp_starts, all_frame_amp_ends, blend)
+        rows_low, rows_high, blend = self.get_frame_rows_batch(traj_idxs, times)
+        all_frame_starts = self.all_trajectories_full[rows_low]
+        all_frame_ends = self.all_trajectories_full[rows_high]
+
+        pos_blend = self.slerp(
+            AMPLoader.get_root_pos_batch(all_frame_starts), AMPLoader.get_root_pos_batch(all_frame_ends), blend
+        )
+        amp_blend = self.slerp(
+            all_frame_starts[:, AMPLoader.JOINT_POSE_START_IDX:AMPLoader.JOINT_VEL_END_IDX],
+            all_frame_ends[:, AMPLoader.JOINT_POSE_START_IDX:AMPLoader.JOINT_VEL_END_IDX],
+            blend,
+        )
+        rot_blend = utils.quaternion_slerp(
+            AMPLoader.get_root_rot_batch(all_frame_starts), AMPLoader.get_root_rot_batch(all_frame_ends), blend
+        )
         return torch.cat([pos_blend, rot_blend, amp_blend], dim=-1)
 
     def get_frame(self):
@@ -361,14 +373,14 @@ class AMPLoader:
         return self.get_full_frame_at_time(traj_idx, sampled_time)
 
     def get_full_frame_batch(self, num_frames):
+        """Returns random full frames, drawn from the preloaded transitions if they are preloaded."""
         if self.preload_transitions:
-            idxs = np.random.choice(
-                self.preloaded_s.shape[0], size=num_frames)
-            return self.preloaded_s[idxs]
-        else:
-            traj_idxs = self.weighted_traj_idx_sample_batch(num_frames)
-            times = self.traj_time_sample_batch(traj_idxs)
-            return self.get_full_frame_at_time_batch(traj_idxs, times)
+            idxs = torch.randint(
+                self.preloaded_times.shape[0], (num_frames,), device=self.device, generator=self.generator)
+            return self.get_full_frame_at_time_batch(self.preloaded_traj_idxs[idxs], self.preloaded_times[idxs])
+        traj_idxs = self.weighted_traj_idx_sample_batch(num_frames)
+        times = self.traj_time_sample_batch(traj_idxs)
+        return self.get_full_frame_at_time_batch(traj_idxs, times)
 
     def blend_frame_pose(self, frame0, frame1, blend):
         """Linearly interpolate between two frames, including orientation.
@@ -381,6 +393,9 @@ class AMPLoader:
         Returns:
             An interpolation of the two frames.
         """
+        from pybullet_utils import transformations
+
+        from rsl_rl.datasets import motion_util
 
         root_pos0, root_pos1 = AMPLoader.get_root_pos(frame0), AMPLoader.get_root_pos(frame1)
         root_rot0, root_rot1 = AMPLoader.get_root_rot(frame0), AMPLoader.get_root_rot(frame1)
@@ -410,36 +425,34 @@ class AMPLoader:
         """Generates a batch of AMP transitions."""
         for _ in range(num_mini_batch):
             if self.preload_transitions:
-                idxs = np.random.choice(
-                    self.preloaded_s.shape[0], size=mini_batch_size)
+                idxs = torch.randint(
+                    self.preloaded_s.shape[0], (mini_batch_size,), device=self.device, generator=self.generator)
                 s = self.preloaded_s[idxs]
-                s = s [:, self.amp_data_indices]
                 s_next = self.preloaded_s_next[idxs]
-                s_next = s_next[:, self.amp_data_indices]
             else:
-                raise NotImplementedError("I think using this is broken.")
-                s, s_next = [], []
                 traj_idxs = self.weighted_traj_idx_sample_batch(mini_batch_size)
                 times = self.traj_time_sample_batch(traj_idxs)
-                for traj_idx, frame_time in zip(traj_idxs, times):
-                    s.append(self.get_frame_at_time(traj_idx, frame_time))
-                    s_next.append(
-                        self.get_frame_at_time(
-                            traj_idx, frame_time + self.time_between_frames))
-
-                s = torch.vstack(s)
-                s_next = torch.vstack(s_next)
+                s = self.get_frame_at_time_batch(traj_idxs, times)
+                s_next = self.get_frame_at_time_batch(traj_idxs, times + self.time_between_frames)
             yield s, s_next
 
     @property
     def observation_dim(self):
         """Size of AMP observations."""
-        return self.trajectories[0].shape[1]
+        return len(self.amp_data_indices)
 
     @property
     def num_motions(self):
         return len(self.trajectory_names)
 
+    @property
+    def trajectories(self):
+        """AMP observations of every trajectory, gathered from the frame store on access."""
+        return [
+            self.motion_frames[start:start + int(num_frames)][:, self.amp_data_indices]
+            for start, num_frames in zip(self.trajectory_frame_starts.tolist(), self.trajectory_num_frames.tolist())
+        ]
+
     def get_root_pos(pose):
         return pose[AMPLoader.ROOT_POS_START_IDX:AMPLoader.ROOT_POS_END_IDX]
 
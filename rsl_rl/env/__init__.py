@@ -3,6 +3,28 @@
 
 """Submodule defining the environment definitions."""
 
+from .reference_envs import (
+    AMPEnv,
+    AMPEnvCfg,
+    CartPoleEnv,
+    CartPoleEnvCfg,
+    PointMassEnv,
+    PointMassEnvCfg,
+    ReferenceEnv,
+    ReferenceEnvCfg,
+)
+from .subproc_vec_env import SubprocVecEnv
 from .vec_env import VecEnv
 
-__all__ = ["VecEnv"]
+__all__ = [
+    "VecEnv",
+    "SubprocVecEnv",
+    "ReferenceEnv",
+    "ReferenceEnvCfg",
+    "PointMassEnv",
+    "PointMassEnvCfg",
+    "CartPoleEnv",
+    "CartPoleEnvCfg",
+    "AMPEnv",
+    "AMPEnvCfg",
+]
@@ -0,0 +1,344 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Batched reference environments in pure PyTorch for testing and benchmarking without a simulator."""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from rsl_rl.env.vec_env import VecEnv
+
+
+@dataclass
+class ReferenceEnvCfg:
+    """Configuration shared by the reference environments."""
+
+    num_envs: int = 4096
+    """Number of environments."""
+    num_obs_padding: int = 0
+    """Number of noise observations appended to the task observations, tunes the observation size."""
+    max_episode_length: int = 500
+    """Number of steps after which the episodes time out."""
+    decimation: int = 1
+    """Number of integration substeps per step, scales the computational cost of a step."""
+    step_latency: float = 0.0
+    """Fixed wall-clock latency per step in seconds, emulates an external simulator."""
+    dt: float = 0.02
+    """Integration time step in seconds."""
+    seed: int = 0
+    """Seed of the random generator of the environment."""
+
+
+class ReferenceEnv(VecEnv):
+    """Base class of the reference environments.
+
+    The environments are reset automatically when they terminate or time out, the returned observations are then the
+    first ones of the new episodes. The time outs of episodes that did not terminate are reported in
+    ``extras["time_outs"]`` for the bootstrapping in `PPO.process_env_step`.
+
+    With a ``step_latency``, `step_async` runs the step in a background thread like an external simulator would, so
+    the latency overlaps with the work of the caller until `step_wait`.
+    """
+
+    def __init__(self, cfg: ReferenceEnvCfg, num_task_obs: int, num_actions: int, device="cpu"):
+        self.cfg = cfg
+        self.device = device
+        self.num_envs = cfg.num_envs
+        self.num_obs = num_task_obs + cfg.num_obs_padding
+        self.num_privileged_obs = None
+        self.num_actions = num_actions
+        self.max_episode_length = cfg.max_episode_length
+        self.step_dt = cfg.dt * cfg.decimation
+        self.generator = torch.Generator(device=device)
+        self.generator.manual_seed(cfg.seed)
+
+        self.obs_buf = torch.zeros(self.num_envs, self.num_obs, device=device)
+        self.rew_buf = torch.zeros(self.num_envs, device=device)
+        self.reset_buf = torch.zeros(self.num_envs, dtype=torch.long, device=device)
+        self.episode_length_buf = torch.zeros(self.num_envs, dtype=torch.long, device=device)
+        self.extras = {"observations": {}}
+        self.reset_env_ids = torch.zeros(0, dtype=torch.long, device=device)
+        self._executor = None
+        self._pending_step = None
+
+    @property
+    def unwrapped(self) -> ReferenceEnv:
+        return self
+
+    def get_observations(self) -> tuple[torch.Tensor, dict]:
+        return self.obs_buf, {"observations": {}}
+
+    def reset(self) -> tuple[torch.Tensor, dict]:
+        self._reset_idx(torch.arange(self.num_envs, device=self.device))
+        self._compute_observations()
+        return self.get_observations()
+
+    def step(self, actions: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, dict]:
+        actions = torch.clamp(actions.to(self.device), -1.0, 1.0)
+        for _ in range(self.cfg.decimation):
+            self._physics_step(actions)
+        if self.cfg.step_latency > 0.0:
+            time.sleep(self.cfg.step_latency)
+        self.episode_length_buf += 1
+
+        self.rew_buf = self._compute_rewards(actions)
+        terminated = self._compute_terminations()
+        time_outs = (self.episode_length_buf >= self.max_episode_length) & ~terminated
+        self.reset_buf = (terminated | time_outs).long()
+        self.reset_env_ids = self.reset_buf.nonzero(as_tuple=False).flatten()
+        self._reset_idx(self.reset_env_ids)
+        self._compute_observations()
+        self.extras = {"observations": {}, "time_outs": time_outs, "log": {}}
+        return self.obs_buf, self.rew_buf, self.reset_buf, self.extras
+
+    def step_async(self, actions: torch.Tensor):
+        if self.cfg.step_latency <= 0.0:
+            # nothing to overlap, the physics would only compete with the caller for the same cores
+            super().step_async(actions)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        self._pending_step = self._executor.submit(self._step_in_thread, actions)
+
+    def step_wait(self) -> tuple:
+        if self._pending_step is None:
+            return super().step_wait()
+        pending_step, self._pending_step = self._pending_step, None
+        return pending_step.result()
+
+    def close(self):
+        """Stops the background thread of `step_async`."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _step_in_thread(self, actions: torch.Tensor) -> tuple:
+        # the autograd mode is thread-local, the step does not record gradients in either thread
+        with torch.no_grad():
+            return self.step(actions)
+
+    def _compute_observations(self):
+        task_obs = self._task_observations()
+        if self.cfg.num_obs_padding > 0:
+            padding = torch.randn(
+                self.num_envs, self.cfg.num_obs_padding, device=self.device, generator=self.generator
+            )
+            task_obs = torch.cat([task_obs, padding], dim=1)
+        self.obs_buf = task_obs
+
+    def _uniform(self, shape, low, high):
+        return low + (high - low) * torch.rand(shape, device=self.device, generator=self.generator)
+
+    """
+    Task-specific operations.
+    """
+
+    def _reset_idx(self, env_ids: torch.Tensor):
+        self.episode_length_buf[env_ids] = 0
+
+    def _physics_step(self, actions: torch.Tensor):
+        raise NotImplementedError
+
+    def _task_observations(self) -> torch.Tensor:
+        raise NotImplementedError
+
+    def _compute_rewards(self, actions: torch.Tensor) -> torch.Tensor:
+        raise NotImplementedError
+
+    def _compute_terminations(self) -> torch.Tensor:
+        return torch.zeros(self.num_envs, dtype=torch.bool, device=self.device)
+
+
+@dataclass
+class PointMassEnvCfg(ReferenceEnvCfg):
+    """Configuration of the point mass environment."""
+
+    num_dims: int = 2
+    """Number of dimensions of the space, equal to the number of actions."""
+    max_episode_length: int = 200
+
+
+class PointMassEnv(ReferenceEnv):
+    """Point mass driven to a random goal by force commands.
+
+    The observations are the offset to the goal and the velocity, the reward is the negative distance to the goal
+    with a small action penalty. The episodes only time out.
+    """
+
+    cfg: PointMassEnvCfg
+
+    def __init__(self, cfg: PointMassEnvCfg | None = None, device="cpu"):
+        cfg = cfg if cfg is not None else PointMassEnvCfg()
+        super().__init__(cfg, num_task_obs=2 * cfg.num_dims, num_actions=cfg.num_dims, device=device)
+        self.pos = torch.zeros(self.num_envs, cfg.num_dims, device=device)
+        self.vel = torch.zeros_like(self.pos)
+        self.goal = torch.zeros_like(self.pos)
+        self.reset()
+
+    def _reset_idx(self, env_ids):
+        super()._reset_idx(env_ids)
+        self.pos[env_ids] = self._uniform((len(env_ids), self.cfg.num_dims), -1.0, 1.0)
+        self.vel[env_ids] = 0.0
+        self.goal[env_ids] = self._uniform((len(env_ids), self.cfg.num_dims), -1.0, 1.0)
+
+    def _physics_step(self, actions):
+        self.vel = 0.95 * self.vel + 5.0 * actions * self.cfg.dt
+        self.pos = self.pos + self.vel * self.cfg.dt
+
+    def _task_observations(self):
+        return torch.cat([self.goal - self.pos, self.vel], dim=1)
+
+    def _compute_rewards(self, actions):
+        return -torch.norm(self.goal - self.pos, dim=1) - 0.01 * torch.sum(torch.square(actions), dim=1)
+
+
+@dataclass
+class CartPoleEnvCfg(ReferenceEnvCfg):
+    """Configuration of the cart-pole environment."""
+
+    max_episode_length: int = 500
+
+
+class CartPoleEnv(ReferenceEnv):
+    """Continuous cart-pole with the dynamics of the classic control task.
+
+    The observations are the cart position and velocity and the pole angle and angular velocity, the reward is 1 per
+    step alive. The episodes terminate when the pole falls over 12 degrees or the cart leaves the track.
+    """
+
+    gravity = 9.8
+    mass_cart = 1.0
+    mass_pole = 0.1
+    pole_half_length = 0.5
+    max_force = 10.0
+
+    def __init__(self, cfg: CartPoleEnvCfg | None = None, device="cpu"):
+        cfg = cfg if cfg is not None else CartPoleEnvCfg()
+        super().__init__(cfg, num_task_obs=4, num_actions=1, device=device)
+        self.state = torch.zeros(self.num_envs, 4, device=device)
+        self.reset()
+
+    def _reset_idx(self, env_ids):
+        super()._reset_idx(env_ids)
+        self.state[env_ids] = self._uniform((len(env_ids), 4), -0.05, 0.05)
+
+    def _physics_step(self, actions):
+        x, x_dot, theta, theta_dot = self.state.unbind(dim=1)
+        force = self.max_force * actions[:, 0]
+        cos_theta, sin_theta = torch.cos(theta), torch.sin(theta)
+        total_mass = self.mass_cart + self.mass_pole
+        pole_mass_length = self.mass_pole * self.pole_half_length
+        temp = (force + pole_mass_length * theta_dot**2 * sin_theta) / total_mass
+        theta_acc = (self.gravity * sin_theta - cos_theta * temp) / (
+            self.pole_half_length * (4.0 / 3.0 - self.mass_pole * cos_theta**2 / total_mass)
+        )
+        x_acc = temp - pole_mass_length * theta_acc * cos_theta / total_mass
+        x_dot = x_dot + self.cfg.dt * x_acc
+        theta_dot = theta_dot + self.cfg.dt * theta_acc
+        self.state = torch.stack([x + self.cfg.dt * x_dot, x_dot, theta + self.cfg.dt * theta_dot, theta_dot], dim=1)
+
+    def _task_observations(self):
+        return self.state
+
+    def _compute_rewards(self, actions):
+        return torch.ones(self.num_envs, device=self.device)
+
+    def _compute_terminations(self):
+        return (torch.abs(self.state[:, 0]) > 2.4) | (torch.abs(self.state[:, 2]) > 12.0 * math.pi / 180.0)
+
+
+@dataclass
+class AMPEnvCfg(ReferenceEnvCfg):
+    """Configuration of the synthetic AMP environment."""
+
+    num_joints: int = 12
+    """Number of actuated joints, the motion files of `AMPLoader` hold 12 joints."""
+    gait_frequency: float = 1.5
+    """Frequency of the reference gait in Hz."""
+    max_episode_length: int = 500
+
+
+class AMPEnv(ReferenceEnv):
+    """Synthetic legged system with the interface expected by `AMPOnPolicyRunner`.
+
+    Every joint is a unit inertia driven by a PD controller towards the default position plus the scaled action. The
+    AMP observations are the joint positions and velocities (the ``["JOINT_POS", "JOINT_VEL"]`` features of
+    `AMPLoader`), `step` additionally returns the ids of the reset environments and their terminal AMP observations.
+    `write_motion_file` writes a sinusoidal reference gait in the motion file format of `AMPLoader`. The task reward
+    keeps the joints close to the default position.
+    """
+
+    stiffness = 40.0
+    damping = 2.0
+    action_scale = 0.5
+
+    def __init__(self, cfg: AMPEnvCfg | None = None, device="cpu"):
+        cfg = cfg if cfg is not None else AMPEnvCfg()
+        super().__init__(cfg, num_task_obs=2 * cfg.num_joints, num_actions=cfg.num_joints, device=device)
+        self.joint_pos = torch.zeros(self.num_envs, cfg.num_joints, device=device)
+        self.joint_vel = torch.zeros_like(self.joint_pos)
+        self.terminal_amp_states = torch.zeros(0, 2 * cfg.num_joints, device=device)
+        joint_limits = torch.tensor([-1.0, 1.0], device=device).repeat(self.num_envs, cfg.num_joints, 1)
+        # mirrors the articulation data of Isaac Lab read by the runner
+        self.scene = {"robot": SimpleNamespace(data=SimpleNamespace(soft_joint_pos_limits=joint_limits))}
+        self.reset()
+
+    def get_amp_observations(self) -> torch.Tensor:
+        return torch.cat([self.joint_pos, self.joint_vel], dim=1)
+
+    def step(
+        self, actions: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, dict, torch.Tensor, torch.Tensor]:
+        obs, rewards, dones, extras = super().step(actions)
+        return obs, rewards, dones, extras, self.reset_env_ids, self.terminal_amp_states
+
+    def write_motion_file(self, path: str, duration: float = 4.0):
+        """Writes a sinusoidal reference gait of the joints in the motion file format of `AMPLoader`.
+
+        The frames hold the pybullet layout of `AMPLoader` with an identity root orientation, load them with
+        ``joint_mapping=list(range(12))`` and ``quat_mapping=[0, 1, 2, 3]``.
+        """
+        from rsl_rl.datasets.motion_loader import AMPLoader
+
+        if self.cfg.num_joints != AMPLoader.JOINT_POS_SIZE:
+            raise ValueError(f"The motion files hold {AMPLoader.JOINT_POS_SIZE} joints, got {self.cfg.num_joints}.")
+        num_frames = int(duration / self.step_dt) + 1
+        times = torch.arange(num_frames).unsqueeze(1) * self.step_dt
+        phases = torch.linspace(0.0, 2.0 * math.pi, self.cfg.num_joints + 1)[:-1]
+        omega = 2.0 * math.pi * self.cfg.gait_frequency
+        frames = torch.zeros(num_frames, AMPLoader.TAR_TOE_VEL_LOCAL_END_IDX)
+        frames[:, AMPLoader.ROOT_ROT_START_IDX + 3] = 1.0
+        frames[:, AMPLoader.JOINT_POSE_START_IDX : AMPLoader.JOINT_POSE_END_IDX] = 0.3 * torch.sin(
+            omega * times + phases
+        )
+        frames[:, AMPLoader.JOINT_VEL_START_IDX : AMPLoader.JOINT_VEL_END_IDX] = 0.3 * omega * torch.cos(
+            omega * times + phases
+        )
+        with open(path, "w") as f:
+            json.dump({"MotionWeight": 1.0, "FrameDuration": self.step_dt, "Frames": frames.tolist()}, f)
+
+    def _reset_idx(self, env_ids):
+        # the AMP observations of the last state of the episodes
+        self.terminal_amp_states = self.get_amp_observations()[env_ids]
+        super()._reset_idx(env_ids)
+        self.joint_pos[env_ids] = self._uniform((len(env_ids), self.cfg.num_joints), -0.1, 0.1)
+        self.joint_vel[env_ids] = 0.0
+
+    def _physics_step(self, actions):
+        targets = self.action_scale * actions
+        joint_acc = self.stiffness * (targets - self.joint_pos) - self.damping * self.joint_vel
+        self.joint_vel = self.joint_vel + self.cfg.dt * joint_acc
+        self.joint_pos = torch.clamp(self.joint_pos + self.cfg.dt * self.joint_vel, -1.0, 1.0)
+
+    def _task_observations(self):
+        return self.get_amp_observations()
+
+    def _compute_rewards(self, actions):
+        return torch.exp(-torch.sum(torch.square(self.joint_pos), dim=1))
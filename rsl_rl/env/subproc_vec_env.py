@@ -0,0 +1,206 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import numpy as np
+import os
+import torch
+import torch.multiprocessing as mp
+import traceback
+from typing import Any, Callable
+
+from rsl_rl.env.vec_env import VecEnv
+
+
+class SubprocVecEnv(VecEnv):
+    """Vectorized environment stepping single-instance Gym-style environments in worker processes.
+
+    The environments follow the Gymnasium API: ``reset()`` returns ``(obs, info)`` and ``step(action)`` returns
+    ``(obs, reward, terminated, truncated, info)``. They are sharded into contiguous blocks across the workers. The
+    actions, observations, rewards, dones and time outs live in shared-memory tensors, the workers read and write
+    them in place and only a short command goes through a pipe per step.
+
+    Environments are reset automatically when their episode ends, the returned observation is then the first one of
+    the new episode. Truncated episodes that did not terminate are reported in ``extras["time_outs"]``, which
+    `PPO.process_env_step` uses to bootstrap their rewards. With ``max_episode_length`` the episodes are also
+    truncated by the adapter.
+
+    The workers are started with a spawn context, the environment constructors must therefore be picklable.
+    """
+
+    def __init__(
+        self,
+        env_fns: list[Callable[[], Any]],
+        num_workers: int | None = None,
+        max_episode_length: int | None = None,
+        device: str = "cpu",
+    ):
+        """
+        Args:
+            env_fns: Constructors of the single-instance environments, one per environment.
+            num_workers: Number of worker processes. Defaults to the number of CPUs.
+            max_episode_length: Length after which the episodes are truncated. Defaults to no limit of the adapter.
+            device: Device of the returned tensors, the simulation runs on the CPU.
+        """
+        self.num_envs = len(env_fns)
+        self.num_workers = min(num_workers or os.cpu_count() or 1, self.num_envs)
+        self.max_episode_length = max_episode_length if max_episode_length is not None else np.iinfo(np.int32).max
+        self.device = device
+        self.num_privileged_obs = None
+        self.cfg = {}
+
+        # the dimensions are read from a probe instance, the workers build their own
+        env = env_fns[0]()
+        obs, _ = env.reset()
+        self.num_obs = np.asarray(obs).size
+        self.num_actions = int(np.prod(env.action_space.shape))
+        env.close()
+
+        # shared buffers, written by the workers in place
+        self.obs_buf = torch.zeros(self.num_envs, self.num_obs).share_memory_()
+        self.rew_buf = torch.zeros(self.num_envs).share_memory_()
+        self.reset_buf = torch.zeros(self.num_envs, dtype=torch.long).share_memory_()
+        self.time_out_buf = torch.zeros(self.num_envs, dtype=torch.bool).share_memory_()
+        self.episode_length_buf = torch.zeros(self.num_envs, dtype=torch.long).share_memory_()
+        self.actions_buf = torch.zeros(self.num_envs, self.num_actions).share_memory_()
+        self.extras = {"observations": {}}
+
+        context = mp.get_context("spawn")
+        bounds = np.linspace(0, self.num_envs, self.num_workers + 1).astype(int)
+        self.pipes = []
+        self.workers = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pipe, worker_pipe = context.Pipe()
+            worker = context.Process(
+                target=_subproc_worker,
+                args=(
+                    env_fns[start:end],
+                    slice(start, end),
+                    worker_pipe,
+                    self.actions_buf,
+                    self.obs_buf,
+                    self.rew_buf,
+                    self.reset_buf,
+                    self.time_out_buf,
+                    self.episode_length_buf,
+                    max_episode_length,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.workers.append(worker)
+        self._waiting = False
+        self.reset()
+
+    def get_observations(self) -> tuple[torch.Tensor, dict]:
+        return self.obs_buf.clone().to(self.device), self.extras
+
+    def reset(self) -> tuple[torch.Tensor, dict]:
+        self._send("reset")
+        self._recv()
+        return self.get_observations()
+
+    def step(self, actions: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, dict]:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions: torch.Tensor):
+        self.actions_buf.copy_(actions.reshape(self.num_envs, self.num_actions))
+        self._send("step")
+
+    def step_wait(self) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, dict]:
+        self._recv()
+        # the buffers are overwritten by the next step
+        self.extras = {"observations": {}, "time_outs": self.time_out_buf.clone().to(self.device)}
+        return (
+            self.obs_buf.clone().to(self.device),
+            self.rew_buf.clone().to(self.device),
+            self.reset_buf.clone().to(self.device),
+            self.extras,
+        )
+
+    def close(self):
+        """Closes the environments and stops the workers, workers that already exited are skipped."""
+        for pipe in self.pipes:
+            try:
+                if self._waiting:
+                    pipe.recv()  # reply to the pending command
+                pipe.send("close")
+            except (EOFError, ConnectionError):
+                pass  # the worker died, its end of the pipe is closed
+            pipe.close()
+        self._waiting = False
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+
+    def _send(self, command: str):
+        for pipe in self.pipes:
+            pipe.send(command)
+        self._waiting = True
+
+    def _recv(self):
+        for pipe in self.pipes:
+            error = pipe.recv()
+            if error is not None:
+                raise RuntimeError(f"A SubprocVecEnv worker failed:\n{error}")
+        self._waiting = False
+
+
+def _subproc_worker(
+    env_fns,
+    env_ids,
+    pipe,
+    actions_buf,
+    obs_buf,
+    rew_buf,
+    reset_buf,
+    time_out_buf,
+    episode_length_buf,
+    max_episode_length,
+):
+    """Steps a block of environments on the commands of the pipe, reporting errors instead of exiting."""
+    torch.set_num_threads(1)
+    envs = [env_fn() for env_fn in env_fns]
+    actions, obs, rewards = actions_buf[env_ids], obs_buf[env_ids], rew_buf[env_ids]
+    dones, time_outs, episode_length = reset_buf[env_ids], time_out_buf[env_ids], episode_length_buf[env_ids]
+
+    def write_obs(i, observation):
+        obs[i] = torch.as_tensor(np.asarray(observation, dtype=np.float32).reshape(-1))
+
+    while True:
+        command = pipe.recv()
+        try:
+            if command == "step":
+                for i, env in enumerate(envs):
+                    observation, reward, terminated, truncated, _ = env.step(actions[i].numpy())
+                    episode_length[i] += 1
+                    if max_episode_length is not None and episode_length[i] >= max_episode_length:
+                        truncated = True
+                    done = terminated or truncated
+                    if done:
+                        observation, _ = env.reset()
+                        episode_length[i] = 0
+                    write_obs(i, observation)
+                    rewards[i] = float(reward)
+                    dones[i] = int(done)
+                    time_outs[i] = bool(truncated and not terminated)
+            elif command == "reset":
+                for i, env in enumerate(envs):
+                    observation, _ = env.reset()
+                    write_obs(i, observation)
+                    episode_length[i] = 0
+                dones.zero_()
+                time_outs.zero_()
+            elif command == "close":
+                for env in envs:
+                    env.close()
+                pipe.close()
+                return
+            pipe.send(None)
+        except Exception:
+            pipe.send(traceback.format_exc())
@@ -83,3 +83,26 @@ class VecEnv(ABC):
                 A tuple containing the observations, rewards, dones and extra information (metrics).
         """
         raise NotImplementedError
+
+    def step_async(self, actions: torch.Tensor):
+        """Start applying input action on the environment.
+
+        Together with step_wait() this lets the runner overlap work that does not depend on the result of the step
+        with the simulation. The default only records the actions and step_wait() calls step(). Environments that
+        simulate asynchronously (e.g. in worker processes or on a separate CUDA stream) override both.
+
+        Args:
+            actions (torch.Tensor): Input actions to apply. Shape: (num_envs, num_actions)
+        """
+        self._async_actions = actions
+
+    def step_wait(self) -> tuple:
+        """Wait for the step started with step_async().
+
+        Returns:
+            tuple: The return values of step(), usually the observations, rewards, dones and extra information
+                (metrics). Environments whose step() returns more values (e.g. for `AMPOnPolicyRunner`) return
+                them as well.
+        """
+        actions, self._async_actions = self._async_actions, None
+        return self.step(actions)
@@ -4,46 +4,76 @@
 
 from __future__ import annotations
 
+import math
 import torch
 import torch.nn as nn
-from torch.distributions import Normal
 
 
 class ActorFreq(nn.Module):
-    def __init__(self, actor_layers, vel_dependent_actor_latent_dim):
-        super().__init__()
-        self.actor_all = nn.Sequential(*actor_layers)
+    """Actor with a command-dependent latent branch.
 
-        self.state_history_length = 5
-        self.obs_single_step = actor_layers[0].in_features //  self.state_history_length
-        assert self.obs_single_step == 56
+    The main branch `actor_all` maps the observation history to the residual actions. The frequency branch
+    `actor_freq` maps the commands of every step of the history to latent actions, which are appended to the
+    residual actions.
 
-        self.cmd_start = 6
-        self.cmd_end = 9
+    Args:
+        actor_layers (list[nn.Module]): Layers of the main branch, the first one reads the observation history.
+        vel_dependent_actor_latent_dim (int): Number of latent actions of the frequency branch.
+        state_history_length (int): Number of steps of the observation history.
+        cmd_indices (list[int]): Indices of the commands within the observation of a single step.
+        hidden_dims (list[int]): Hidden dimensions of the frequency branch.
+    """
 
-        assert actor_layers[-1].out_features == 12, "Expected 12 outputs for residual actions"
+    def __init__(
+        self,
+        actor_layers,
+        vel_dependent_actor_latent_dim,
+        state_history_length=5,
+        cmd_indices=[6, 7, 8],
+        hidden_dims=[64, 64],
+    ):
+        super().__init__()
+        self.actor_all = nn.Sequential(*actor_layers)
+
+        self.state_history_length = state_history_length
+        if actor_layers[0].in_features % state_history_length != 0:
+            raise ValueError(
+                f"The actor input ({actor_layers[0].in_features}) is not a history of {state_history_length} steps."
+            )
+        self.obs_single_step = actor_layers[0].in_features // state_history_length
+        if not all(0 <= index < self.obs_single_step for index in cmd_indices):
+            raise ValueError(f"Command indices {list(cmd_indices)} exceed the observation size {self.obs_single_step}.")
         self.vel_dependent_actor_latent_dim = vel_dependent_actor_latent_dim
 
-        self.actor_freq = nn.Sequential(
-            nn.Linear((self.cmd_end - self.cmd_start) * self.state_history_length, 64),
-            nn.ELU(),
-            nn.Linear(64, 64),
-            nn.ELU(),
-            nn.Linear(64,  self.vel_dependent_actor_latent_dim),
-        )
+        # positions of the commands of every step in the flattened history, gathered in one call
+        cmd_index = [
+            step * self.obs_single_step + index for step in range(state_history_length) for index in cmd_indices
+        ]
+        self.register_buffer("cmd_index", torch.tensor(cmd_index, dtype=torch.long), persistent=False)
 
-    def forward(self, x):
-        all = self.actor_all(x) # residual action
+        freq_layers = []
+        freq_dims = [len(cmd_index)] + list(hidden_dims)
+        for in_dim, out_dim in zip(freq_dims[:-1], freq_dims[1:]):
+            freq_layers += [nn.Linear(in_dim, out_dim), nn.ELU()]
+        freq_layers.append(nn.Linear(freq_dims[-1], self.vel_dependent_actor_latent_dim))
+        self.actor_freq = nn.Sequential(*freq_layers)
 
-        # reshape to extract target commands
-        batch_size = x.shape[0]
-        x = x.view(batch_size, self.state_history_length, -1)
-        target_cmds = x[:, :, self.cmd_start:self.cmd_end].reshape(batch_size, -1)
-        freq = self.actor_freq(target_cmds) # latent actions
+    def forward(self, x):
+        return self.forward_from_input_layer(self.actor_all[0](x), x)
 
-        assert all.shape[1] == 12 # residual action should always have num_joints outputs
+    def forward_from_input_layer(self, hidden_all, x):
+        """Forward pass given the (pre-activation) output of the input layer of the main branch on `x`."""
+        hidden_freq = self.actor_freq[0](x.index_select(-1, self.cmd_index))
+        return self._forward_branches(hidden_all, hidden_freq)
 
-        return torch.cat([all, freq], dim=1)
+    def _forward_branches(self, hidden_all, hidden_freq):
+        for layer_index, layer in enumerate(self.actor_all):
+            if layer_index > 0:
+                hidden_all = layer(hidden_all)  # residual actions
+        for layer_index, layer in enumerate(self.actor_freq):
+            if layer_index > 0:
+                hidden_freq = layer(hidden_freq)  # latent actions
+        return torch.cat([hidden_all, hidden_freq], dim=-1)
 
 
 class ActorCritic(nn.Module):
@@ -59,6 +89,9 @@ class ActorCritic(nn.Module):
         activation="elu",
         init_noise_std=1.0,
         vel_dependent_actor_latent_dim=0, # zero disables it
+        vel_dependent_actor_history_length=5,
+        vel_dependent_actor_cmd_indices=[6, 7, 8],
+        vel_dependent_actor_hidden_dims=[64, 64],
         **kwargs,
     ):
         if kwargs:
@@ -71,20 +104,27 @@ class ActorCritic(nn.Module):
 
         mlp_input_dim_a = num_actor_obs
         mlp_input_dim_c = num_critic_obs
-        # Policy
+        # Policy, the frequency branch (if enabled) outputs the latent part of the actions
+        num_residual_actions = num_actions - vel_dependent_actor_latent_dim
         actor_layers = []
         actor_layers.append(nn.Linear(mlp_input_dim_a, actor_hidden_dims[0]))
         actor_layers.append(activation)
         for layer_index in range(len(actor_hidden_dims)):
             if layer_index == len(actor_hidden_dims) - 1:
-                actor_layers.append(nn.Linear(actor_hidden_dims[layer_index], 12)) # output num_joint full actions or residual actions
+                actor_layers.append(nn.Linear(actor_hidden_dims[layer_index], num_residual_actions))
             else:
                 actor_layers.append(nn.Linear(actor_hidden_dims[layer_index], actor_hidden_dims[layer_index + 1]))
                 actor_layers.append(activation)
         if vel_dependent_actor_latent_dim == 0:
             self.actor = nn.Sequential(*actor_layers)
         else:
-            self.actor = ActorFreq(actor_layers, vel_dependent_actor_latent_dim)
+            self.actor = ActorFreq(
+                actor_layers,
+                vel_dependent_actor_latent_dim,
+                state_history_length=vel_dependent_actor_history_length,
+                cmd_indices=vel_dependent_actor_cmd_indices,
+                hidden_dims=vel_dependent_actor_hidden_dims,
+            )
 
         # Value function
         critic_layers = []
@@ -103,9 +143,10 @@ class ActorCritic(nn.Module):
 
         # Action noise
         self.std = nn.Parameter(init_noise_std * torch.ones(num_actions))
-        self.distribution = None
-        # disable args validation for speedup
-        Normal.set_default_validate_args = False
+        # diagonal Gaussian policy head, the std is shared over the batch and only broadcast when needed
+        self.distribution_mean = None
+        # input layers of the actor and the critic concatenated for the rollout, see `_fused_input_layer`
+        self._fused_input = None
 
         # seems that we get better performance without init
         # self.init_memory_weights(self.memory_a, 0.001, 0.)
@@ -127,26 +168,94 @@ class ActorCritic(nn.Module):
 
     @property
     def action_mean(self):
-        return self.distribution.mean
+        return self.distribution_mean
 
     @property
     def action_std(self):
-        return self.distribution.stddev
+        return self.std.expand_as(self.distribution_mean)
 
     @property
     def entropy(self):
-        return self.distribution.entropy().sum(dim=-1)
+        # closed form, identical for all samples of the batch
+        entropy = torch.sum(0.5 + 0.5 * math.log(2 * math.pi) + torch.log(self.std))
+        return entropy.expand(self.distribution_mean.shape[:-1])
 
-    def update_distribution(self, observations):
-        mean = self.actor(observations)
-        self.distribution = Normal(mean, mean * 0.0 + self.std)
+    def update_distribution(self, observations, **kwargs):
+        self.distribution_mean = self.actor(observations)
 
     def act(self, observations, **kwargs):
         self.update_distribution(observations)
-        return self.distribution.sample()
+        return self.sample()
+
+    def sample(self):
+        with torch.no_grad():
+            return torch.randn_like(self.distribution_mean).mul_(self.std).add_(self.distribution_mean)
+
+    def act_and_evaluate(self, observations, critic_observations, **kwargs):
+        """Samples actions and evaluates the critic in a single call.
+
+        When the actor and the critic consume the same tensor and no gradients are recorded (rollout collection),
+        the input layers of both networks are evaluated as a single GEMM on weights fused by `_fused_input_layer`.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: The sampled actions and the values.
+        """
+        if critic_observations is not observations or torch.is_grad_enabled():
+            self.update_distribution(observations)
+            return self.sample(), self.evaluate(critic_observations)
+
+        weight, bias = self._fused_input_layer()
+        critic_hidden_dim = self.critic[0].out_features
+        actor_hidden, critic_hidden = nn.functional.linear(observations, weight, bias).split(
+            [weight.shape[0] - critic_hidden_dim, critic_hidden_dim], dim=-1
+        )
+        if isinstance(self.actor, ActorFreq):
+            self.distribution_mean = self.actor.forward_from_input_layer(actor_hidden, observations)
+        else:
+            self.distribution_mean = self.actor[1:](actor_hidden)
+        return self.sample(), self.critic[1:](critic_hidden)
+
+    def invalidate_fused_input_layer(self):
+        """Drops the cached fused input layer, it must be called after the parameters are updated in place.
+
+        The algorithms call it after the optimizer steps of an update, loading a state dict and moving the module
+        invalidate it as well.
+        """
+        self._fused_input = None
+
+    def _fused_input_layer(self):
+        """Returns the input layers of the actor and the critic concatenated into a single layer.
+
+        The concatenation is cached until `invalidate_fused_input_layer` is called. For `ActorFreq`, only the main
+        branch is fused, the command branch reads a gather of the input.
+        """
+        if self._fused_input is None:
+            actor_input = self.actor.actor_all[0] if isinstance(self.actor, ActorFreq) else self.actor[0]
+            critic_input = self.critic[0]
+            with torch.no_grad():
+                self._fused_input = (
+                    torch.cat([actor_input.weight, critic_input.weight]),
+                    torch.cat([actor_input.bias, critic_input.bias]),
+                )
+        return self._fused_input
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self.invalidate_fused_input_layer()
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def _apply(self, *args, **kwargs):
+        # device and dtype moves
+        self.invalidate_fused_input_layer()
+        return super()._apply(*args, **kwargs)
 
     def get_actions_log_prob(self, actions):
-        return self.distribution.log_prob(actions).sum(dim=-1)
+        # closed form log-likelihood of a diagonal Gaussian
+        normalized_actions = (actions - self.distribution_mean) / self.std
+        return (
+            -0.5 * torch.sum(torch.square(normalized_actions), dim=-1)
+            - torch.sum(torch.log(self.std))
+            - 0.5 * self.std.shape[-1] * math.log(2 * math.pi)
+        )
 
     def act_inference(self, observations):
         actions_mean = self.actor(observations)
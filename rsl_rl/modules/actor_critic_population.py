@@ -0,0 +1,103 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import math
+import torch
+import torch.nn as nn
+from torch.func import functional_call, stack_module_state, vmap
+
+from rsl_rl.modules.actor_critic import ActorCritic
+
+
+class ActorCriticPopulation(nn.Module):
+    """Population of independently initialized actor-critics evaluated as one batched network.
+
+    The parameters of the members are stacked along a leading population dimension and the members are evaluated
+    with `torch.func.vmap`, so every layer runs as one batched GEMM for the whole population. The batch dimension of
+    all inputs and outputs is partitioned into contiguous, equally sized blocks: the first `batch_size / K` samples
+    (environments) belong to member 0, the next ones to member 1 and so on.
+    """
+
+    is_recurrent = False
+
+    def __init__(self, num_actor_obs, num_critic_obs, num_actions, population_size=2, **kwargs):
+        super().__init__()
+        self.population_size = population_size
+        members = [ActorCritic(num_actor_obs, num_critic_obs, num_actions, **kwargs) for _ in range(population_size)]
+        # the first member holds the stacked parameters of all members and provides the structure for `functional_call`
+        params, _ = stack_module_state(members)
+        self.members = members[0]
+        for name, value in params.items():
+            module_name, _, param_name = name.rpartition(".")
+            setattr(self.members.get_submodule(module_name), param_name, nn.Parameter(value.detach()))
+        self.distribution_mean = None
+
+    def reset(self, dones=None):
+        pass
+
+    def forward(self):
+        raise NotImplementedError
+
+    @property
+    def std(self):
+        """Action noise of the members. Shape: (population_size, num_actions)"""
+        return self.members.std
+
+    @property
+    def action_mean(self):
+        return self.distribution_mean
+
+    @property
+    def action_std(self):
+        return self._per_sample(self.std, self.distribution_mean.shape[0])
+
+    @property
+    def entropy(self):
+        entropy = torch.sum(0.5 + 0.5 * math.log(2 * math.pi) + torch.log(self.std), dim=-1)
+        return self._per_sample(entropy, self.distribution_mean.shape[0])
+
+    def update_distribution(self, observations):
+        self.distribution_mean = self._forward_members(self.members.actor, observations)
+
+    def act(self, observations, **kwargs):
+        self.update_distribution(observations)
+        return self.sample()
+
+    def sample(self):
+        with torch.no_grad():
+            return torch.randn_like(self.distribution_mean).mul_(self.action_std).add_(self.distribution_mean)
+
+    def act_and_evaluate(self, observations, critic_observations, **kwargs):
+        self.update_distribution(observations)
+        return self.sample(), self.evaluate(critic_observations)
+
+    def get_actions_log_prob(self, actions):
+        std = self.action_std
+        normalized_actions = (actions - self.distribution_mean) / std
+        return (
+            -0.5 * torch.sum(torch.square(normalized_actions), dim=-1)
+            - torch.sum(torch.log(std), dim=-1)
+            - 0.5 * std.shape[-1] * math.log(2 * math.pi)
+        )
+
+    def act_inference(self, observations):
+        return self._forward_members(self.members.actor, observations)
+
+    def evaluate(self, critic_observations, **kwargs):
+        return self._forward_members(self.members.critic, critic_observations)
+
+    def _forward_members(self, network, x):
+        """Evaluates the network of every member on its block of the batch."""
+        if x.shape[0] % self.population_size != 0:
+            raise ValueError(f"The batch size ({x.shape[0]}) is not divisible by the population size.")
+        params = dict(network.named_parameters())
+        out = vmap(lambda params, x: functional_call(network, params, (x,)))(
+            params, x.view(self.population_size, -1, *x.shape[1:])
+        )
+        return out.flatten(0, 1)
+
+    def _per_sample(self, x, batch_size):
+        """Broadcasts per-member values of shape (population_size, ...) to the partitioned batch."""
+        return x.repeat_interleave(batch_size // self.population_size, dim=0)
@@ -5,6 +5,7 @@ from __future__ import annotations
 
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 
 from rsl_rl.modules.actor_critic import ActorCritic, get_activation
 from rsl_rl.utils import unpad_trajectories
@@ -24,6 +25,8 @@ class ActorCriticRecurrent(ActorCritic):
         rnn_type="lstm",
         rnn_hidden_size=256,
         rnn_num_layers=1,
+        rnn_gradient_checkpointing=False,
+        rnn_checkpoint_chunk_size=None,
         init_noise_std=1.0,
         **kwargs,
     ):
@@ -44,8 +47,24 @@ class ActorCriticRecurrent(ActorCritic):
 
         activation = get_activation(activation)
 
-        self.memory_a = Memory(num_actor_obs, type=rnn_type, num_layers=rnn_num_layers, hidden_size=rnn_hidden_size)
-        self.memory_c = Memory(num_critic_obs, type=rnn_type, num_layers=rnn_num_layers, hidden_size=rnn_hidden_size)
+        # optionally trade recomputation for activation memory in the policy update
+        checkpoint_chunk_size = None
+        if rnn_gradient_checkpointing:
+            checkpoint_chunk_size = rnn_checkpoint_chunk_size if rnn_checkpoint_chunk_size is not None else 0
+        self.memory_a = Memory(
+            num_actor_obs,
+            type=rnn_type,
+            num_layers=rnn_num_layers,
+            hidden_size=rnn_hidden_size,
+            checkpoint_chunk_size=checkpoint_chunk_size,
+        )
+        self.memory_c = Memory(
+            num_critic_obs,
+            type=rnn_type,
+            num_layers=rnn_num_layers,
+            hidden_size=rnn_hidden_size,
+            checkpoint_chunk_size=checkpoint_chunk_size,
+        )
 
         print(f"Actor RNN: {self.memory_a}")
         print(f"Critic RNN: {self.memory_c}")
@@ -54,9 +73,20 @@ class ActorCriticRecurrent(ActorCritic):
         self.memory_a.reset(dones)
         self.memory_c.reset(dones)
 
-    def act(self, observations, masks=None, hidden_states=None):
+    def update_distribution(self, observations, masks=None, hidden_states=None):
         input_a = self.memory_a(observations, masks, hidden_states)
-        return super().act(input_a.squeeze(0))
+        super().update_distribution(input_a.squeeze(0))
+
+    def act(self, observations, masks=None, hidden_states=None):
+        self.update_distribution(observations, masks=masks, hidden_states=hidden_states)
+        return self.sample()
+
+    def act_and_evaluate(self, observations, critic_observations, masks=None, hidden_states=None):
+        # the actor and the critic have separate memories, so there is no shared input layer to fuse
+        if hidden_states is None:
+            hidden_states = (None, None)
+        actions = self.act(observations, masks=masks, hidden_states=hidden_states[0])
+        return actions, self.evaluate(critic_observations, masks=masks, hidden_states=hidden_states[1])
 
     def act_inference(self, observations):
         input_a = self.memory_a(observations)
@@ -71,12 +101,24 @@ class ActorCriticRecurrent(ActorCritic):
 
 
 class Memory(torch.nn.Module):
-    def __init__(self, input_size, type="lstm", num_layers=1, hidden_size=256):
+    def __init__(self, input_size, type="lstm", num_layers=1, hidden_size=256, checkpoint_chunk_size=None):
+        """Recurrent memory of the actor or the critic.
+
+        Args:
+            checkpoint_chunk_size (int | None): If not None, the activations of the RNN are recomputed in the backward
+                pass of the policy update (gradient checkpointing). Only the hidden states at the boundaries of chunks
+                of this many time steps are kept, zero checkpoints the whole sequence at once.
+        """
         super().__init__()
         # RNN
         rnn_cls = nn.GRU if type.lower() == "gru" else nn.LSTM
         self.rnn = rnn_cls(input_size=input_size, hidden_size=hidden_size, num_layers=num_layers)
+        self.checkpoint_chunk_size = checkpoint_chunk_size
+        # preallocated (num_layers, num_envs, hidden_size) buffers of the collection, updated in place
+        self.hidden_state_buffers = None
         self.hidden_states = None
+        # preallocated mask of the environments to reset
+        self._reset_mask = None
 
     def forward(self, input, masks=None, hidden_states=None):
         batch_mode = masks is not None
@@ -84,14 +126,49 @@ class Memory(torch.nn.Module):
             # batch mode (policy update): need saved hidden states
             if hidden_states is None:
                 raise ValueError("Hidden states not passed to memory module during policy update")
-            out, _ = self.rnn(input, hidden_states)
+            if self.checkpoint_chunk_size is not None and torch.is_grad_enabled():
+                out = self._checkpointed_rnn(input, hidden_states)
+            else:
+                out, _ = self.rnn(input, hidden_states)
             out = unpad_trajectories(out, masks)
         else:
             # inference mode (collection): use hidden states of last step
-            out, self.hidden_states = self.rnn(input.unsqueeze(0), self.hidden_states)
+            out, hidden_states = self.rnn(input.unsqueeze(0), self.hidden_states)
+            self._store_hidden_states(hidden_states)
         return out
 
     def reset(self, dones=None):
-        # When the RNN is an LSTM, self.hidden_states_a is a list with hidden_state and cell_state
-        for hidden_state in self.hidden_states:
-            hidden_state[..., dones, :] = 0.0
+        if self.hidden_state_buffers is None:
+            return
+        if dones is None:
+            for buffer in self.hidden_state_buffers:
+                buffer.zero_()
+            return
+        # When the RNN is an LSTM, the buffers hold the hidden state and the cell state
+        if self._reset_mask is None or self._reset_mask.shape[1] != dones.numel():
+            with torch.inference_mode(False):
+                self._reset_mask = torch.zeros(1, dones.numel(), 1, dtype=torch.bool, device=dones.device)
+        torch.ne(dones.view(1, -1, 1), 0, out=self._reset_mask)
+        for buffer in self.hidden_state_buffers:
+            buffer.masked_fill_(self._reset_mask, 0.0)
+
+    def _checkpointed_rnn(self, input, hidden_states):
+        chunk_size = self.checkpoint_chunk_size if self.checkpoint_chunk_size > 0 else input.shape[0]
+        outs = []
+        for chunk in input.split(chunk_size):
+            out, hidden_states = checkpoint(self.rnn, chunk, hidden_states, use_reentrant=False)
+            outs.append(out)
+        return torch.cat(outs)
+
+    def _store_hidden_states(self, hidden_states):
+        hidden_states = hidden_states if isinstance(hidden_states, tuple) else (hidden_states,)
+        if self.hidden_state_buffers is None or self.hidden_state_buffers[0].shape != hidden_states[0].shape:
+            # allocate the buffers as normal tensors, so they can be updated both in and outside of inference mode
+            with torch.inference_mode(False):
+                self.hidden_state_buffers = tuple(torch.zeros_like(state) for state in hidden_states)
+            # the RNN expects a tuple for LSTMs and a tensor for GRUs
+            self.hidden_states = (
+                self.hidden_state_buffers if isinstance(self.rnn, nn.LSTM) else self.hidden_state_buffers[0]
+            )
+        for buffer, state in zip(self.hidden_state_buffers, hidden_states):
+            buffer.copy_(state.detach())
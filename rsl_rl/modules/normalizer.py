@@ -7,11 +7,13 @@ from __future__ import annotations
 import torch
 from torch import nn
 
+from rsl_rl.utils.utils import all_reduce_moments
+
 
 class EmpiricalNormalization(nn.Module):
     """Normalize mean and variance of values based on empirical values."""
 
-    def __init__(self, shape, eps=1e-2, until=None):
+    def __init__(self, shape, eps=1e-2, until=None, distributed=False):
         """Initialize EmpiricalNormalization module.
 
         Args:
@@ -19,10 +21,13 @@ class EmpiricalNormalization(nn.Module):
             eps (float): Small value for stability.
             until (int or None): If this arg is specified, the link learns input values until the sum of batch sizes
             exceeds it.
+            distributed (bool): If True, the batches of all ranks of the process group are merged before the update so
+            that the statistics stay in sync.
         """
         super().__init__()
         self.eps = eps
         self.until = until
+        self.distributed = distributed
         self.register_buffer("_mean", torch.zeros(shape).unsqueeze(0))
         self.register_buffer("_var", torch.ones(shape).unsqueeze(0))
         self.register_buffer("_std", torch.ones(shape).unsqueeze(0))
@@ -54,15 +59,21 @@ class EmpiricalNormalization(nn.Module):
     def update(self, x):
         """Learn input values without computing the output values of them"""
 
-        if self.until is not None and self.count >= self.until:
+        # the merged count of a distributed update stays on the device, it is compared with `until` there
+        if self.until is not None and not self.distributed and self.count >= self.until:
             return
 
         count_x = x.shape[0]
+        var_x = torch.var(x, dim=0, unbiased=False, keepdim=True)
+        mean_x = torch.mean(x, dim=0, keepdim=True)
+        if self.distributed:
+            mean_x, var_x, count_x = all_reduce_moments(mean_x, var_x, count_x)
+            if self.until is not None:
+                # a zero count leaves the statistics unchanged
+                count_x = count_x * (self.count < self.until)
         self.count += count_x
         rate = count_x / self.count
 
-        var_x = torch.var(x, dim=0, unbiased=False, keepdim=True)
-        mean_x = torch.mean(x, dim=0, keepdim=True)
         delta_mean = mean_x - self._mean
         self._mean += rate * delta_mean
         self._var += rate * (var_x - self._var + delta_mean * (mean_x - self._mean))
@@ -3,7 +3,33 @@
 
 """Implementation of runners for environment-agent interaction."""
 
-from .on_policy_runner import OnPolicyRunner
-from .amp_on_policy_runner import AMPOnPolicyRunner
+from __future__ import annotations
 
-__all__ = ["OnPolicyRunner", "AMPOnPolicyRunner"]
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .amp_on_policy_runner import AMPOnPolicyRunner
+    from .evaluation_runner import EvaluationRunner
+    from .on_policy_runner import OnPolicyRunner
+    from .worker_learner_runner import WorkerLearnerRunner
+
+__all__ = ["OnPolicyRunner", "AMPOnPolicyRunner", "EvaluationRunner", "WorkerLearnerRunner"]
+
+# runners are imported on first access (PEP 562) since they pull in the logging and dataset dependencies
+_LAZY_ATTRIBUTES = {
+    "OnPolicyRunner": ".on_policy_runner",
+    "AMPOnPolicyRunner": ".amp_on_policy_runner",
+    "EvaluationRunner": ".evaluation_runner",
+    "WorkerLearnerRunner": ".worker_learner_runner",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
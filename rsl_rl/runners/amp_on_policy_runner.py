@@ -34,7 +34,6 @@ import os
 from collections import deque
 import statistics
 
-from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
 import torch
 
 import rsl_rl
@@ -44,7 +43,7 @@ from rsl_rl.env import VecEnv
 from rsl_rl.algorithms.amp_discriminator import AMPDiscriminator
 from rsl_rl.datasets.motion_loader import AMPLoader
 from rsl_rl.utils.utils import Normalizer
-from rsl_rl.utils import store_code_state
+from rsl_rl.utils import init_distributed, store_code_state
 from rsl_rl.storage import ObservationHistoryStorage
 
 class AMPOnPolicyRunner:
@@ -57,6 +56,11 @@ class AMPOnPolicyRunner:
 
         self.cfg=train_cfg
         self.alg_cfg = train_cfg["algorithm"]
+        # data-parallel training (launched with torchrun), every rank steps its own environments
+        self.rank, self.world_size = init_distributed(device, train_cfg.get("distributed_backend"))
+        self.is_distributed = self.world_size > 1
+        # only rank 0 logs and saves checkpoints
+        self.disable_logs = self.rank != 0
         self.policy_cfg = train_cfg["policy"]
         self.device = device
         self.env = env
@@ -73,8 +77,10 @@ class AMPOnPolicyRunner:
 
         if "critic" in extras["observations"]:
             num_critic_obs = extras["observations"]["critic"].shape[1]
+            critic_obs_shape = [num_critic_obs]
         else:
             num_critic_obs = num_obs_history
+            critic_obs_shape = [None]  # the critic uses the actor observations, no separate storage
 
         actor_critic_class = eval(self.policy_cfg.pop("class_name"))  # ActorCritic
 
@@ -85,8 +91,11 @@ class AMPOnPolicyRunner:
         amp_data = AMPLoader(
             device, time_between_frames=self.env.unwrapped.step_dt, preload_transitions=True,
             num_preload_transitions=train_cfg['amp_num_preload_transitions'],
-            motion_files=self.cfg["amp_motion_files"])
-        amp_normalizer = Normalizer(amp_data.observation_dim, self.device)
+            motion_files=self.cfg["amp_motion_files"],
+            joint_mapping=self.cfg.get("amp_joint_mapping"),
+            quat_mapping=self.cfg.get("amp_quat_mapping"),
+            seed=None if self.cfg.get("seed") is None else self.cfg["seed"] + self.rank)
+        amp_normalizer = Normalizer(amp_data.observation_dim, self.device, distributed=self.is_distributed)
         discriminator = AMPDiscriminator(
             amp_data.observation_dim * 2,
             train_cfg['amp_reward_coef'],
@@ -101,14 +110,20 @@ class AMPOnPolicyRunner:
                 - self.env.unwrapped.scene["robot"].data.soft_joint_pos_limits[0, :, 0]
             )
         )
-        self.alg: AMPPPO = alg_class(actor_critic, discriminator, amp_data, amp_normalizer, device=self.device, min_std=min_std, **self.alg_cfg)
+        self.alg: AMPPPO = alg_class(
+            actor_critic, discriminator, amp_data, amp_normalizer, device=self.device, min_std=min_std,
+            distributed=self.is_distributed, **self.alg_cfg)
         self.num_steps_per_env = self.cfg["num_steps_per_env"]
         self.save_interval = self.cfg["save_interval"]
 
         self.empirical_normalization = self.cfg["empirical_normalization"]
         if self.empirical_normalization:
-            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(self.device)
-            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(self.device)
+            self.obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs_single_timestep], until=1.0e8, distributed=self.is_distributed
+            ).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs_single_timestep], until=1.0e8, distributed=self.is_distributed
+            ).to(self.device)
         else:
             self.obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
             self.critic_obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
@@ -118,9 +133,12 @@ class AMPOnPolicyRunner:
             self.env.num_envs,
             self.num_steps_per_env,
             [num_obs_history],
-            [num_critic_obs],
+            critic_obs_shape,
             [self.env.num_actions],
         )
+        if self.is_distributed:
+            # all ranks start from the parameters of rank 0
+            self.alg.broadcast_parameters()
 
         # Log
         self.log_dir = log_dir
@@ -134,7 +152,7 @@ class AMPOnPolicyRunner:
     
     def learn(self, num_learning_iterations: int, init_at_random_ep_len: bool = False):
         # initialize writer
-        if self.log_dir is not None and self.writer is None:
+        if self.log_dir is not None and self.writer is None and not self.disable_logs:
             # Launch either Tensorboard or Neptune & Tensorboard summary writer(s), default: Tensorboard.
             self.logger_type = self.cfg.get("logger", "tensorboard")
             self.logger_type = self.logger_type.lower()
@@ -150,6 +168,8 @@ class AMPOnPolicyRunner:
                 self.writer = WandbSummaryWriter(log_dir=self.log_dir, flush_secs=10, cfg=self.cfg)
                 self.writer.log_config(self.env.cfg, self.cfg, self.alg_cfg, self.policy_cfg)
             elif self.logger_type == "tensorboard":
+                from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
+
                 self.writer = TensorboardSummaryWriter(log_dir=self.log_dir, flush_secs=10)
             else:
                 raise AssertionError("logger type not found")
@@ -169,6 +189,14 @@ class AMPOnPolicyRunner:
         lenbuffer = deque(maxlen=100)
         cur_reward_sum = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
         cur_episode_length = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
+        finished_episodes = []
+
+        def flush_episodes():
+            """Moves the returns and lengths of the finished episodes to the buffers, this syncs with the device."""
+            for done_mask, reward_sum, episode_length in finished_episodes:
+                rewbuffer.extend(reward_sum[done_mask].cpu().numpy().tolist())
+                lenbuffer.extend(episode_length[done_mask].cpu().numpy().tolist())
+            finished_episodes.clear()
 
         start_iter = self.current_learning_iteration
         tot_iter = start_iter + num_learning_iterations
@@ -178,7 +206,10 @@ class AMPOnPolicyRunner:
             with torch.inference_mode():
                 for i in range(self.num_steps_per_env):
                     actions = self.alg.act(obs_history, critic_obs, amp_obs)
-                    obs, rewards, dones, infos, reset_env_ids, terminal_amp_states = self.env.step(actions)
+                    self.env.step_async(actions)
+                    # the host transfers of the book keeping overlap the simulation
+                    flush_episodes()
+                    obs, rewards, dones, infos, reset_env_ids, terminal_amp_states = self.env.step_wait()
                     
                     next_amp_obs = self.env.unwrapped.get_amp_observations()
 
@@ -202,8 +233,7 @@ class AMPOnPolicyRunner:
 
                     # perform normalization
                     obs = self.obs_normalizer(obs)
-                    if dones.any():
-                        self.obs_history_storage.reset(dones)
+                    self.obs_history_storage.reset(dones)
                     self.obs_history_storage.add(obs)
                     obs_history = self.obs_history_storage.get()
 
@@ -224,12 +254,12 @@ class AMPOnPolicyRunner:
                             ep_infos.append(infos["log"])
                         cur_reward_sum += rewards
                         cur_episode_length += 1
-                        new_ids = (dones > 0).nonzero(as_tuple=False)
-                        rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
-                        lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
-                        cur_reward_sum[new_ids] = 0
-                        cur_episode_length[new_ids] = 0
+                        done_mask = dones > 0
+                        finished_episodes.append((done_mask, cur_reward_sum.clone(), cur_episode_length.clone()))
+                        cur_reward_sum.masked_fill_(done_mask, 0)
+                        cur_episode_length.masked_fill_(done_mask, 0)
 
+                flush_episodes()
                 stop = time.time()
                 collection_time = stop - start
 
@@ -240,12 +270,12 @@ class AMPOnPolicyRunner:
             mean_value_loss, mean_surrogate_loss, mean_amp_loss, mean_grad_pen_loss, mean_policy_pred, mean_expert_pred = self.alg.update()
             stop = time.time()
             learn_time = stop - start
-            if self.log_dir is not None:
+            if self.log_dir is not None and not self.disable_logs:
                 self.log(locals())
-            if it % self.save_interval == 0:
+            if it % self.save_interval == 0 and not self.disable_logs:
                 self.save(os.path.join(self.log_dir, 'model_{}.pt'.format(it)))
             ep_infos.clear()
-            if it == start_iter:
+            if it == start_iter and not self.disable_logs:
                 # obtain all the diff files
                 git_file_paths = store_code_state(self.log_dir, self.git_status_repos)
                 # if possible store them to wandb
@@ -253,10 +283,12 @@ class AMPOnPolicyRunner:
                     for path in git_file_paths:
                         self.writer.save_file(path)
         
-        self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
+        if not self.disable_logs:
+            self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
 
     def log(self, locs: dict, width: int = 80, pad: int = 35):
-        self.tot_timesteps += self.num_steps_per_env * self.env.num_envs
+        # every rank collects the same number of steps
+        self.tot_timesteps += self.num_steps_per_env * self.env.num_envs * self.world_size
         self.tot_time += locs["collection_time"] + locs["learn_time"]
         iteration_time = locs["collection_time"] + locs["learn_time"]
         
@@ -285,7 +317,9 @@ class AMPOnPolicyRunner:
                     self.writer.add_scalar("Episode/" + key, value, locs["it"])
                     ep_string += f"""{f'Mean episode {key}:':>{pad}} {value:.4f}\n"""
         mean_std = self.alg.actor_critic.std.mean()
-        fps = int(self.num_steps_per_env * self.env.num_envs / (locs["collection_time"] + locs["learn_time"]))
+        fps = int(
+            self.num_steps_per_env * self.env.num_envs * self.world_size / (locs["collection_time"] + locs["learn_time"])
+        )
 
         self.writer.add_scalar("Loss/value_function", locs["mean_value_loss"], locs["it"])
         self.writer.add_scalar("Loss/surrogate", locs["mean_surrogate_loss"], locs["it"])
@@ -295,6 +329,7 @@ class AMPOnPolicyRunner:
         self.writer.add_scalar('AMP/mean_policy_pred', locs['mean_policy_pred'], locs['it'])
         self.writer.add_scalar('AMP/mean_expert_pred', locs['mean_expert_pred'], locs['it'])
         self.writer.add_scalar("Loss/learning_rate", self.alg.learning_rate, locs["it"])
+        self.writer.add_scalar("Loss/learning_epochs", self.alg.num_learning_epochs_run, locs["it"])
         self.writer.add_scalar("Policy/mean_noise_std", mean_std.item(), locs["it"])
         self.writer.add_scalar("Perf/total_fps", fps, locs["it"])
         self.writer.add_scalar("Perf/collection time", locs["collection_time"], locs["it"])
@@ -317,6 +352,7 @@ class AMPOnPolicyRunner:
                 f"""{"Computation:":>{pad}} {fps:.0f} steps/s (collection: {locs["collection_time"]:.3f}s, learning {locs["learn_time"]:.3f}s)\n"""
                 f"""{"Value function loss:":>{pad}} {locs["mean_value_loss"]:.4f}\n"""
                 f"""{"Surrogate loss:":>{pad}} {locs["mean_surrogate_loss"]:.4f}\n"""
+                f"""{"Learning epochs:":>{pad}} {self.alg.num_learning_epochs_run}\n"""
                 f"""{"AMP loss:":>{pad}} {locs["mean_amp_loss"]:.4f}\n"""
                 f"""{"AMP grad pen loss:":>{pad}} {locs["mean_grad_pen_loss"]:.4f}\n"""
                 f"""{"AMP mean policy pred:":>{pad}} {locs["mean_policy_pred"]:.4f}\n"""
@@ -334,6 +370,7 @@ class AMPOnPolicyRunner:
                 f"""{"Computation:":>{pad}} {fps:.0f} steps/s (collection: {locs["collection_time"]:.3f}s, learning {locs["learn_time"]:.3f}s)\n"""
                 f"""{"Value function loss:":>{pad}} {locs["mean_value_loss"]:.4f}\n"""
                 f"""{"Surrogate loss:":>{pad}} {locs["mean_surrogate_loss"]:.4f}\n"""
+                f"""{"Learning epochs:":>{pad}} {self.alg.num_learning_epochs_run}\n"""
                 f"""{"Mean action noise std:":>{pad}} {mean_std.item():.2f}\n"""
             )
             #   f"""{'Mean reward/step:':>{pad}} {locs['mean_reward']:.2f}\n"""
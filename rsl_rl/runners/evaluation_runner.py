@@ -0,0 +1,140 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import copy
+import math
+import torch
+from torch.func import functional_call, stack_module_state, vmap
+
+import rsl_rl.modules
+from rsl_rl.env import VecEnv
+from rsl_rl.storage import ObservationHistoryStorage
+
+
+class EvaluationRunner:
+    """Runner that evaluates many checkpoints in a single rollout.
+
+    The environments are partitioned into one group per checkpoint. The actor parameters of all checkpoints are
+    stacked and the actors are evaluated in one batched call with `torch.func.vmap`, so sweeping K checkpoints
+    costs one rollout instead of K. Actions are the deterministic means of the policies.
+    """
+
+    def __init__(self, env: VecEnv, train_cfg, device="cpu"):
+        self.cfg = train_cfg
+        self.policy_cfg = copy.deepcopy(train_cfg["policy"])
+        self.device = device
+        self.env = env
+        obs, extras = self.env.get_observations()
+        self.num_obs = obs.shape[1]
+        self.history_length = 5
+        num_obs_history = self.num_obs * self.history_length
+        if "critic" in extras["observations"]:
+            num_critic_obs = extras["observations"]["critic"].shape[1]
+        else:
+            num_critic_obs = num_obs_history
+        class_name = self.policy_cfg.pop("class_name")
+        actor_critic_class = getattr(rsl_rl.modules, class_name, None)
+        if actor_critic_class is None:
+            raise ValueError(f"Unknown policy class '{class_name}', expected one of {rsl_rl.modules.__all__}.")
+        if actor_critic_class.is_recurrent:
+            raise ValueError("Batched evaluation of recurrent policies is not supported.")
+        self.actor_critic_fn = lambda: actor_critic_class(
+            num_obs_history, num_critic_obs, self.env.num_actions, **self.policy_cfg
+        )
+
+    def evaluate(self, paths, num_steps=None):
+        """Roll out all checkpoints at once and report their episode statistics.
+
+        The environments are reset before the rollout. Environment `i` runs the checkpoint `i // group_size` with
+        `group_size = ceil(num_envs / len(paths))`. Only episodes that terminate within the rollout are counted.
+
+        Args:
+            paths (list[str]): Checkpoints written by `OnPolicyRunner.save`.
+            num_steps (int | None): Number of environment steps. Defaults to the maximum episode length.
+
+        Returns:
+            list[dict]: For every checkpoint, the path, the mean return, the mean episode length and the number of
+                completed episodes. The means are NaN if no episode of the group terminated.
+        """
+        num_checkpoints = len(paths)
+        if not 0 < num_checkpoints <= self.env.num_envs:
+            raise ValueError(f"Expected between 1 and {self.env.num_envs} checkpoints, got {num_checkpoints}.")
+        if num_steps is None:
+            num_steps = int(self.env.max_episode_length)
+        actor, params, buffers, obs_mean, obs_std = self._load_checkpoints(paths)
+
+        def act_inference(params, buffers, observations):
+            return functional_call(actor, (params, buffers), (observations,))
+
+        batched_act_inference = vmap(act_inference)
+
+        num_envs = self.env.num_envs
+        group_size = math.ceil(num_envs / num_checkpoints)
+        num_padded_envs = num_checkpoints * group_size - num_envs
+        env_groups = torch.arange(num_envs, device=self.device) // group_size
+        obs_history_storage = ObservationHistoryStorage(num_envs, self.num_obs, self.history_length, self.device)
+
+        cur_reward_sum = torch.zeros(num_envs, device=self.device)
+        cur_episode_length = torch.zeros(num_envs, device=self.device)
+        return_sum = torch.zeros(num_checkpoints, device=self.device)
+        length_sum = torch.zeros(num_checkpoints, device=self.device)
+        num_episodes = torch.zeros(num_checkpoints, device=self.device)
+
+        obs, _ = self.env.reset()
+        with torch.inference_mode():
+            for _ in range(num_steps):
+                obs = (obs.to(self.device) - obs_mean[env_groups]) / obs_std[env_groups]
+                obs_history_storage.add(obs)
+                obs_history = obs_history_storage.get()
+                obs_history = torch.cat([obs_history, obs_history.new_zeros(num_padded_envs, obs_history.shape[1])])
+                actions = batched_act_inference(params, buffers, obs_history.view(num_checkpoints, group_size, -1))
+                actions = actions.view(num_checkpoints * group_size, -1)[:num_envs]
+                obs, rewards, dones, _ = self.env.step(actions.to(self.env.device))
+                rewards, dones = rewards.to(self.device), dones.to(self.device)
+
+                cur_reward_sum += rewards
+                cur_episode_length += 1
+                done_mask = (dones > 0).float()
+                return_sum.index_add_(0, env_groups, cur_reward_sum * done_mask)
+                length_sum.index_add_(0, env_groups, cur_episode_length * done_mask)
+                num_episodes.index_add_(0, env_groups, done_mask)
+                cur_reward_sum *= 1.0 - done_mask
+                cur_episode_length *= 1.0 - done_mask
+                obs_history_storage.reset(dones)
+
+        mean_returns = (return_sum / num_episodes).tolist()
+        mean_lengths = (length_sum / num_episodes).tolist()
+        return [
+            {
+                "path": path,
+                "mean_return": mean_returns[i],
+                "mean_episode_length": mean_lengths[i],
+                "num_episodes": int(num_episodes[i].item()),
+            }
+            for i, path in enumerate(paths)
+        ]
+
+    def _load_checkpoints(self, paths):
+        """Returns a stateless actor, the stacked actor parameters and buffers and the normalizer statistics."""
+        actors, obs_means, obs_stds = [], [], []
+        for path in paths:
+            loaded_dict = torch.load(path, map_location=self.device)
+            actor_critic = self.actor_critic_fn().to(self.device)
+            actor_critic.load_state_dict(loaded_dict["model_state_dict"])
+            actors.append(actor_critic.actor.eval())
+            if "obs_norm_state_dict" in loaded_dict:
+                # the eps is not part of the state, the normalizer is built like the one of the training runner
+                obs_normalizer = rsl_rl.modules.EmpiricalNormalization(shape=[self.num_obs], until=1.0e8)
+                obs_normalizer.to(self.device)
+                obs_normalizer.load_state_dict(loaded_dict["obs_norm_state_dict"])
+                obs_means.append(obs_normalizer.mean)
+                obs_stds.append(obs_normalizer.std + obs_normalizer.eps)
+            else:
+                obs_means.append(torch.zeros(self.num_obs, device=self.device))
+                obs_stds.append(torch.ones(self.num_obs, device=self.device))
+        params, buffers = stack_module_state(actors)
+        # the stacked parameters hold the weights, the module only provides the structure
+        actor = copy.deepcopy(actors[0]).to("meta")
+        return actor, params, buffers, torch.stack(obs_means), torch.stack(obs_stds)
@@ -3,27 +3,45 @@
 
 from __future__ import annotations
 
+import copy
 import os
 import statistics
 import time
 import torch
 from collections import deque
-from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
+from concurrent.futures import ThreadPoolExecutor
 
 import rsl_rl
-from rsl_rl.algorithms import PPO
+from rsl_rl.algorithms import PPO, PopulationPPO  # noqa: F401
 from rsl_rl.env import VecEnv
-from rsl_rl.modules import ActorCritic, ActorCriticRecurrent, EmpiricalNormalization
-from rsl_rl.utils import store_code_state
-from rsl_rl.storage import ObservationHistoryStorage
+from rsl_rl.modules import ActorCritic, ActorCriticPopulation, ActorCriticRecurrent, EmpiricalNormalization  # noqa: F401
+from rsl_rl.utils import init_distributed, store_code_state
+from rsl_rl.storage import ObservationHistoryStorage, RolloutStorage
 
 
 class OnPolicyRunner:
-    """On-policy runner for training and evaluation."""
+    """On-policy runner for training and evaluation.
+
+    By default a rollout is collected and then learned on, the environments and the learner wait for each other. With
+    `policy_lag: 1` in the runner configuration the two are pipelined: a background thread collects rollout k+1 into a
+    second storage with a snapshot of the policy of iteration k while the learner updates on rollout k, so that an
+    iteration takes about the longer of the two instead of their sum.
+
+    The rollouts are then collected by a policy one update older than the one being optimized. The stored
+    log-probabilities, means and values are those of the collecting snapshot, so the PPO ratio stays the importance
+    ratio to the behavior policy, but it starts away from 1: the clipping and the KL of the first mini-batches account
+    for the update made in between. Lower learning rates or a smaller `desired_kl` compensate if the adaptive schedule
+    shrinks the learning rate or the clipped fraction grows.
+    """
 
     def __init__(self, env: VecEnv, train_cfg, log_dir=None, device="cpu"):
         self.cfg = train_cfg
         self.alg_cfg = train_cfg["algorithm"]
+        # data-parallel training (launched with torchrun), every rank steps its own environments
+        self.rank, self.world_size = init_distributed(device, train_cfg.get("distributed_backend"))
+        self.is_distributed = self.world_size > 1
+        # only rank 0 logs and saves checkpoints
+        self.disable_logs = self.rank != 0
         self.policy_cfg = train_cfg["policy"]
         self.device = device
         self.env = env
@@ -40,21 +58,33 @@ class OnPolicyRunner:
 
         if "critic" in extras["observations"]:
             num_critic_obs = extras["observations"]["critic"].shape[1]
+            critic_obs_shape = [num_critic_obs]
         else:
             num_critic_obs = num_obs_history
+            critic_obs_shape = [None]  # the critic uses the actor observations, no separate storage
 
         actor_critic_class = eval(self.policy_cfg.pop("class_name"))  # ActorCritic
         actor_critic: ActorCritic | ActorCriticRecurrent = actor_critic_class(
             num_obs_history, num_critic_obs, self.env.num_actions, **self.policy_cfg
         ).to(self.device)
         alg_class = eval(self.alg_cfg.pop("class_name"))  # PPO
-        self.alg: PPO = alg_class(actor_critic, device=self.device, **self.alg_cfg)
+        self.alg: PPO = alg_class(actor_critic, device=self.device, distributed=self.is_distributed, **self.alg_cfg)
         self.num_steps_per_env = self.cfg["num_steps_per_env"]
         self.save_interval = self.cfg["save_interval"]
+        # number of updates by which the collecting policy lags behind the learner (0: no overlap, 1: pipelined)
+        self.policy_lag = self.cfg.get("policy_lag", 0)
+        if self.policy_lag not in (0, 1):
+            raise ValueError(f"The policy lag must be 0 or 1, got {self.policy_lag}.")
+        if self.policy_lag and self.is_distributed:
+            raise ValueError("The pipelined mode does not support distributed training.")
         self.empirical_normalization = self.cfg["empirical_normalization"]
         if self.empirical_normalization:
-            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(self.device)
-            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(self.device)
+            self.obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs_single_timestep], until=1.0e8, distributed=self.is_distributed
+            ).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs_single_timestep], until=1.0e8, distributed=self.is_distributed
+            ).to(self.device)
         else:
             self.obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
             self.critic_obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
@@ -63,9 +93,12 @@ class OnPolicyRunner:
             self.env.num_envs,
             self.num_steps_per_env,
             [num_obs_history],
-            [num_critic_obs],
+            critic_obs_shape,
             [self.env.num_actions],
         )
+        if self.is_distributed:
+            # all ranks start from the parameters of rank 0
+            self.alg.broadcast_parameters()
 
         # Log
         self.log_dir = log_dir
@@ -77,25 +110,8 @@ class OnPolicyRunner:
 
     def learn(self, num_learning_iterations: int, init_at_random_ep_len: bool = False):
         # initialize writer
-        if self.log_dir is not None and self.writer is None:
-            # Launch either Tensorboard or Neptune & Tensorboard summary writer(s), default: Tensorboard.
-            self.logger_type = self.cfg.get("logger", "tensorboard")
-            self.logger_type = self.logger_type.lower()
-
-            if self.logger_type == "neptune":
-                from rsl_rl.utils.neptune_utils import NeptuneSummaryWriter
-
-                self.writer = NeptuneSummaryWriter(log_dir=self.log_dir, flush_secs=10, cfg=self.cfg)
-                self.writer.log_config(self.env.cfg, self.cfg, self.alg_cfg, self.policy_cfg)
-            elif self.logger_type == "wandb":
-                from rsl_rl.utils.wandb_utils import WandbSummaryWriter
-
-                self.writer = WandbSummaryWriter(log_dir=self.log_dir, flush_secs=10, cfg=self.cfg)
-                self.writer.log_config(self.env.cfg, self.cfg, self.alg_cfg, self.policy_cfg)
-            elif self.logger_type == "tensorboard":
-                self.writer = TensorboardSummaryWriter(log_dir=self.log_dir, flush_secs=10)
-            else:
-                raise AssertionError("logger type not found")
+        if self.log_dir is not None and self.writer is None and not self.disable_logs:
+            self._init_writer(self.env.cfg)
 
         if init_at_random_ep_len:
             self.env.episode_length_buf = torch.randint_like(
@@ -114,15 +130,27 @@ class OnPolicyRunner:
         cur_reward_sum = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
         cur_episode_length = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
 
-        start_iter = self.current_learning_iteration
-        tot_iter = start_iter + num_learning_iterations
-        for it in range(start_iter, tot_iter):
+        finished_episodes = []
+
+        def flush_episodes():
+            """Moves the returns and lengths of the finished episodes to the buffers, this syncs with the device."""
+            for done_mask, reward_sum, episode_length in finished_episodes:
+                rewbuffer.extend(reward_sum[done_mask].cpu().numpy().tolist())
+                lenbuffer.extend(episode_length[done_mask].cpu().numpy().tolist())
+            finished_episodes.clear()
+
+        def collect(alg: PPO) -> float:
+            """Collects a rollout into the storage of `alg`, computes its returns and returns the collection time."""
+            nonlocal obs_history, critic_obs, cur_reward_sum, cur_episode_length
             start = time.time()
             # Rollout
             with torch.inference_mode():
                 for i in range(self.num_steps_per_env):
-                    actions = self.alg.act(obs_history, critic_obs)
-                    obs, rewards, dones, infos = self.env.step(actions.to(self.env.device))
+                    actions = alg.act(obs_history, critic_obs)
+                    self.env.step_async(actions.to(self.env.device))
+                    # the host transfers of the book keeping overlap the simulation
+                    flush_episodes()
+                    obs, rewards, dones, infos = self.env.step_wait()
 
                     # move to the right device
                     obs, critic_obs, rewards, dones = (
@@ -133,8 +161,7 @@ class OnPolicyRunner:
                     )
                     # perform normalization
                     obs = self.obs_normalizer(obs)
-                    if dones.any():
-                        self.obs_history_storage.reset(dones)
+                    self.obs_history_storage.reset(dones)
                     self.obs_history_storage.add(obs)
                     obs_history = self.obs_history_storage.get()
 
@@ -143,7 +170,7 @@ class OnPolicyRunner:
                     else:
                         critic_obs = obs_history
                     # process the step
-                    self.alg.process_env_step(rewards, dones, infos)
+                    alg.process_env_step(rewards, dones, infos)
 
                     if self.log_dir is not None:
                         # Book keeping
@@ -155,29 +182,45 @@ class OnPolicyRunner:
                             ep_infos.append(infos["log"])
                         cur_reward_sum += rewards
                         cur_episode_length += 1
-                        new_ids = (dones > 0).nonzero(as_tuple=False)
-                        rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
-                        lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
-                        cur_reward_sum[new_ids] = 0
-                        cur_episode_length[new_ids] = 0
-
-                stop = time.time()
-                collection_time = stop - start
-
-                # Learning step
-                start = stop
-                self.alg.compute_returns(critic_obs)
-
-            mean_value_loss, mean_surrogate_loss = self.alg.update()
-            stop = time.time()
-            learn_time = stop - start
+                        done_mask = dones > 0
+                        finished_episodes.append((done_mask, cur_reward_sum.clone(), cur_episode_length.clone()))
+                        cur_reward_sum.masked_fill_(done_mask, 0)
+                        cur_episode_length.masked_fill_(done_mask, 0)
+
+                flush_episodes()
+                alg.compute_returns(critic_obs)
+            return time.time() - start
+
+        start_iter = self.current_learning_iteration
+        tot_iter = start_iter + num_learning_iterations
+        if self.policy_lag:
+            # the first rollout of the pipeline is collected with the current policy
+            collector = self._make_collector()
+            collect(collector)
+            self.alg.storage, collector.storage = collector.storage, self.alg.storage
+            executor = ThreadPoolExecutor(max_workers=1)
+        for it in range(start_iter, tot_iter):
+            start = time.time()
+            if self.policy_lag:
+                # the next rollout is collected with the current policy while the learner updates on the previous one
+                collector.actor_critic.load_state_dict(self.alg.actor_critic.state_dict())
+                rollout = executor.submit(collect, collector) if it < tot_iter - 1 else None
+                mean_value_loss, mean_surrogate_loss = self.alg.update()
+                learn_time = time.time() - start
+                collection_time = rollout.result() if rollout is not None else 0.0
+                self.alg.storage, collector.storage = collector.storage, self.alg.storage
+            else:
+                collection_time = collect(self.alg)
+                mean_value_loss, mean_surrogate_loss = self.alg.update()
+                learn_time = time.time() - start - collection_time
+            iteration_time = time.time() - start
             self.current_learning_iteration = it
-            if self.log_dir is not None:
+            if self.log_dir is not None and not self.disable_logs:
                 self.log(locals())
-            if it % self.save_interval == 0:
+            if it % self.save_interval == 0 and not self.disable_logs:
                 self.save(os.path.join(self.log_dir, f"model_{it}.pt"))
             ep_infos.clear()
-            if it == start_iter:
+            if it == start_iter and not self.disable_logs:
                 # obtain all the diff files
                 git_file_paths = store_code_state(self.log_dir, self.git_status_repos)
                 # if possible store them to wandb
@@ -185,12 +228,39 @@ class OnPolicyRunner:
                     for path in git_file_paths:
                         self.writer.save_file(path)
 
-        self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
+        if self.policy_lag:
+            executor.shutdown()
+        if not self.disable_logs:
+            self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
+
+    def _init_writer(self, env_cfg):
+        # Launch either Tensorboard or Neptune & Tensorboard summary writer(s), default: Tensorboard.
+        self.logger_type = self.cfg.get("logger", "tensorboard")
+        self.logger_type = self.logger_type.lower()
+
+        if self.logger_type == "neptune":
+            from rsl_rl.utils.neptune_utils import NeptuneSummaryWriter
+
+            self.writer = NeptuneSummaryWriter(log_dir=self.log_dir, flush_secs=10, cfg=self.cfg)
+            self.writer.log_config(env_cfg, self.cfg, self.alg_cfg, self.policy_cfg)
+        elif self.logger_type == "wandb":
+            from rsl_rl.utils.wandb_utils import WandbSummaryWriter
+
+            self.writer = WandbSummaryWriter(log_dir=self.log_dir, flush_secs=10, cfg=self.cfg)
+            self.writer.log_config(env_cfg, self.cfg, self.alg_cfg, self.policy_cfg)
+        elif self.logger_type == "tensorboard":
+            from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
+
+            self.writer = TensorboardSummaryWriter(log_dir=self.log_dir, flush_secs=10)
+        else:
+            raise AssertionError("logger type not found")
 
     def log(self, locs: dict, width: int = 80, pad: int = 35):
-        self.tot_timesteps += self.num_steps_per_env * self.env.num_envs
-        self.tot_time += locs["collection_time"] + locs["learn_time"]
-        iteration_time = locs["collection_time"] + locs["learn_time"]
+        # every rank collects the same number of steps
+        self.tot_timesteps += self.num_steps_per_env * self.alg.storage.num_envs * self.world_size
+        # with a policy lag the collection overlaps the update, the iteration time is measured
+        iteration_time = locs["iteration_time"]
+        self.tot_time += iteration_time
 
         ep_string = ""
         if locs["ep_infos"]:
@@ -214,11 +284,12 @@ class OnPolicyRunner:
                     self.writer.add_scalar("Episode/" + key, value, locs["it"])
                     ep_string += f"""{f'Mean episode {key}:':>{pad}} {value:.4f}\n"""
         mean_std = self.alg.actor_critic.std.mean()
-        fps = int(self.num_steps_per_env * self.env.num_envs / (locs["collection_time"] + locs["learn_time"]))
+        fps = int(self.num_steps_per_env * self.alg.storage.num_envs * self.world_size / iteration_time)
 
         self.writer.add_scalar("Loss/value_function", locs["mean_value_loss"], locs["it"])
         self.writer.add_scalar("Loss/surrogate", locs["mean_surrogate_loss"], locs["it"])
         self.writer.add_scalar("Loss/learning_rate", self.alg.learning_rate, locs["it"])
+        self.writer.add_scalar("Loss/learning_epochs", self.alg.num_learning_epochs_run, locs["it"])
         self.writer.add_scalar("Policy/mean_noise_std", mean_std.item(), locs["it"])
         self.writer.add_scalar("Perf/total_fps", fps, locs["it"])
         self.writer.add_scalar("Perf/collection time", locs["collection_time"], locs["it"])
@@ -241,6 +312,7 @@ class OnPolicyRunner:
                 f"""{"Computation:":>{pad}} {fps:.0f} steps/s (collection: {locs["collection_time"]:.3f}s, learning {locs["learn_time"]:.3f}s)\n"""
                 f"""{"Value function loss:":>{pad}} {locs["mean_value_loss"]:.4f}\n"""
                 f"""{"Surrogate loss:":>{pad}} {locs["mean_surrogate_loss"]:.4f}\n"""
+                f"""{"Learning epochs:":>{pad}} {self.alg.num_learning_epochs_run}\n"""
                 f"""{"Mean action noise std:":>{pad}} {mean_std.item():.2f}\n"""
                 f"""{"Mean reward:":>{pad}} {statistics.mean(locs["rewbuffer"]):.2f}\n"""
                 f"""{"Mean episode length:":>{pad}} {statistics.mean(locs["lenbuffer"]):.2f}\n"""
@@ -254,6 +326,7 @@ class OnPolicyRunner:
                 f"""{"Computation:":>{pad}} {fps:.0f} steps/s (collection: {locs["collection_time"]:.3f}s, learning {locs["learn_time"]:.3f}s)\n"""
                 f"""{"Value function loss:":>{pad}} {locs["mean_value_loss"]:.4f}\n"""
                 f"""{"Surrogate loss:":>{pad}} {locs["mean_surrogate_loss"]:.4f}\n"""
+                f"""{"Learning epochs:":>{pad}} {self.alg.num_learning_epochs_run}\n"""
                 f"""{"Mean action noise std:":>{pad}} {mean_std.item():.2f}\n"""
             )
             #   f"""{'Mean reward/step:':>{pad}} {locs['mean_reward']:.2f}\n"""
@@ -308,6 +381,17 @@ class OnPolicyRunner:
             policy = lambda x: self.alg.actor_critic.act_inference(self.obs_normalizer(x))  # noqa: E731
         return policy
 
+    def _make_collector(self) -> PPO:
+        """Returns a view of the algorithm that collects rollouts with a snapshot of the policy into a second storage.
+
+        The collector shares the hyperparameters of the algorithm, the learner keeps the optimizer and the parameters.
+        """
+        collector = copy.copy(self.alg)
+        collector.actor_critic = copy.deepcopy(self.alg.actor_critic)
+        collector.storage = copy.deepcopy(self.alg.storage)
+        collector.transition = RolloutStorage.Transition()
+        return collector
+
     def train_mode(self):
         self.alg.actor_critic.train()
         if self.empirical_normalization:
@@ -0,0 +1,430 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import os
+import queue
+import time
+import torch
+import torch.multiprocessing as mp
+from collections import deque
+from typing import Callable
+
+import rsl_rl
+from rsl_rl.algorithms import PPO  # noqa: F401
+from rsl_rl.env import VecEnv
+from rsl_rl.modules import ActorCritic, ActorCriticPopulation, ActorCriticRecurrent, EmpiricalNormalization  # noqa: F401
+from rsl_rl.runners.on_policy_runner import OnPolicyRunner
+from rsl_rl.storage import ObservationHistoryStorage
+from rsl_rl.utils import store_code_state
+
+
+class WorkerLearnerRunner(OnPolicyRunner):
+    """On-policy runner with rollout workers in separate processes and a learner that trains on their fragments.
+
+    Every worker builds its environment with `env_fn(worker_id)`, steps it with its own copy of the policy and sends
+    fragments of `num_steps_per_env` transitions to the learner through a bounded queue. The learner assembles
+    `fragments_per_update` fragments into the rollout storage, updates the policy and publishes the new weights in
+    shared memory, from where the workers reload them before their next fragment. Collection and learning overlap, so
+    a fragment may have been collected by a policy some updates older than the one being trained.
+
+    The staleness is corrected with V-trace: the learner evaluates the current policy on the fragments and computes the
+    value targets and the policy-gradient advantages with the importance ratios to the behavior policy truncated at
+    `vtrace_clip_rho` and `vtrace_clip_c` (see `RolloutStorage.compute_vtrace_returns`). The log-probabilities, means
+    and standard deviations of the behavior policy stay in the storage, so the PPO ratio is the importance ratio to
+    the policy that collected the fragment and the clipping and the adaptive KL schedule bound the update relative to
+    it. The rewards of time outs are bootstrapped with the values of the current critic as well, the workers only report
+    the time outs. The mean number of updates by which the fragments lag behind is logged as `Perf/policy_lag`.
+
+    The workers run on the CPU with a spawn context, `env_fn` must therefore be picklable (a module-level function or a
+    `functools.partial` of one). Recurrent policies and populations are not supported. Call `close()` to stop the
+    workers.
+    """
+
+    def __init__(
+        self,
+        env_fn: Callable[[int], VecEnv],
+        train_cfg,
+        num_workers=2,
+        log_dir=None,
+        device="cpu",
+    ):
+        self.cfg = train_cfg
+        self.alg_cfg = train_cfg["algorithm"]
+        self.policy_cfg = train_cfg["policy"]
+        self.device = device
+        # a single learner, it logs and saves the checkpoints
+        self.rank, self.world_size = 0, 1
+        self.is_distributed = False
+        self.disable_logs = False
+        self.num_steps_per_env = self.cfg["num_steps_per_env"]
+        self.save_interval = self.cfg["save_interval"]
+        self.empirical_normalization = self.cfg["empirical_normalization"]
+        self.num_workers = num_workers
+        # number of fragments per update, more fragments than workers let the workers run ahead of the learner
+        self.fragments_per_update = self.cfg.get("fragments_per_update", num_workers)
+        self.clip_rho = self.cfg.get("vtrace_clip_rho", 1.0)
+        self.clip_c = self.cfg.get("vtrace_clip_c", 1.0)
+
+        # start the workers, the queue holds at most one update worth of fragments
+        context = mp.get_context("spawn")
+        self.fragment_queue = context.Queue(maxsize=self.fragments_per_update)
+        self.weights_queues = [context.Queue() for _ in range(num_workers)]
+        self.weights_lock = context.Lock()
+        self.weights_version = context.Value("l", 0)
+        self.stop_event = context.Event()
+        self.workers = [
+            context.Process(
+                target=_rollout_worker,
+                args=(
+                    worker_id,
+                    env_fn,
+                    dict(self.policy_cfg),
+                    self.num_steps_per_env,
+                    self.fragment_queue,
+                    self.weights_queues[worker_id],
+                    self.weights_lock,
+                    self.weights_version,
+                    self.stop_event,
+                ),
+                daemon=True,
+            )
+            for worker_id in range(num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        # the workers report the dimensions of their environments
+        specs = [self._get_from_workers() for _ in range(num_workers)]
+        spec = specs[0]
+        if any(other["num_envs"] != spec["num_envs"] for other in specs):
+            self.close()
+            raise ValueError(
+                f"The workers must step the same number of environments, got {[s['num_envs'] for s in specs]}."
+            )
+        self.env_cfg = spec["env_cfg"]
+        num_obs_single_timestep = spec["num_obs"]
+        num_obs_history = spec["num_obs_history"]
+        if spec["num_critic_obs"] is not None:
+            num_critic_obs = spec["num_critic_obs"]
+            critic_obs_shape = [num_critic_obs]
+        else:
+            num_critic_obs = num_obs_history
+            critic_obs_shape = [None]  # the critic uses the actor observations, no separate storage
+
+        actor_critic_class = eval(self.policy_cfg.pop("class_name"))  # ActorCritic
+        actor_critic: ActorCritic = actor_critic_class(
+            num_obs_history, num_critic_obs, spec["num_actions"], **self.policy_cfg
+        ).to(self.device)
+        if actor_critic.is_recurrent or isinstance(actor_critic, ActorCriticPopulation):
+            self.close()
+            raise ValueError("The worker-learner runner does not support recurrent policies or populations.")
+        alg_class = eval(self.alg_cfg.pop("class_name"))  # PPO
+        self.alg: PPO = alg_class(actor_critic, device=self.device, **self.alg_cfg)
+        if self.empirical_normalization:
+            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_obs_single_timestep], until=1.0e8).to(
+                self.device
+            )
+        else:
+            self.obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
+            self.critic_obs_normalizer = torch.nn.Identity().to(self.device)  # no normalization
+        # init storage and model
+        self.alg.init_storage(
+            self.fragments_per_update * spec["num_envs"],
+            self.num_steps_per_env,
+            [num_obs_history],
+            critic_obs_shape,
+            [spec["num_actions"]],
+        )
+
+        # the weights are shared with the workers once and then updated in place
+        self.shared_state = {
+            name: {key: value.detach().cpu().clone().share_memory_() for key, value in module.state_dict().items()}
+            for name, module in self._policy_modules().items()
+        }
+        for weights_queue in self.weights_queues:
+            weights_queue.put(self.shared_state)
+        self._publish_weights()
+
+        # Log
+        self.log_dir = log_dir
+        self.writer = None
+        self.tot_timesteps = 0
+        self.tot_time = 0
+        self.current_learning_iteration = 0
+        self.git_status_repos = [rsl_rl.__file__]
+
+    def learn(self, num_learning_iterations: int, init_at_random_ep_len: bool = False):
+        # initialize writer
+        if self.log_dir is not None and self.writer is None:
+            self._init_writer(self.env_cfg)
+        if init_at_random_ep_len:
+            print("WorkerLearnerRunner: the workers own the environments, `init_at_random_ep_len` is ignored.")
+        self.train_mode()  # switch to train mode (for dropout for example)
+
+        ep_infos = []
+        rewbuffer = deque(maxlen=100)
+        lenbuffer = deque(maxlen=100)
+
+        start_iter = self.current_learning_iteration
+        tot_iter = start_iter + num_learning_iterations
+        for it in range(start_iter, tot_iter):
+            start = time.time()
+            # the learner waits for the fragments, the workers collect in the meantime
+            fragments = [self._get_from_workers() for _ in range(self.fragments_per_update)]
+            collection_time = time.time() - start
+            with torch.inference_mode():
+                policy_lag = self._assemble_rollout(fragments)
+            mean_value_loss, mean_surrogate_loss = self.alg.update()
+            self._publish_weights()
+            iteration_time = time.time() - start
+            learn_time = iteration_time - collection_time
+            for fragment in fragments:
+                rewbuffer.extend(fragment["episode_returns"])
+                lenbuffer.extend(fragment["episode_lengths"])
+                ep_infos.extend(fragment["ep_infos"])
+            self.current_learning_iteration = it
+            if self.log_dir is not None:
+                self.log(locals())
+                self.writer.add_scalar("Perf/policy_lag", policy_lag, it)
+            if it % self.save_interval == 0:
+                self.save(os.path.join(self.log_dir, f"model_{it}.pt"))
+            ep_infos.clear()
+            if it == start_iter:
+                # obtain all the diff files
+                git_file_paths = store_code_state(self.log_dir, self.git_status_repos)
+                # if possible store them to wandb
+                if self.logger_type in ["wandb", "neptune"] and git_file_paths:
+                    for path in git_file_paths:
+                        self.writer.save_file(path)
+
+        self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
+
+    def close(self):
+        """Stops the workers."""
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+
+    def _policy_modules(self) -> dict[str, torch.nn.Module]:
+        """Returns the modules the workers need to act: the policy and the observation normalizers."""
+        modules = {"actor_critic": self.alg.actor_critic}
+        if self.empirical_normalization:
+            modules["obs_normalizer"] = self.obs_normalizer
+            modules["critic_obs_normalizer"] = self.critic_obs_normalizer
+        return modules
+
+    def _publish_weights(self):
+        """Copies the weights into the shared memory of the workers and increments their version."""
+        with self.weights_lock:
+            for name, module in self._policy_modules().items():
+                for key, value in module.state_dict().items():
+                    self.shared_state[name][key].copy_(value)
+            self.weights_version.value += 1
+
+    def _get_from_workers(self):
+        """Returns the next message of the workers, raises if a worker died instead of waiting forever."""
+        while True:
+            try:
+                return self.fragment_queue.get(timeout=1.0)
+            except queue.Empty:
+                for worker_id, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        self.close()
+                        raise RuntimeError(f"Rollout worker {worker_id} exited with code {worker.exitcode}.")
+
+    def _assemble_rollout(self, fragments: list[dict]) -> float:
+        """Copies the fragments into the storage and computes their V-trace targets and advantages.
+
+        Returns:
+            float: The mean number of updates by which the policies that collected the fragments lag behind.
+        """
+        storage = self.alg.storage
+        actor_critic = self.alg.actor_critic
+
+        def gather(key):
+            # the fragments are laid out side by side along the environment dimension
+            return torch.cat([fragment[key] for fragment in fragments], dim=1).to(self.device)
+
+        storage.observations.copy_(gather("observations"))
+        if storage.privileged_observations is not None:
+            storage.privileged_observations.copy_(gather("critic_observations"))
+        storage.actions.copy_(gather("actions"))
+        storage.dones.copy_(gather("dones").unsqueeze(-1))
+        # the behavior policy that collected the fragments is the reference of the PPO ratio and its clipping
+        storage.actions_log_prob.copy_(gather("actions_log_prob").unsqueeze(-1))
+        storage.mu.copy_(gather("action_mean"))
+        storage.sigma.copy_(gather("action_sigma"))
+        if self.empirical_normalization:
+            self.obs_normalizer.update(gather("raw_observations").flatten(0, 1))
+            if storage.privileged_observations is not None:
+                self.critic_obs_normalizer.update(gather("raw_critic_observations").flatten(0, 1))
+
+        # the current critic and the truncated importance weights of the current policy give the V-trace targets
+        observations = storage.observations.flatten(0, 1)
+        if storage.privileged_observations is not None:
+            critic_observations = storage.privileged_observations.flatten(0, 1)
+        else:
+            critic_observations = observations
+        _, values = actor_critic.act_and_evaluate(observations, critic_observations)
+        actions_log_prob = actor_critic.get_actions_log_prob(storage.actions.flatten(0, 1))
+        storage.values.copy_(values.view_as(storage.values))
+        # Bootstrapping on time outs, with the current critic like the V-trace targets
+        storage.rewards.copy_(gather("rewards").unsqueeze(-1))
+        storage.rewards.add_(self.alg.gamma * storage.values * gather("time_outs").unsqueeze(-1))
+        last_critic_observations = torch.cat([fragment["last_critic_observations"] for fragment in fragments])
+        last_values = actor_critic.evaluate(last_critic_observations.to(self.device))
+        storage.compute_vtrace_returns(
+            last_values,
+            self.alg.gamma,
+            self.alg.lam,
+            actions_log_prob.view_as(storage.actions_log_prob) - storage.actions_log_prob,
+            clip_rho=self.clip_rho,
+            clip_c=self.clip_c,
+        )
+        storage.step = self.num_steps_per_env
+
+        version = self.weights_version.value
+        return sum(version - fragment["version"] for fragment in fragments) / len(fragments)
+
+
+def _rollout_worker(
+    worker_id,
+    env_fn,
+    policy_cfg,
+    num_steps,
+    fragment_queue,
+    weights_queue,
+    weights_lock,
+    weights_version,
+    stop_event,
+):
+    """Steps an environment with the latest published policy and sends fragments of `num_steps` transitions."""
+    # the workers share the CPU with each other and the learner
+    torch.set_num_threads(1)
+    env = env_fn(worker_id)
+    obs, extras = env.get_observations()
+    obs = obs.cpu()
+    num_envs = obs.shape[0]
+    obs_history_storage = ObservationHistoryStorage(num_envs=num_envs, num_obs=obs.shape[1], max_length=5)
+    num_obs_history = obs_history_storage.get().shape[1]
+    has_critic_obs = "critic" in extras["observations"]
+    num_critic_obs = extras["observations"]["critic"].shape[1] if has_critic_obs else None
+    fragment_queue.put(
+        {
+            "num_envs": num_envs,
+            "num_obs": obs.shape[1],
+            "num_obs_history": num_obs_history,
+            "num_critic_obs": num_critic_obs,
+            "num_actions": env.num_actions,
+            "env_cfg": getattr(env, "cfg", None),
+        }
+    )
+
+    # build the policy and receive the shared weights of the learner
+    shared_state = weights_queue.get()
+    actor_critic_class = eval(policy_cfg.pop("class_name"))
+    actor_critic = actor_critic_class(
+        num_obs_history, num_critic_obs or num_obs_history, env.num_actions, **policy_cfg
+    ).eval()
+    if "obs_normalizer" in shared_state:
+        obs_normalizer = EmpiricalNormalization(shape=[obs.shape[1]], until=1.0e8).eval()
+        critic_obs_normalizer = EmpiricalNormalization(shape=[obs.shape[1]], until=1.0e8).eval()
+    else:
+        obs_normalizer = critic_obs_normalizer = torch.nn.Identity()
+    modules = {
+        "actor_critic": actor_critic,
+        "obs_normalizer": obs_normalizer,
+        "critic_obs_normalizer": critic_obs_normalizer,
+    }
+    version = -1
+
+    cur_reward_sum = torch.zeros(num_envs)
+    cur_episode_length = torch.zeros(num_envs)
+    raw_critic_obs = extras["observations"]["critic"].cpu() if has_critic_obs else None
+    with torch.inference_mode():
+        while not stop_event.is_set():
+            if weights_version.value != version:
+                with weights_lock:
+                    for name, state in shared_state.items():
+                        modules[name].load_state_dict(state)
+                    if version < 0:
+                        obs_history_storage.add(obs_normalizer(obs))
+                    version = weights_version.value
+            obs_history = obs_history_storage.get()
+            critic_obs = critic_obs_normalizer(raw_critic_obs) if has_critic_obs else obs_history
+
+            # fresh tensors for every fragment, the learner maps their memory
+            fragment = {
+                "observations": torch.zeros(num_steps, num_envs, num_obs_history),
+                "raw_observations": torch.zeros(num_steps, num_envs, obs.shape[1]),
+                "actions": torch.zeros(num_steps, num_envs, env.num_actions),
+                "actions_log_prob": torch.zeros(num_steps, num_envs),
+                "action_mean": torch.zeros(num_steps, num_envs, env.num_actions),
+                "action_sigma": torch.zeros(num_steps, num_envs, env.num_actions),
+                "rewards": torch.zeros(num_steps, num_envs),
+                "dones": torch.zeros(num_steps, num_envs, dtype=torch.uint8),
+                "time_outs": torch.zeros(num_steps, num_envs),
+                "version": version,
+                "episode_returns": [],
+                "episode_lengths": [],
+                "ep_infos": [],
+            }
+            if has_critic_obs:
+                fragment["critic_observations"] = torch.zeros(num_steps, num_envs, num_critic_obs)
+                fragment["raw_critic_observations"] = torch.zeros(num_steps, num_envs, num_critic_obs)
+
+            for step in range(num_steps):
+                actions = actor_critic.act(obs_history)
+                fragment["observations"][step] = obs_history
+                if has_critic_obs:
+                    fragment["critic_observations"][step] = critic_obs
+                fragment["actions"][step] = actions
+                fragment["actions_log_prob"][step] = actor_critic.get_actions_log_prob(actions)
+                fragment["action_mean"][step] = actor_critic.action_mean
+                fragment["action_sigma"][step] = actor_critic.action_std
+
+                obs, rewards, dones, infos = env.step(actions.to(env.device))
+                obs, rewards, dones = obs.cpu(), rewards.cpu(), dones.cpu()
+                fragment["raw_observations"][step] = obs
+                obs_history_storage.reset(dones)
+                obs_history_storage.add(obs_normalizer(obs))
+                obs_history = obs_history_storage.get()
+                if has_critic_obs:
+                    raw_critic_obs = infos["observations"]["critic"].cpu()
+                    fragment["raw_critic_observations"][step] = raw_critic_obs
+                    critic_obs = critic_obs_normalizer(raw_critic_obs)
+                else:
+                    critic_obs = obs_history
+
+                # the learner bootstraps the time outs with its critic
+                fragment["rewards"][step] = rewards
+                if "time_outs" in infos:
+                    fragment["time_outs"][step] = infos["time_outs"].cpu()
+                fragment["dones"][step] = dones
+
+                # Book keeping
+                if "episode" in infos:
+                    fragment["ep_infos"].append(infos["episode"])
+                elif "log" in infos:
+                    fragment["ep_infos"].append(infos["log"])
+                cur_reward_sum += rewards
+                cur_episode_length += 1
+                new_ids = (dones > 0).nonzero(as_tuple=False)[:, 0]
+                fragment["episode_returns"].extend(cur_reward_sum[new_ids].tolist())
+                fragment["episode_lengths"].extend(cur_episode_length[new_ids].tolist())
+                cur_reward_sum[new_ids] = 0
+                cur_episode_length[new_ids] = 0
+            fragment["last_critic_observations"] = critic_obs.clone()
+
+            # the queue is bounded, the worker waits for the learner unless it is stopped
+            while not stop_event.is_set():
+                try:
+                    fragment_queue.put(fragment, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
@@ -59,6 +59,5 @@ class ObservationHistoryStorage:
         Args:
             done (torch.Tensor): mask of dones.
         """
-
-        done_indices = torch.nonzero(done == 1)
-        self.buffer[done_indices] = 0.0
+        # masked in place, without synchronizing with the device to find the indices
+        self.buffer.masked_fill_(done.view(-1, 1) == 1, 0.0)
@@ -21,7 +21,6 @@ class RolloutStorage:
             self.actions_log_prob = None
             self.action_mean = None
             self.action_sigma = None
-            self.hidden_states = None
 
         def clear(self):
             self.__init__()
@@ -75,10 +74,14 @@ class RolloutStorage:
         self.actions_log_prob[self.step].copy_(transition.actions_log_prob.view(-1, 1))
         self.mu[self.step].copy_(transition.action_mean)
         self.sigma[self.step].copy_(transition.action_sigma)
-        self._save_hidden_states(transition.hidden_states)
         self.step += 1
 
-    def _save_hidden_states(self, hidden_states):
+    def add_hidden_states(self, hidden_states):
+        """Copy the hidden states of the memories before the step into the storage.
+
+        The memories update their hidden states in place, they are therefore copied before the actions are computed.
+        Hidden states that are not yet allocated are zero, as is the storage.
+        """
         if hidden_states is None or hidden_states == (None, None):
             return
         # make a tuple out of GRU hidden state sto match the LSTM format
@@ -117,6 +120,38 @@ class RolloutStorage:
         self.advantages = self.returns - self.values
         self.advantages = (self.advantages - self.advantages.mean()) / (self.advantages.std() + 1e-8)
 
+    def compute_vtrace_returns(self, last_values, gamma, lam, log_ratios, clip_rho=1.0, clip_c=1.0):
+        """Computes V-trace targets and advantages for transitions of an older behavior policy [Espeholt et al., 2018].
+
+        The values must be those of the current critic and `log_ratios` the log-probabilities of the stored actions
+        under the current policy minus those under the behavior policy. The importance ratios are truncated at
+        `clip_rho` in the temporal differences and at `clip_c` in their propagation, which is further discounted by
+        `lam`. The returns are the V-trace targets v_s, for transitions of the current policy they equal those of
+        `compute_returns`. The advantages are the V-trace policy-gradient advantages
+        rho_s * (r_s + gamma * v_{s+1} - V(s)).
+        """
+        ratios = torch.exp(log_ratios)
+        rhos = torch.clamp(ratios, max=clip_rho)
+        cs = lam * torch.clamp(ratios, max=clip_c)
+        vs_minus_values = 0
+        for step in reversed(range(self.num_transitions_per_env)):
+            if step == self.num_transitions_per_env - 1:
+                next_values = last_values
+                next_vs = last_values
+            else:
+                next_values = self.values[step + 1]
+                next_vs = self.returns[step + 1]
+            next_is_not_terminal = 1.0 - self.dones[step].float()
+            delta = rhos[step] * (self.rewards[step] + next_is_not_terminal * gamma * next_values - self.values[step])
+            vs_minus_values = delta + next_is_not_terminal * gamma * cs[step] * vs_minus_values
+            self.returns[step] = vs_minus_values + self.values[step]
+            self.advantages[step] = rhos[step] * (
+                self.rewards[step] + next_is_not_terminal * gamma * next_vs - self.values[step]
+            )
+
+        # Normalize the advantages
+        self.advantages = (self.advantages - self.advantages.mean()) / (self.advantages.std() + 1e-8)
+
     def get_statistics(self):
         done = self.dones
         done[-1] = 1
@@ -153,7 +188,67 @@ class RolloutStorage:
                 batch_idx = indices[start:end]
 
                 obs_batch = observations[batch_idx]
-                critic_observations_batch = critic_observations[batch_idx]
+                if self.privileged_observations is not None:
+                    critic_observations_batch = critic_observations[batch_idx]
+                else:
+                    # the actor and critic share their input (enables fused evaluation)
+                    critic_observations_batch = obs_batch
+                actions_batch = actions[batch_idx]
+                target_values_batch = values[batch_idx]
+                returns_batch = returns[batch_idx]
+                old_actions_log_prob_batch = old_actions_log_prob[batch_idx]
+                advantages_batch = advantages[batch_idx]
+                old_mu_batch = old_mu[batch_idx]
+                old_sigma_batch = old_sigma[batch_idx]
+                yield obs_batch, critic_observations_batch, actions_batch, target_values_batch, advantages_batch, returns_batch, old_actions_log_prob_batch, old_mu_batch, old_sigma_batch, (
+                    None,
+                    None,
+                ), None
+
+    # for populations only
+    def population_mini_batch_generator(self, population_size, num_mini_batches, num_epochs=8):
+        """Yields mini-batches holding the same number of samples of every member's environments.
+
+        The environments are partitioned into contiguous blocks, one per member. Every mini-batch is ordered by
+        member, as expected by `ActorCriticPopulation`.
+        """
+        member_batch_size = self.num_envs // population_size * self.num_transitions_per_env
+        mini_batch_size = member_batch_size // num_mini_batches
+        indices = torch.rand(population_size, member_batch_size, device=self.device).argsort(dim=1)
+        indices = indices[:, : num_mini_batches * mini_batch_size]
+        # absolute sample indices of the (time, env) flattened member blocks
+        offsets = torch.arange(population_size, device=self.device).unsqueeze(1) * member_batch_size
+
+        def member_major(x):
+            # (time, env, ...) -> (member, time * member_env, ...) -> (member * time * member_env, ...)
+            x = x.view(self.num_transitions_per_env, population_size, -1, *x.shape[2:]).transpose(0, 1)
+            return x.flatten(0, 2)
+
+        observations = member_major(self.observations)
+        if self.privileged_observations is not None:
+            critic_observations = member_major(self.privileged_observations)
+        else:
+            critic_observations = observations
+
+        actions = member_major(self.actions)
+        values = member_major(self.values)
+        returns = member_major(self.returns)
+        old_actions_log_prob = member_major(self.actions_log_prob)
+        advantages = member_major(self.advantages)
+        old_mu = member_major(self.mu)
+        old_sigma = member_major(self.sigma)
+
+        for epoch in range(num_epochs):
+            for i in range(num_mini_batches):
+                start = i * mini_batch_size
+                end = (i + 1) * mini_batch_size
+                batch_idx = (indices[:, start:end] + offsets).flatten()
+
+                obs_batch = observations[batch_idx]
+                if self.privileged_observations is not None:
+                    critic_observations_batch = critic_observations[batch_idx]
+                else:
+                    critic_observations_batch = obs_batch
                 actions_batch = actions[batch_idx]
                 target_values_batch = values[batch_idx]
                 returns_batch = returns[batch_idx]
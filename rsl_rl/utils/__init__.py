@@ -3,4 +3,42 @@
 
 """Helper functions."""
 
-from .utils import split_and_pad_trajectories, store_code_state, unpad_trajectories
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .exporter import export_policy_as_jit, export_policy_as_onnx, export_policy_as_quantized_jit
+    from .utils import init_distributed, split_and_pad_trajectories, store_code_state, unpad_trajectories
+
+__all__ = [
+    "export_policy_as_jit",
+    "export_policy_as_onnx",
+    "export_policy_as_quantized_jit",
+    "init_distributed",
+    "split_and_pad_trajectories",
+    "store_code_state",
+    "unpad_trajectories",
+]
+
+# helpers are imported on first access (PEP 562)
+_LAZY_ATTRIBUTES = {
+    "export_policy_as_jit": ".exporter",
+    "export_policy_as_onnx": ".exporter",
+    "export_policy_as_quantized_jit": ".exporter",
+    "init_distributed": ".utils",
+    "split_and_pad_trajectories": ".utils",
+    "store_code_state": ".utils",
+    "unpad_trajectories": ".utils",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -0,0 +1,346 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import copy
+import inspect
+import os
+import time
+import torch
+from torch import nn
+
+from rsl_rl.modules.actor_critic import ActorFreq
+from rsl_rl.modules.normalizer import EmpiricalNormalization
+from rsl_rl.storage.obs_history_storage import ObservationHistoryStorage
+
+
+def export_policy_as_jit(
+    actor_critic, normalizer, path, filename="policy.pt", history_length=5, verify=True
+):
+    """Export the policy as a single TorchScript module for deployment.
+
+    The exported module takes the raw single-step observation of shape (1, num_obs). It keeps the observation
+    history as internal state and applies the observation normalization through the folded weights of the actor's
+    input layers. Call `reset()` on the module when an episode restarts.
+
+    Args:
+        actor_critic (ActorCritic): The trained actor-critic.
+        normalizer (EmpiricalNormalization | nn.Identity | None): The observation normalizer used during training.
+        path (str): Directory to write the file into.
+        filename (str): Name of the exported file.
+        history_length (int): Number of stacked observation steps the policy was trained with.
+        verify (bool): Whether to check the exported module against the training-time inference path.
+
+    Returns:
+        str: The path of the exported file.
+    """
+    exporter = _TorchPolicyExporter(actor_critic, normalizer, history_length)
+    scripted = torch.jit.script(exporter)
+    if verify:
+        _verify_parity(
+            lambda obs, history: (scripted(obs), history),
+            actor_critic,
+            normalizer,
+            history_length,
+            reset=scripted.reset,
+        )
+        scripted.reset()
+    os.makedirs(path, exist_ok=True)
+    filepath = os.path.join(path, filename)
+    scripted.save(filepath)
+    return filepath
+
+
+def export_policy_as_onnx(
+    actor_critic, normalizer, path, filename="policy.onnx", history_length=5, verify=True
+):
+    """Export the policy as a single ONNX model for deployment.
+
+    ONNX models are stateless, the observation history is therefore an explicit input and output of the model:
+    `actions, next_obs_history = model(obs, obs_history)`. The history is initialized (and reset) with zeros,
+    it holds the observations relative to the normalizer's mean.
+
+    Args:
+        actor_critic (ActorCritic): The trained actor-critic.
+        normalizer (EmpiricalNormalization | nn.Identity | None): The observation normalizer used during training.
+        path (str): Directory to write the file into.
+        filename (str): Name of the exported file.
+        history_length (int): Number of stacked observation steps the policy was trained with.
+        verify (bool): Whether to check the exported model against the training-time inference path. The model
+            is run with onnxruntime if it is installed, otherwise the module is checked before tracing.
+
+    Returns:
+        str: The path of the exported file.
+    """
+    exporter = _OnnxPolicyExporter(actor_critic, normalizer, history_length)
+    os.makedirs(path, exist_ok=True)
+    filepath = os.path.join(path, filename)
+    obs = torch.zeros(1, exporter.num_obs)
+    obs_history = torch.zeros(1, exporter.num_obs * history_length)
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+    torch.onnx.export(
+        exporter,
+        (obs, obs_history),
+        filepath,
+        export_params=True,
+        opset_version=11,
+        input_names=["obs", "obs_history"],
+        output_names=["actions", "next_obs_history"],
+        dynamic_axes={},
+        **export_kwargs,
+    )
+    if verify:
+        try:
+            import onnxruntime
+        except ModuleNotFoundError:
+            _verify_parity(exporter, actor_critic, normalizer, history_length)
+        else:
+            session = onnxruntime.InferenceSession(filepath, providers=["CPUExecutionProvider"])
+
+            def policy(obs, history):
+                actions, history = session.run(None, {"obs": obs.numpy(), "obs_history": history.numpy()})
+                return torch.from_numpy(actions), torch.from_numpy(history)
+
+            _verify_parity(policy, actor_critic, normalizer, history_length)
+    return filepath
+
+
+def export_policy_as_quantized_jit(
+    actor_critic,
+    normalizer,
+    path,
+    filename="policy_int8.pt",
+    history_length=5,
+    quantize=True,
+    prune_amount=0.0,
+    eval_obs=None,
+    num_latency_steps=1000,
+):
+    """Export a compressed policy as a single TorchScript module for onboard CPU inference.
+
+    This is a post-training step: load a checkpoint with `OnPolicyRunner.load` and pass the runner's actor-critic
+    and observation normalizer. The exported module has the same interface as the one of `export_policy_as_jit`.
+    The linear layers of the actor are optionally pruned by removing the hidden units with the smallest weight norm
+    and dynamically quantized to int8 (`torch.ao.quantization.quantize_dynamic`).
+
+    The returned report holds the action error of the compressed policy with respect to the training-time policy
+    on held-out observations and the p50/p99 latency for batch size 1 of both the float and the compressed module.
+
+    Args:
+        actor_critic (ActorCritic): The trained actor-critic.
+        normalizer (EmpiricalNormalization | nn.Identity | None): The observation normalizer used during training.
+        path (str): Directory to write the file into.
+        filename (str): Name of the exported file.
+        history_length (int): Number of stacked observation steps the policy was trained with.
+        quantize (bool): Whether to quantize the linear layers to int8.
+        prune_amount (float): Fraction of the hidden units of every hidden layer to remove.
+        eval_obs (torch.Tensor | None): Held-out raw observation histories of shape
+            (num_samples, num_obs * history_length), e.g. recorded with `ObservationHistoryStorage` before
+            normalization. Defaults to samples from the normalizer's statistics.
+        num_latency_steps (int): Number of timed calls for the latency measurement.
+
+    Returns:
+        tuple[str, dict]: The path of the exported file and the report.
+    """
+    if not 0.0 <= prune_amount < 1.0:
+        raise ValueError(f"The pruning amount must be in [0, 1), got {prune_amount}.")
+    exporter = _TorchPolicyExporter(actor_critic, normalizer, history_length)
+    compressed = copy.deepcopy(exporter)
+    if prune_amount > 0.0:
+        compressed.actor = _prune_hidden_units(compressed.actor, prune_amount)
+    if quantize:
+        from torch.ao.quantization import quantize_dynamic
+
+        compressed = quantize_dynamic(compressed, {nn.Linear}, dtype=torch.qint8)
+
+    # action error on held-out observation histories, centered like the history buffer of the exporter
+    if eval_obs is None:
+        eval_obs = _sample_observation_histories(exporter.num_obs, normalizer, history_length)
+    eval_obs = eval_obs.detach().cpu().float()
+    obs_mean = exporter.obs_mean.repeat(1, history_length)
+    with torch.inference_mode():
+        expected = exporter.actor(eval_obs - obs_mean)
+        actions = compressed.actor(eval_obs - obs_mean)
+    action_error = (actions - expected).abs()
+
+    scripted = torch.jit.script(compressed)
+    latency_float = _measure_latency(torch.jit.script(exporter), exporter.num_obs, num_latency_steps)
+    latency = _measure_latency(scripted, exporter.num_obs, num_latency_steps)
+    scripted.reset()
+    report = {
+        "action_error_mean": action_error.mean().item(),
+        "action_error_max": action_error.max().item(),
+        "latency_p50_us": latency[0],
+        "latency_p99_us": latency[1],
+        "float_latency_p50_us": latency_float[0],
+        "float_latency_p99_us": latency_float[1],
+    }
+
+    os.makedirs(path, exist_ok=True)
+    filepath = os.path.join(path, filename)
+    scripted.save(filepath)
+    return filepath, report
+
+
+"""
+Helper classes and functions.
+"""
+
+
+class _TorchPolicyExporter(nn.Module):
+    """Policy with a stateful observation history and folded normalization, for TorchScript."""
+
+    def __init__(self, actor_critic, normalizer, history_length: int):
+        super().__init__()
+        self.actor, obs_mean = _fold_normalization(actor_critic, normalizer, history_length)
+        self.num_obs = obs_mean.shape[-1]
+        self.register_buffer("obs_mean", obs_mean.view(1, -1))
+        # history of observations relative to the mean, zeros correspond to the reset state during training
+        self.register_buffer("obs_history", torch.zeros(1, self.num_obs * history_length))
+
+    def forward(self, x):
+        self.obs_history.copy_(torch.cat([self.obs_history[:, self.num_obs :], x - self.obs_mean], dim=-1))
+        return self.actor(self.obs_history)
+
+    @torch.jit.export
+    def reset(self):
+        self.obs_history.zero_()
+
+
+class _OnnxPolicyExporter(nn.Module):
+    """Policy with the observation history as explicit state and folded normalization, for ONNX."""
+
+    def __init__(self, actor_critic, normalizer, history_length: int):
+        super().__init__()
+        self.actor, obs_mean = _fold_normalization(actor_critic, normalizer, history_length)
+        self.num_obs = obs_mean.shape[-1]
+        self.register_buffer("obs_mean", obs_mean.view(1, -1))
+
+    def forward(self, obs, obs_history):
+        obs_history = torch.cat([obs_history[:, self.num_obs :], obs - self.obs_mean], dim=-1)
+        return self.actor(obs_history), obs_history
+
+
+def _fold_normalization(actor_critic, normalizer, history_length):
+    """Returns a CPU copy of the actor whose input layers take mean-centered raw observation histories.
+
+    The division by the normalizer's std is folded into the weights of every linear layer reading the history.
+    """
+    if actor_critic.is_recurrent:
+        raise ValueError("Exporting recurrent policies is not supported.")
+    actor = copy.deepcopy(actor_critic.actor).cpu().eval()
+    input_layer = actor.actor_all[0] if isinstance(actor, ActorFreq) else actor[0]
+    if input_layer.in_features % history_length != 0:
+        raise ValueError(
+            f"The actor input ({input_layer.in_features}) is not a history of {history_length} observations."
+        )
+    num_obs = input_layer.in_features // history_length
+
+    if isinstance(normalizer, EmpiricalNormalization):
+        obs_mean = normalizer.mean.cpu()
+        obs_std = normalizer.std.cpu() + normalizer.eps
+    else:
+        obs_mean = torch.zeros(num_obs)
+        obs_std = torch.ones(num_obs)
+
+    with torch.no_grad():
+        input_layer.weight.div_(obs_std.repeat(history_length))
+        if isinstance(actor, ActorFreq):
+            # the frequency branch reads the commands of every history step
+            actor.actor_freq[0].weight.div_(obs_std.repeat(history_length)[actor.cmd_index.cpu()])
+    return actor, obs_mean
+
+
+def _verify_parity(policy, actor_critic, normalizer, history_length, reset=None, num_steps=50, atol=1e-4):
+    """Compares an exported policy with the training-time path (normalizer, history storage and actor).
+
+    Args:
+        policy (Callable): Maps `(obs, obs_history)` to `(actions, next_obs_history)`.
+        reset (Callable | None): Resets the internal state of stateful policies.
+    """
+    input_layer = actor_critic.actor.actor_all[0] if isinstance(actor_critic.actor, ActorFreq) else actor_critic.actor[0]
+    num_obs = input_layer.in_features // history_length
+    device = next(actor_critic.parameters()).device
+    normalizer = normalizer if normalizer is not None else nn.Identity()
+    was_training = actor_critic.training, normalizer.training
+    actor_critic.eval()
+    normalizer.eval()
+
+    history_storage = ObservationHistoryStorage(1, num_obs, history_length, device=device)
+    obs_history = torch.zeros(1, num_obs * history_length)
+    generator = torch.Generator().manual_seed(0)
+    max_error = 0.0
+    if reset is not None:
+        reset()
+    with torch.inference_mode():
+        for step in range(num_steps):
+            if step == num_steps // 2:
+                # check the reset semantics as well
+                history_storage.reset(torch.ones(1, device=device))
+                obs_history = torch.zeros_like(obs_history)
+                if reset is not None:
+                    reset()
+            obs = torch.randn(1, num_obs, generator=generator)
+            history_storage.add(normalizer(obs.to(device)))
+            expected = actor_critic.act_inference(history_storage.get()).cpu()
+            actions, obs_history = policy(obs, obs_history)
+            max_error = max(max_error, (actions - expected).abs().max().item())
+
+    actor_critic.train(was_training[0])
+    normalizer.train(was_training[1])
+    if max_error > atol:
+        raise RuntimeError(f"Exported policy deviates from the training-time policy (max error: {max_error}).")
+
+
+def _prune_hidden_units(actor, amount):
+    """Removes the given fraction of hidden units with the smallest L2 weight norm from every hidden layer.
+
+    The input and output dimensions of the actor are unchanged.
+    """
+    if isinstance(actor, ActorFreq):
+        actor.actor_all = _prune_hidden_units(actor.actor_all, amount)
+        actor.actor_freq = _prune_hidden_units(actor.actor_freq, amount)
+        return actor
+    layers = list(actor)
+    linear_indices = [index for index, layer in enumerate(layers) if isinstance(layer, nn.Linear)]
+    for index, next_index in zip(linear_indices[:-1], linear_indices[1:]):
+        layer, next_layer = layers[index], layers[next_index]
+        num_kept = max(1, round(layer.out_features * (1.0 - amount)))
+        kept = layer.weight.norm(dim=1).topk(num_kept).indices.sort().values
+        pruned = nn.Linear(layer.in_features, num_kept, bias=layer.bias is not None)
+        next_pruned = nn.Linear(num_kept, next_layer.out_features, bias=next_layer.bias is not None)
+        with torch.no_grad():
+            pruned.weight.copy_(layer.weight[kept])
+            next_pruned.weight.copy_(next_layer.weight[:, kept])
+            if layer.bias is not None:
+                pruned.bias.copy_(layer.bias[kept])
+            if next_layer.bias is not None:
+                next_pruned.bias.copy_(next_layer.bias)
+        layers[index], layers[next_index] = pruned, next_pruned
+    return nn.Sequential(*layers)
+
+
+def _sample_observation_histories(num_obs, normalizer, history_length, num_samples=4096):
+    """Samples raw observation histories from the normalizer's statistics."""
+    generator = torch.Generator().manual_seed(1)
+    obs = torch.randn(num_samples, history_length, num_obs, generator=generator)
+    if isinstance(normalizer, EmpiricalNormalization):
+        obs = obs * normalizer.std.cpu() + normalizer.mean.cpu()
+    return obs.view(num_samples, -1)
+
+
+def _measure_latency(policy, num_obs, num_steps, num_warmup_steps=100):
+    """Returns the p50 and p99 latency in microseconds of single observation calls."""
+    obs = torch.zeros(1, num_obs)
+    timings = []
+    with torch.inference_mode():
+        for step in range(num_warmup_steps + num_steps):
+            start = time.perf_counter()
+            policy(obs)
+            if step >= num_warmup_steps:
+                timings.append(time.perf_counter() - start)
+    timings = torch.tensor(timings) * 1e6
+    return torch.quantile(timings, 0.5).item(), torch.quantile(timings, 0.99).item()
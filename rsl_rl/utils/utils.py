@@ -4,14 +4,10 @@
 from __future__ import annotations
 from typing import Tuple
 
-import git
+import math
 import os
 import pathlib
 import torch
-import numpy as np
-
-_EPS = np.finfo(float).eps * 4.0
-
 
 
 def split_and_pad_trajectories(tensor, dones):
@@ -64,6 +60,8 @@ def unpad_trajectories(trajectories, masks):
 
 
 def store_code_state(logdir, repositories) -> list:
+    import git
+
     git_log_dir = os.path.join(logdir, "git")
     os.makedirs(git_log_dir, exist_ok=True)
     file_paths = []
@@ -90,50 +88,117 @@ def store_code_state(logdir, repositories) -> list:
         file_paths.append(diff_file_name)
     return file_paths
 
-def quaternion_slerp(q0, q1, fraction, spin=0, shortestpath=True):
-    """Batch quaternion spherical linear interpolation."""
 
-    out = torch.zeros_like(q0)
+def init_distributed(device, backend=None) -> Tuple[int, int]:
+    """Joins the process group of a data-parallel run launched with `torchrun`.
 
-    zero_mask = torch.isclose(fraction, torch.zeros_like(fraction)).squeeze()
-    ones_mask = torch.isclose(fraction, torch.ones_like(fraction)).squeeze()
-    out[zero_mask] = q0[zero_mask]
-    out[ones_mask] = q1[ones_mask]
+    Every process (rank) steps its own environments. CUDA ranks are expected to run on the device of their local rank.
 
-    d = torch.sum(q0 * q1, dim=-1, keepdim=True)
-    dist_mask = (torch.abs(torch.abs(d) - 1.0) < _EPS).squeeze()
-    out[dist_mask] = q0[dist_mask]
+    Args:
+        device (str): Device of the process.
+        backend (str, optional): Backend of the process group. Defaults to NCCL on CUDA devices and gloo otherwise.
 
+    Returns:
+        Tuple[int, int]: The rank of the process and the number of processes, (0, 1) if not launched distributed.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    if world_size == 1:
+        return 0, 1
+    if not torch.distributed.is_initialized():
+        if backend is None:
+            backend = "nccl" if torch.device(device).type == "cuda" else "gloo"
+        if torch.device(device).type == "cuda":
+            torch.cuda.set_device(device)
+        torch.distributed.init_process_group(backend=backend)
+    return torch.distributed.get_rank(), torch.distributed.get_world_size()
+
+
+def all_reduce_moments(mean, var, count):
+    """Merges the batch moments of all ranks into the moments of the union of their batches.
+
+    Uses the parallel variance formula, the variances are population variances. The size of the merged batch is
+    returned as a tensor so that the moments are merged without a host sync.
+
+    Args:
+        mean (torch.Tensor): Mean of the batch of this rank.
+        var (torch.Tensor): Variance of the batch of this rank.
+        count (int): Size of the batch of this rank.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor, torch.Tensor]: The mean, the variance and the size of the merged batch.
+    """
+    count = torch.tensor([count], dtype=mean.dtype, device=mean.device)
+    sums = torch.cat([(mean * count).flatten(), count])
+    torch.distributed.all_reduce(sums)
+    total_count = sums[-1]
+    total_mean = (sums[:-1] / total_count).view_as(mean)
+    m_2 = count * (var + torch.square(mean - total_mean))
+    torch.distributed.all_reduce(m_2)
+    return total_mean, m_2 / total_count, total_count
+
+
+def reduce_gradients(params):
+    """Averages the gradients of the parameters over all ranks in a single collective.
+
+    Args:
+        params (Iterable[torch.Tensor]): Parameters whose gradients are averaged, parameters without gradients are
+            skipped.
+    """
+    grads = [param.grad for param in params if param.grad is not None]
+    flat_grads = torch.cat([grad.flatten() for grad in grads])
+    torch.distributed.all_reduce(flat_grads)
+    flat_grads /= torch.distributed.get_world_size()
+    for grad, reduced in zip(grads, flat_grads.split([grad.numel() for grad in grads])):
+        grad.copy_(reduced.view_as(grad))
+
+
+# eager on purpose: torch.jit.script is deprecated and warns on import, and torch.compile does not beat the eager
+# elementwise ops on the CPU (see benchmarks/bench_quaternion_slerp.py)
+def quaternion_slerp(
+    q0: torch.Tensor, q1: torch.Tensor, fraction: torch.Tensor, spin: int = 0, shortestpath: bool = True
+) -> torch.Tensor:
+    """Batch quaternion spherical linear interpolation.
+
+    Branch-free version of `pybullet_utils.transformations.quaternion_slerp` that does not modify its inputs. As in
+    pybullet, parallel and antipodal quaternions (vanishing sine of the angle) return `q0`, and the end points return
+    `q0` and `q1` without flipping their sign.
+
+    Args:
+        q0 (torch.Tensor): Start quaternions. Shape: (..., 4)
+        q1 (torch.Tensor): End quaternions. Shape: (..., 4)
+        fraction (torch.Tensor): Interpolation factor in [0, 1]. Shape: (..., 1)
+        spin (int): Number of additional half turns.
+        shortestpath (bool): Whether to interpolate along the shortest arc.
+
+    Returns:
+        torch.Tensor: Interpolated quaternions. Shape: (..., 4)
+    """
+    d = torch.sum(q0 * q1, dim=-1, keepdim=True)
     if shortestpath:
-        d_old = torch.clone(d)
-        d = torch.where(d_old < 0, -d, d)
-        q1 = torch.where(d_old < 0, -q1, q1)
-
-    angle = torch.acos(d) + spin * torch.pi
-    angle_mask = (torch.abs(angle) < _EPS).squeeze()
-    out[angle_mask] = q0[angle_mask]
-
-    final_mask = torch.logical_or(zero_mask, ones_mask)
-    final_mask = torch.logical_or(final_mask, dist_mask)
-    final_mask = torch.logical_or(final_mask, angle_mask)
-    final_mask = torch.logical_not(final_mask)
-
-    isin = 1.0 / angle
-    q0 *= torch.sin((1.0 - fraction) * angle) * isin
-    q1 *= torch.sin(fraction * angle) * isin
-    q0 += q1
-    out[final_mask] = q0[final_mask]
-    return out
+        q1_path = torch.where(d < 0.0, -q1, q1)
+        d = torch.abs(d)
+    else:
+        q1_path = q1
+    angle = torch.acos(torch.clamp(d, -1.0, 1.0)) + spin * math.pi
+    sin_angle = torch.sin(angle)
+    parallel = torch.abs(sin_angle) < 1.0e-6
+    isin = 1.0 / torch.where(parallel, torch.ones_like(sin_angle), sin_angle)
+    out = torch.sin((1.0 - fraction) * angle) * isin * q0 + torch.sin(fraction * angle) * isin * q1_path
+    out = torch.where(parallel | (fraction == 0.0), q0, out)
+    return torch.where(fraction == 1.0, q1, out)
+
 
 class RunningMeanStd(object):
-    def __init__(self, device, epsilon: float = 1e-4, shape: Tuple[int, ...] = ()):
+    def __init__(self, device, epsilon: float = 1e-4, shape: Tuple[int, ...] = (), distributed: bool = False):
         """
         Calulates the running mean and std of a data stream
         https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
         :param epsilon: helps with arithmetic issues
         :param shape: the shape of the data stream's output
+        :param distributed: merge the batches of all ranks of the process group, keeping the statistics in sync
         """
         self.device=device
+        self.distributed = distributed
         self.mean = torch.zeros(shape, dtype=torch.float64, device=self.device)
         self.var = torch.ones(shape, dtype=torch.float64, device=self.device)
         self.count = epsilon
@@ -143,6 +208,8 @@ class RunningMeanStd(object):
         batch_mean = torch.mean(arr, axis=0)
         batch_var = torch.var(arr, axis=0, correction=0) # correction=0 is equal to np.var
         batch_count = arr.shape[0]
+        if self.distributed:
+            batch_mean, batch_var, batch_count = all_reduce_moments(batch_mean, batch_var, batch_count)
         self.update_from_moments(batch_mean, batch_var, batch_count)
 
     def update_from_moments(self, batch_mean: torch.tensor, batch_var: torch.tensor, batch_count: int) -> None:
@@ -162,8 +229,8 @@ class RunningMeanStd(object):
         self.count = new_count
 
 class Normalizer(RunningMeanStd):
-    def __init__(self, input_dim, device, epsilon=1e-4, clip_obs=10.0):
-        super().__init__(shape=input_dim, device=device)
+    def __init__(self, input_dim, device, epsilon=1e-4, clip_obs=10.0, distributed=False):
+        super().__init__(shape=input_dim, device=device, distributed=distributed)
 
         self.epsilon = epsilon
         self.clip_obs = clip_obs
@@ -0,0 +1,72 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Fused input layers of the actor and the critic during the rollout."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic
+
+NUM_OBS = 45
+
+
+@pytest.mark.parametrize("latent_dim", [0, 2])
+def test_fused_rollout_matches_separate_networks(latent_dim):
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, 6, [32, 32], [32, 32], vel_dependent_actor_latent_dim=latent_dim)
+    optimizer = torch.optim.SGD(actor_critic.parameters(), lr=0.1)
+    observations = torch.randn(16, NUM_OBS)
+    for _ in range(2):
+        with torch.inference_mode():
+            actor_critic.act_and_evaluate(observations, observations)
+            mean, values = actor_critic.action_mean.clone(), actor_critic.evaluate(observations)
+            fused_input = actor_critic._fused_input
+            # the fused weights are reused while the parameters do not change
+            actor_critic.act_and_evaluate(observations, observations)
+            assert actor_critic._fused_input is fused_input
+        torch.testing.assert_close(mean, actor_critic.act_inference(observations).detach())
+        torch.testing.assert_close(values, actor_critic.evaluate(observations).detach())
+
+        optimizer.zero_grad()
+        (actor_critic.act_inference(observations).sum() + actor_critic.evaluate(observations).sum()).backward()
+        optimizer.step()
+        # the owner of the optimizer invalidates them after its steps
+        actor_critic.invalidate_fused_input_layer()
+        with torch.inference_mode():
+            actor_critic.act_and_evaluate(observations, observations)
+        assert actor_critic._fused_input is not fused_input
+
+
+def test_loading_a_state_dict_invalidates_the_fused_layer():
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, 6, [32, 32], [32, 32])
+    other = ActorCritic(NUM_OBS, NUM_OBS, 6, [32, 32], [32, 32])
+    observations = torch.randn(16, NUM_OBS)
+    with torch.inference_mode():
+        actor_critic.act_and_evaluate(observations, observations)
+        actor_critic.load_state_dict(other.state_dict())
+        _, values = actor_critic.act_and_evaluate(observations, observations)
+        torch.testing.assert_close(actor_critic.action_mean, other.act_inference(observations))
+        torch.testing.assert_close(values, other.evaluate(observations))
+
+
+def test_ppo_update_invalidates_the_fused_layer():
+    torch.manual_seed(0)
+    alg = PPO(ActorCritic(NUM_OBS, NUM_OBS, 6, [32, 32], [32, 32]), num_mini_batches=2)
+    alg.init_storage(8, 4, [NUM_OBS], [None], [6])
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(4):
+            observations = torch.randn(8, NUM_OBS)
+            alg.act(observations, observations)
+            alg.process_env_step(torch.randn(8), torch.zeros(8, dtype=torch.long), {})
+        alg.compute_returns(observations)
+    alg.update()
+    with torch.inference_mode():
+        _, values = alg.actor_critic.act_and_evaluate(observations, observations)
+        torch.testing.assert_close(alg.actor_critic.action_mean, alg.actor_critic.act_inference(observations))
+        torch.testing.assert_close(values, alg.actor_critic.evaluate(observations))
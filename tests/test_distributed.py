@@ -0,0 +1,81 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Data-parallel training on two gloo ranks must match training on the union of their batches."""
+
+from __future__ import annotations
+
+import copy
+import torch
+import torch.multiprocessing as mp
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic, EmpiricalNormalization
+
+WORLD_SIZE = 2
+NUM_ENVS = 8
+NUM_STEPS = 4
+NUM_OBS = 6
+NUM_ACTIONS = 3
+
+
+def run_ranks(fn, tmp_path):
+    """Runs `fn(rank)` on every rank of a gloo process group, the assertions of the ranks fail the test."""
+    mp.spawn(_init_and_run, args=(fn, str(tmp_path / "store")), nprocs=WORLD_SIZE)
+
+
+def _init_and_run(rank, fn, store_path):
+    torch.distributed.init_process_group("gloo", init_method=f"file://{store_path}", rank=rank, world_size=WORLD_SIZE)
+    try:
+        fn(rank)
+    finally:
+        torch.distributed.destroy_process_group()
+
+
+def update_gradients(actor_critic, rank, distributed):
+    """Returns the gradients of a single-mini-batch update on the rollout of `rank`."""
+    alg = PPO(copy.deepcopy(actor_critic), max_grad_norm=1.0e9, distributed=distributed)
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+    torch.manual_seed(1 + rank)
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            alg.process_env_step(torch.randn(NUM_ENVS), (torch.rand(NUM_ENVS) < 0.2).long(), {})
+        alg.compute_returns(torch.randn(NUM_ENVS, NUM_OBS))
+    gradients = []
+    alg.optimizer.step = lambda: gradients.append([p.grad.clone() for p in alg.actor_critic.parameters()])
+    alg.update()
+    return gradients[0]
+
+
+def _check_gradients(rank):
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16])
+    reduced = update_gradients(actor_critic, rank, distributed=True)
+    local = [update_gradients(actor_critic, other, distributed=False) for other in range(WORLD_SIZE)]
+    for i, grad in enumerate(reduced):
+        torch.testing.assert_close(grad, sum(grads[i] for grads in local) / WORLD_SIZE)
+
+
+def _check_normalizer(rank):
+    # the ranks hold batches of different sizes, the second update is past `until`
+    torch.manual_seed(0)
+    batches = [[torch.randn(5 + 2 * r, 3) * (r + 1) + r for _ in range(2)] for r in range(WORLD_SIZE)]
+    normalizer = EmpiricalNormalization(shape=[3], until=10, distributed=True)
+    expected = EmpiricalNormalization(shape=[3], until=10)
+    for step in range(2):
+        normalizer.update(batches[rank][step])
+        expected.update(torch.cat([batches[r][step] for r in range(WORLD_SIZE)]))
+    assert int(normalizer.count) == expected.count == 12
+    torch.testing.assert_close(normalizer.mean, expected.mean)
+    torch.testing.assert_close(normalizer.std, expected.std)
+
+
+def test_gradients_are_averaged_over_ranks(tmp_path):
+    run_ranks(_check_gradients, tmp_path)
+
+
+def test_normalizer_moments_are_merged_over_ranks(tmp_path):
+    run_ranks(_check_normalizer, tmp_path)
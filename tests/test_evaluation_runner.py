@@ -0,0 +1,79 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Batched evaluation of checkpoints."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+from torch.func import functional_call, vmap
+
+from rsl_rl.env import AMPEnv, AMPEnvCfg
+from rsl_rl.modules import ActorCritic, EmpiricalNormalization
+from rsl_rl.runners import EvaluationRunner
+
+# the runners stack the observations of the last 5 steps
+HISTORY_LENGTH = 5
+POLICY_CFG = {
+    "class_name": "ActorCritic",
+    "actor_hidden_dims": [32],
+    "critic_hidden_dims": [32],
+    # the frequency branch (ActorFreq) produces the last two actions
+    "vel_dependent_actor_latent_dim": 2,
+    "vel_dependent_actor_cmd_indices": [0, 1],
+    "vel_dependent_actor_hidden_dims": [8],
+}
+
+
+def make_env():
+    return AMPEnv(AMPEnvCfg(num_envs=6, max_episode_length=20))
+
+
+def save_checkpoints(tmp_path, env, num_checkpoints):
+    paths = []
+    for i in range(num_checkpoints):
+        torch.manual_seed(i)
+        cfg = {key: value for key, value in POLICY_CFG.items() if key != "class_name"}
+        num_obs_history = env.num_obs * HISTORY_LENGTH
+        actor_critic = ActorCritic(num_obs_history, num_obs_history, env.num_actions, **cfg)
+        paths.append(str(tmp_path / f"model_{i}.pt"))
+        torch.save({"model_state_dict": actor_critic.state_dict()}, paths[-1])
+    return paths
+
+
+def test_batched_actors_match_the_checkpoints(tmp_path):
+    env = make_env()
+    paths = save_checkpoints(tmp_path, env, 3)
+    runner = EvaluationRunner(env, {"policy": dict(POLICY_CFG)})
+    actor, params, buffers, _, _ = runner._load_checkpoints(paths)
+    observations = torch.randn(3, 4, env.num_obs * HISTORY_LENGTH)
+    actions = vmap(lambda params, buffers, obs: functional_call(actor, (params, buffers), (obs,)))(
+        params, buffers, observations
+    )
+    for i, path in enumerate(paths):
+        actor_critic = runner.actor_critic_fn()
+        actor_critic.load_state_dict(torch.load(path)["model_state_dict"])
+        torch.testing.assert_close(actions[i], actor_critic.act_inference(observations[i]))
+
+
+def test_checkpoint_normalization_matches_the_normalizer(tmp_path):
+    env = make_env()
+    paths = save_checkpoints(tmp_path, env, 2)
+    normalizer = EmpiricalNormalization(shape=[env.num_obs], until=1.0e8)
+    normalizer.update(torch.randn(32, env.num_obs) * 3.0 + 1.0)
+    checkpoint = torch.load(paths[1])
+    checkpoint["obs_norm_state_dict"] = normalizer.state_dict()
+    torch.save(checkpoint, paths[1])
+
+    runner = EvaluationRunner(env, {"policy": dict(POLICY_CFG)})
+    _, _, _, obs_mean, obs_std = runner._load_checkpoints(paths)
+    obs = torch.randn(4, env.num_obs)
+    # checkpoints without normalizer statistics are evaluated on the raw observations
+    torch.testing.assert_close((obs - obs_mean[0]) / obs_std[0], obs)
+    torch.testing.assert_close((obs - obs_mean[1]) / obs_std[1], normalizer.eval()(obs))
+
+
+def test_unknown_policy_class_raises():
+    with pytest.raises(ValueError, match="Unknown policy class"):
+        EvaluationRunner(make_env(), {"policy": {"class_name": "ActorCriticTransformer"}})
@@ -0,0 +1,194 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Exported policies must match the training-time path of normalizer, observation history and actor."""
+
+from __future__ import annotations
+
+import copy
+import pytest
+import torch
+from torch import nn
+
+from rsl_rl.modules import ActorCritic, EmpiricalNormalization
+from rsl_rl.modules.actor_critic import ActorFreq
+from rsl_rl.storage import ObservationHistoryStorage
+from rsl_rl.utils.exporter import (
+    _fold_normalization,
+    _prune_hidden_units,
+    _verify_parity,
+    export_policy_as_jit,
+    export_policy_as_onnx,
+    export_policy_as_quantized_jit,
+)
+
+NUM_OBS = 8
+NUM_ACTIONS = 4
+HISTORY_LENGTH = 5
+POLICY_CFGS = {
+    "mlp": {"actor_hidden_dims": [32, 16], "critic_hidden_dims": [16]},
+    # the frequency branch (ActorFreq) produces the last two actions from the first two observations of every step
+    "freq": {
+        "actor_hidden_dims": [32, 16],
+        "critic_hidden_dims": [16],
+        "vel_dependent_actor_latent_dim": 2,
+        "vel_dependent_actor_cmd_indices": [0, 1],
+        "vel_dependent_actor_hidden_dims": [8],
+    },
+}
+
+
+def make_policy(policy_type):
+    torch.manual_seed(0)
+    num_obs_history = NUM_OBS * HISTORY_LENGTH
+    actor_critic = ActorCritic(num_obs_history, num_obs_history, NUM_ACTIONS, **POLICY_CFGS[policy_type])
+    normalizer = EmpiricalNormalization(shape=[NUM_OBS], until=1.0e8)
+    # statistics far from the identity, so that a missing or misplaced normalization shows up
+    normalizer(torch.randn(1000, NUM_OBS) * torch.linspace(0.1, 5.0, NUM_OBS) + torch.linspace(-3.0, 3.0, NUM_OBS))
+    normalizer.eval()
+    return actor_critic, normalizer
+
+
+def rollout(policy, actor_critic, normalizer, num_steps=20):
+    """Returns the actions of a stateful policy and of the training-time path on the same raw observations."""
+    history_storage = ObservationHistoryStorage(1, NUM_OBS, HISTORY_LENGTH)
+    generator = torch.Generator().manual_seed(2)
+    actions, expected = [], []
+    with torch.inference_mode():
+        for _ in range(num_steps):
+            obs = torch.randn(1, NUM_OBS, generator=generator) * 3.0
+            history_storage.add(normalizer(obs))
+            expected.append(actor_critic.act_inference(history_storage.get()))
+            actions.append(policy(obs))
+    return torch.cat(actions), torch.cat(expected)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_folded_actor_matches_the_normalized_actor(policy_type):
+    actor_critic, normalizer = make_policy(policy_type)
+    actor, obs_mean = _fold_normalization(actor_critic, normalizer, HISTORY_LENGTH)
+    assert isinstance(actor, ActorFreq) == (policy_type == "freq")
+    obs_history = torch.randn(64, HISTORY_LENGTH, NUM_OBS) * 3.0
+    with torch.inference_mode():
+        expected = actor_critic.act_inference(normalizer(obs_history).flatten(1))
+        actions = actor((obs_history - obs_mean).flatten(1))
+    torch.testing.assert_close(actions, expected, rtol=1e-5, atol=1e-5)
+    # the actor of the actor-critic is left untouched
+    with torch.inference_mode():
+        torch.testing.assert_close(actor_critic.act_inference(normalizer(obs_history).flatten(1)), expected)
+
+
+def test_verify_parity_detects_deviations():
+    actor_critic, normalizer = make_policy("mlp")
+    actor_critic.train()
+    actor, obs_mean = _fold_normalization(actor_critic, normalizer, HISTORY_LENGTH)
+
+    def policy(obs, obs_history):
+        obs_history = torch.cat([obs_history[:, NUM_OBS:], obs - obs_mean], dim=-1)
+        return actor(obs_history), obs_history
+
+    _verify_parity(policy, actor_critic, normalizer, HISTORY_LENGTH)
+    # the training modes are restored
+    assert actor_critic.training and not normalizer.training
+
+    with torch.no_grad():
+        actor[-1].bias.add_(1e-2)
+    with pytest.raises(RuntimeError, match="deviates"):
+        _verify_parity(policy, actor_critic, normalizer, HISTORY_LENGTH)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_jit_export_matches_the_training_time_policy(tmp_path, policy_type):
+    actor_critic, normalizer = make_policy(policy_type)
+    filepath = export_policy_as_jit(actor_critic, normalizer, str(tmp_path), history_length=HISTORY_LENGTH)
+    policy = torch.jit.load(filepath)
+    actions, expected = rollout(policy, actor_critic, normalizer)
+    torch.testing.assert_close(actions, expected, rtol=1e-5, atol=1e-5)
+
+    # after a reset the history starts from the reset state of the training-time history again
+    policy.reset()
+    actions, expected = rollout(policy, actor_critic, normalizer)
+    torch.testing.assert_close(actions, expected, rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_onnx_export_matches_the_training_time_policy(tmp_path, policy_type):
+    onnx = pytest.importorskip("onnx")
+    from onnx.reference import ReferenceEvaluator
+
+    actor_critic, normalizer = make_policy(policy_type)
+    filepath = export_policy_as_onnx(actor_critic, normalizer, str(tmp_path), history_length=HISTORY_LENGTH)
+    model = onnx.load(filepath)
+    onnx.checker.check_model(model)
+    session = ReferenceEvaluator(model)
+
+    def policy(obs, obs_history):
+        actions, obs_history = session.run(None, {"obs": obs.numpy(), "obs_history": obs_history.numpy()})
+        return torch.from_numpy(actions), torch.from_numpy(obs_history)
+
+    # the exported graph, not the module it was traced from
+    _verify_parity(policy, actor_critic, normalizer, HISTORY_LENGTH)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_uncompressed_export_matches_the_jit_export(tmp_path, policy_type):
+    actor_critic, normalizer = make_policy(policy_type)
+    filepath, report = export_policy_as_quantized_jit(
+        actor_critic, normalizer, str(tmp_path), history_length=HISTORY_LENGTH, quantize=False, num_latency_steps=10
+    )
+    assert report["action_error_max"] < 1e-5
+    actions, expected = rollout(torch.jit.load(filepath), actor_critic, normalizer)
+    torch.testing.assert_close(actions, expected, rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_quantized_export_stays_close_to_the_training_time_policy(tmp_path, policy_type):
+    actor_critic, normalizer = make_policy(policy_type)
+    filepath, report = export_policy_as_quantized_jit(
+        actor_critic, normalizer, str(tmp_path), history_length=HISTORY_LENGTH, num_latency_steps=10
+    )
+    # int8 weights cost a few percent of the action scale
+    assert 0.0 < report["action_error_mean"] < 0.05
+    assert report["action_error_mean"] <= report["action_error_max"] < 0.25
+    assert all(report[key] > 0.0 for key in ("latency_p50_us", "latency_p99_us", "float_latency_p50_us"))
+
+    policy = torch.jit.load(filepath)
+    assert any(module.original_name == "LinearPackedParams" for module in policy.modules())
+    actions, expected = rollout(policy, actor_critic, normalizer)
+    assert (actions - expected).abs().max() < 0.05 * expected.abs().max()
+
+
+def test_quantized_export_rejects_invalid_pruning_amounts(tmp_path):
+    actor_critic, normalizer = make_policy("mlp")
+    with pytest.raises(ValueError, match="pruning amount"):
+        export_policy_as_quantized_jit(actor_critic, normalizer, str(tmp_path), prune_amount=1.0)
+
+
+@pytest.mark.parametrize("policy_type", POLICY_CFGS)
+def test_pruning_removes_the_units_with_the_smallest_weights(policy_type):
+    actor_critic, _ = make_policy(policy_type)
+    actor = copy.deepcopy(actor_critic.actor)
+    branches = [actor.actor_all, actor.actor_freq] if isinstance(actor, ActorFreq) else [actor]
+    # silence a quarter of the units of every hidden layer, removing them leaves the actions unchanged
+    generator = torch.Generator().manual_seed(3)
+    hidden_dims = []
+    for branch in branches:
+        layers = [layer for layer in branch if isinstance(layer, nn.Linear)][:-1]
+        for layer in layers:
+            silenced = torch.randperm(layer.out_features, generator=generator)[: layer.out_features // 4]
+            with torch.no_grad():
+                layer.weight[silenced] = 0.0
+                layer.bias[silenced] = 0.0
+            hidden_dims.append(layer.out_features - layer.out_features // 4)
+    obs_history = torch.randn(64, NUM_OBS * HISTORY_LENGTH)
+    with torch.inference_mode():
+        expected = actor(obs_history)
+
+    pruned = _prune_hidden_units(copy.deepcopy(actor), 0.25)
+    pruned_branches = [pruned.actor_all, pruned.actor_freq] if isinstance(pruned, ActorFreq) else [pruned]
+    pruned_dims = [
+        layer.out_features for branch in pruned_branches for layer in [*branch][:-1] if isinstance(layer, nn.Linear)
+    ]
+    assert pruned_dims == hidden_dims
+    with torch.inference_mode():
+        torch.testing.assert_close(pruned(obs_history), expected)
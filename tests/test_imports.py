@@ -0,0 +1,87 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Imports of the package must not load the optional dependencies of other subpackages."""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import subprocess
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
+# the AMP runner imports in about 15 ms after torch, matplotlib.pyplot alone takes over 300 ms
+IMPORT_TIME_BOUND = 0.2
+
+
+def loaded_modules(statement):
+    """Returns the names of the modules loaded by running `statement` in a fresh interpreter."""
+    code = f"import json, sys\n{statement}\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True, text=True, timeout=120
+    )
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def import_time(statement):
+    """Returns the time in seconds spent importing `rsl_rl` modules by `statement`, measured with `-X importtime`.
+
+    Torch is imported beforehand, every consumer of the package needs it. The time of a top-level entry includes the
+    dependencies it imports, but not the modules imported through `importlib` by the lazy attributes.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import torch\n{statement}"],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    seconds = 0.0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith(" rsl_rl"):
+            seconds += int(cumulative) * 1e-6
+    return seconds
+
+
+def is_loaded(modules, package):
+    return any(name == package or name.startswith(package + ".") for name in modules)
+
+
+def test_datasets_do_not_load_pybullet_or_yaml():
+    modules = loaded_modules("import rsl_rl.datasets")
+    for package in ("pybullet", "pybullet_utils", "yaml"):
+        assert not is_loaded(modules, package), package
+
+
+def test_package_does_not_load_training_dependencies():
+    modules = loaded_modules("import rsl_rl")
+    for package in ("torch.utils.tensorboard", "tensorboard", "git", "rsl_rl.runners"):
+        assert not is_loaded(modules, package), package
+
+
+def test_modules_do_not_load_training_dependencies():
+    # deployment processes only need the networks
+    modules = loaded_modules("import rsl_rl.modules")
+    for package in ("torch.utils.tensorboard", "tensorboard", "git", "matplotlib", "pybullet_utils", "yaml"):
+        assert not is_loaded(modules, package), package
+    for package in ("rsl_rl.algorithms", "rsl_rl.datasets", "rsl_rl.runners", "rsl_rl.utils.exporter"):
+        assert not is_loaded(modules, package), package
+
+
+def test_runners_are_imported_on_access():
+    modules = loaded_modules("import rsl_rl.runners")
+    for package in ("torch.utils.tensorboard", "tensorboard", "git", "rsl_rl.algorithms", "rsl_rl.datasets"):
+        assert not is_loaded(modules, package), package
+    assert not any(name.startswith("rsl_rl.runners.") for name in modules)
+
+
+def test_amp_runner_import_time_is_bounded():
+    # the runner modules are imported directly, the lazy attributes of `rsl_rl.runners` bypass `-X importtime`
+    seconds = import_time("import rsl_rl.runners\nimport rsl_rl.runners.amp_on_policy_runner")
+    assert 0.0 < seconds < IMPORT_TIME_BOUND
@@ -0,0 +1,79 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Sampling of the AMP motion loader from the shared frame store."""
+
+from __future__ import annotations
+
+import json
+import math
+import pytest
+import torch
+
+from rsl_rl.datasets.motion_loader import AMPLoader
+from rsl_rl.env import AMPEnv, AMPEnvCfg
+
+
+@pytest.fixture
+def motion_files(tmp_path):
+    env = AMPEnv(AMPEnvCfg(num_envs=1))
+    paths = []
+    for i, duration in enumerate([1.0, 1.5]):
+        paths.append(str(tmp_path / f"motion_{i}.txt"))
+        env.write_motion_file(paths[-1], duration=duration)
+    return paths
+
+
+def make_loader(motion_files, preload_transitions, **kwargs):
+    return AMPLoader(
+        "cpu",
+        0.02,
+        preload_transitions=preload_transitions,
+        num_preload_transitions=256,
+        motion_files=motion_files,
+        joint_mapping=list(range(12)),
+        quat_mapping=[0, 1, 2, 3],
+        seed=0,
+        **kwargs,
+    )
+
+
+def test_full_frames_are_drawn_from_preloaded_transitions(motion_files):
+    loader = make_loader(motion_files, preload_transitions=True)
+    full_frames = loader.get_full_frame_batch(64)
+    assert full_frames.shape == (64, AMPLoader.JOINT_VEL_END_IDX)
+    # the AMP features of the full frames are those of preloaded transitions
+    amp_features = full_frames[:, loader.amp_data_indices]
+    distances = torch.cdist(amp_features, loader.preloaded_s, compute_mode="donot_use_mm_for_euclid_dist")
+    assert torch.all(distances.min(dim=1).values < 1e-5)
+
+
+def test_trajectories_hold_the_amp_observations(motion_files):
+    loader = make_loader(motion_files, preload_transitions=False)
+    assert len(loader.trajectories) == loader.num_motions
+    for traj_idx, trajectory in enumerate(loader.trajectories):
+        torch.testing.assert_close(trajectory, loader.get_trajectory(traj_idx)[:, loader.amp_data_indices])
+    assert loader.get_full_frame_batch(8).shape == (8, AMPLoader.JOINT_VEL_END_IDX)
+
+
+def test_amp_features_are_blended_linearly(motion_files):
+    # a root turning by one radian per frame, where slerp and the linear blend differ
+    for motion_file in motion_files:
+        with open(motion_file) as f:
+            motion = json.load(f)
+        for i, frame in enumerate(motion["Frames"]):
+            root_rot = [0.0, 0.0, math.sin(i / 2), math.cos(i / 2)]
+            frame[AMPLoader.ROOT_ROT_START_IDX : AMPLoader.ROOT_ROT_END_IDX] = root_rot
+        with open(motion_file, "w") as f:
+            json.dump(motion, f)
+    # the root orientation is interpolated component-wise like the other features, as the discriminator was trained on
+    loader = make_loader(motion_files, preload_transitions=False, amp_data=["ROOT_ROT", "JOINT_POS", "JOINT_VEL"])
+    traj_idxs = loader.weighted_traj_idx_sample_batch(32)
+    times = loader.traj_time_sample_batch(traj_idxs)
+    frames = loader.get_frame_at_time_batch(traj_idxs, times)
+    for frame, traj_idx, time in zip(frames, traj_idxs.tolist(), times.tolist()):
+        trajectory = loader.get_trajectory(traj_idx)[:, loader.amp_data_indices]
+        p = time / float(loader.trajectory_lens[traj_idx]) * trajectory.shape[0]
+        low, high = int(p // 1), int(-(-p // 1))
+        blend = p - low
+        torch.testing.assert_close(frame, (1.0 - blend) * trajectory[low] + blend * trajectory[high])
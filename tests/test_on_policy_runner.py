@@ -0,0 +1,110 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Sequential and pipelined rollout collection of the on-policy runner."""
+
+from __future__ import annotations
+
+import copy
+import torch
+
+from rsl_rl.env import PointMassEnv, PointMassEnvCfg
+from rsl_rl.modules import ActorCritic
+from rsl_rl.runners import OnPolicyRunner
+
+NUM_ENVS = 4
+NUM_STEPS = 8
+NUM_ITERATIONS = 3
+POLICY_CFG = {"actor_hidden_dims": [16], "critic_hidden_dims": [16]}
+
+
+def make_runner(tmp_path, policy_lag):
+    torch.manual_seed(0)
+    # the episodes time out within the rollouts
+    env = PointMassEnv(PointMassEnvCfg(num_envs=NUM_ENVS, max_episode_length=5))
+    train_cfg = {
+        "num_steps_per_env": NUM_STEPS,
+        "save_interval": 100,
+        "empirical_normalization": False,
+        "policy_lag": policy_lag,
+        "logger": "tensorboard",
+        "algorithm": {"class_name": "PPO", "num_learning_epochs": 2, "num_mini_batches": 2},
+        "policy": {"class_name": "ActorCritic", **POLICY_CFG},
+    }
+    return OnPolicyRunner(env, train_cfg, log_dir=str(tmp_path))
+
+
+def record_updates(runner):
+    """Records the parameters of the learner and the rollout in its storage before every update."""
+    records = []
+    update = runner.alg.update
+
+    def record_and_update():
+        state_dict = copy.deepcopy(runner.alg.actor_critic.state_dict())
+        records.append((state_dict, runner.alg.storage.observations.clone(), runner.alg.storage.mu.clone()))
+        return update()
+
+    runner.alg.update = record_and_update
+    return records
+
+
+def collecting_iterations(runner, records):
+    """Returns, for every update, the iterations whose parameters produce the action means of its rollout."""
+    num_obs = records[0][1].shape[-1]
+    actor_critic = ActorCritic(num_obs, num_obs, runner.env.num_actions, **POLICY_CFG)
+    iterations = []
+    for _, observations, mu in records:
+        matches = []
+        for it, (state_dict, _, _) in enumerate(records):
+            actor_critic.load_state_dict(state_dict)
+            with torch.inference_mode():
+                if torch.allclose(actor_critic.act_inference(observations), mu):
+                    matches.append(it)
+        iterations.append(matches)
+    return iterations
+
+
+def test_sequential_runner_reproduces_the_sequential_rollout(tmp_path):
+    runner = make_runner(tmp_path / "runner", policy_lag=0)
+    runner.learn(NUM_ITERATIONS)
+
+    # the same components stepped by hand: collect a rollout with the current policy, then update on it
+    reference = make_runner(tmp_path / "reference", policy_lag=0)
+    alg, env, obs_history_storage = reference.alg, reference.env, reference.obs_history_storage
+    obs, _ = env.get_observations()
+    obs_history_storage.add(obs)
+    obs_history = obs_history_storage.get()
+    alg.train_mode()
+    for _ in range(NUM_ITERATIONS):
+        with torch.inference_mode():
+            for _ in range(NUM_STEPS):
+                actions = alg.act(obs_history, obs_history)
+                obs, rewards, dones, infos = env.step(actions)
+                obs_history_storage.reset(dones)
+                obs_history_storage.add(obs)
+                obs_history = obs_history_storage.get()
+                alg.process_env_step(rewards, dones, infos)
+            alg.compute_returns(obs_history)
+        alg.update()
+
+    state_dict = runner.alg.actor_critic.state_dict()
+    for key, value in reference.alg.actor_critic.state_dict().items():
+        torch.testing.assert_close(state_dict[key], value, rtol=0.0, atol=0.0)
+    assert runner.alg.learning_rate == alg.learning_rate
+
+
+def test_sequential_runner_collects_with_the_current_policy(tmp_path):
+    runner = make_runner(tmp_path, policy_lag=0)
+    records = record_updates(runner)
+    runner.learn(NUM_ITERATIONS)
+
+    assert collecting_iterations(runner, records) == [[it] for it in range(NUM_ITERATIONS)]
+
+
+def test_pipelined_runner_collects_with_one_update_old_weights(tmp_path):
+    runner = make_runner(tmp_path, policy_lag=1)
+    records = record_updates(runner)
+    runner.learn(NUM_ITERATIONS)
+
+    # the first rollout is collected with the initial policy, every later one with the policy before the last update
+    assert collecting_iterations(runner, records) == [[0]] + [[it - 1] for it in range(1, NUM_ITERATIONS)]
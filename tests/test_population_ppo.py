@@ -0,0 +1,108 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""An update of a population must equal the independent PPO updates of its members."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from rsl_rl.algorithms import PPO, PopulationPPO
+from rsl_rl.modules import ActorCritic, ActorCriticPopulation
+
+POPULATION_SIZE = 2
+NUM_ENVS = 16
+NUM_STEPS = 8
+NUM_OBS = 6
+NUM_ACTIONS = 3
+LEARNING_RATES = [1e-3, 3e-3]
+ENTROPY_COEFS = [0.0, 0.01]
+DESIRED_KLS = [0.01, 1e-4]
+STORAGE_FIELDS = ["observations", "rewards", "actions", "dones", "actions_log_prob", "values", "mu", "sigma"]
+
+
+@pytest.fixture(autouse=True)
+def float64():
+    # the comparison is exact up to the summation order and the fp32 learning rates of the population
+    default_dtype = torch.get_default_dtype()
+    torch.set_default_dtype(torch.float64)
+    yield
+    torch.set_default_dtype(default_dtype)
+
+
+def algorithm_kwargs():
+    # a single mini-batch makes the update independent of the sampling order of the storage generators, the small
+    # gradient norm bound clips every member and the adaptive schedule changes the learning rates
+    return dict(num_learning_epochs=3, num_mini_batches=1, max_grad_norm=0.1, schedule="adaptive")
+
+
+def member(population, index):
+    """Returns an `ActorCritic` with the parameters of a member of the population."""
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16])
+    state_dict = {name: param[index] for name, param in population.members.named_parameters()}
+    actor_critic.load_state_dict(state_dict)
+    return actor_critic
+
+
+def test_population_update_matches_member_updates():
+    torch.manual_seed(0)
+    population = ActorCriticPopulation(
+        NUM_OBS,
+        NUM_OBS,
+        NUM_ACTIONS,
+        population_size=POPULATION_SIZE,
+        actor_hidden_dims=[16],
+        critic_hidden_dims=[16],
+    )
+    members = [member(population, index) for index in range(POPULATION_SIZE)]
+    alg = PopulationPPO(
+        population,
+        learning_rate=LEARNING_RATES,
+        entropy_coef=ENTROPY_COEFS,
+        desired_kl=DESIRED_KLS,
+        **algorithm_kwargs(),
+    )
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+
+    torch.manual_seed(1)
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            dones = (torch.rand(NUM_ENVS) < 0.2).long()
+            alg.process_env_step(torch.randn(NUM_ENVS), dones, {})
+        last_obs = torch.randn(NUM_ENVS, NUM_OBS)
+
+    # every member is trained by PPO on the transitions of its block of environments
+    member_algs = []
+    member_envs = NUM_ENVS // POPULATION_SIZE
+    for index, actor_critic in enumerate(members):
+        member_alg = PPO(
+            actor_critic,
+            learning_rate=LEARNING_RATES[index],
+            entropy_coef=ENTROPY_COEFS[index],
+            desired_kl=DESIRED_KLS[index],
+            **algorithm_kwargs(),
+        )
+        member_alg.init_storage(member_envs, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+        block = slice(index * member_envs, (index + 1) * member_envs)
+        for field in STORAGE_FIELDS:
+            getattr(member_alg.storage, field).copy_(getattr(alg.storage, field)[:, block])
+        member_alg.storage.step = NUM_STEPS
+        with torch.inference_mode():
+            member_alg.compute_returns(last_obs[block])
+        member_algs.append(member_alg)
+    with torch.inference_mode():
+        alg.compute_returns(last_obs)
+
+    mean_value_loss, mean_surrogate_loss = alg.update()
+    member_losses = torch.tensor([member_alg.update() for member_alg in member_algs])
+
+    torch.testing.assert_close(torch.tensor([mean_value_loss, mean_surrogate_loss]), member_losses.mean(dim=0))
+    learning_rates = torch.tensor([m.learning_rate for m in member_algs], dtype=alg.learning_rates.dtype)
+    torch.testing.assert_close(alg.learning_rates, learning_rates)
+    for name, param in population.members.named_parameters():
+        expected = torch.stack([dict(m.named_parameters())[name] for m in members])
+        torch.testing.assert_close(param, expected, rtol=1e-6, atol=1e-9)
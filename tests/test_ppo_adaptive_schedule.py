@@ -0,0 +1,41 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""The adaptive learning rate schedule must leave a float learning rate in the optimizer state."""
+
+from __future__ import annotations
+
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic
+
+NUM_ENVS = 16
+NUM_STEPS = 8
+NUM_OBS = 6
+NUM_ACTIONS = 3
+
+
+def fill_storage(alg):
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            alg.process_env_step(torch.randn(NUM_ENVS), (torch.rand(NUM_ENVS) < 0.2).long(), {})
+        alg.compute_returns(torch.randn(NUM_ENVS, NUM_OBS))
+
+
+def test_optimizer_state_holds_the_adapted_learning_rate_as_float():
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16])
+    # a tiny KL target lowers the learning rate on every mini-batch
+    alg = PPO(actor_critic, num_learning_epochs=2, num_mini_batches=2, schedule="adaptive", desired_kl=1e-8)
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+    fill_storage(alg)
+    alg.update()
+
+    assert alg.learning_rate < 1e-3
+    for param_group in alg.optimizer.state_dict()["param_groups"]:
+        assert type(param_group["lr"]) is float
+        assert param_group["lr"] == alg.learning_rate
@@ -0,0 +1,63 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""A compiled PPO update must match the eager update."""
+
+from __future__ import annotations
+
+import copy
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic
+
+NUM_ENVS = 16
+NUM_STEPS = 8
+NUM_OBS = 6
+NUM_ACTIONS = 3
+
+
+def update(actor_critic, compile_update):
+    """Returns the losses of an update and the gradients of its optimizer steps."""
+    alg = PPO(
+        copy.deepcopy(actor_critic),
+        num_learning_epochs=2,
+        num_mini_batches=2,
+        schedule="adaptive",
+        compile_update=compile_update,
+    )
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+    torch.manual_seed(1)
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            alg.process_env_step(torch.randn(NUM_ENVS), (torch.rand(NUM_ENVS) < 0.2).long(), {})
+        alg.compute_returns(torch.randn(NUM_ENVS, NUM_OBS))
+    # the steps are taken, the later mini-batches run the compiled loss on the updated parameters
+    gradients = []
+    step = alg.optimizer.step
+
+    def record_and_step():
+        gradients.append([p.grad.clone() for p in alg.actor_critic.parameters()])
+        step()
+
+    alg.optimizer.step = record_and_step
+    torch.manual_seed(2)
+    losses = alg.update()
+    return losses, alg.learning_rate, gradients
+
+
+def test_compiled_update_matches_eager():
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16])
+    losses, learning_rate, gradients = update(actor_critic, compile_update=False)
+    compiled_losses, compiled_learning_rate, compiled_gradients = update(actor_critic, compile_update=True)
+
+    torch.testing.assert_close(compiled_losses, losses, rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(compiled_learning_rate, learning_rate)
+    assert len(compiled_gradients) == len(gradients) == 4
+    for expected_grads, actual_grads in zip(gradients, compiled_gradients):
+        for expected_grad, actual_grad in zip(expected_grads, actual_grads):
+            torch.testing.assert_close(actual_grad, expected_grad, rtol=1e-4, atol=1e-6)
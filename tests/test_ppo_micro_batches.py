@@ -0,0 +1,86 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Micro-batched PPO updates must produce the gradients of the unsplit mini-batches."""
+
+from __future__ import annotations
+
+import copy
+import pytest
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic, ActorCriticRecurrent
+
+NUM_ENVS = 16
+NUM_STEPS = 8
+NUM_OBS = 6
+NUM_ACTIONS = 3
+
+
+@pytest.fixture(autouse=True)
+def float64():
+    # the comparison is exact up to the summation order
+    default_dtype = torch.get_default_dtype()
+    torch.set_default_dtype(torch.float64)
+    yield
+    torch.set_default_dtype(default_dtype)
+
+
+def make_actor_critic(recurrent):
+    torch.manual_seed(0)
+    if recurrent:
+        return ActorCriticRecurrent(
+            NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16], rnn_hidden_size=8
+        )
+    return ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[16], critic_hidden_dims=[16])
+
+
+def fill_storage(alg):
+    torch.manual_seed(1)
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            dones = (torch.rand(NUM_ENVS) < 0.2).long()
+            alg.process_env_step(torch.randn(NUM_ENVS), dones, {})
+        alg.compute_returns(torch.randn(NUM_ENVS, NUM_OBS))
+
+
+def update_gradients(actor_critic, num_mini_batches, num_micro_batches):
+    """Returns the gradients of every optimizer step of one update."""
+    alg = PPO(
+        copy.deepcopy(actor_critic),
+        num_learning_epochs=1,
+        num_mini_batches=num_mini_batches,
+        num_micro_batches=num_micro_batches,
+        max_grad_norm=1.0e9,
+    )
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+    fill_storage(alg)
+    gradients = []
+    alg.optimizer.step = lambda: gradients.append([p.grad.clone() for p in alg.actor_critic.parameters()])
+    torch.manual_seed(2)
+    alg.update()
+    return gradients
+
+
+@pytest.mark.parametrize("recurrent", [False, True])
+@pytest.mark.parametrize("num_micro_batches", [2, 4])
+def test_micro_batches_match_unsplit_gradients(recurrent, num_micro_batches):
+    actor_critic = make_actor_critic(recurrent)
+    # with 4 mini-batches of 4 micro-batches a recurrent micro-batch holds a single environment
+    expected = update_gradients(actor_critic, num_mini_batches=4, num_micro_batches=1)
+    actual = update_gradients(actor_critic, num_mini_batches=4, num_micro_batches=num_micro_batches)
+    assert len(actual) == len(expected) == 4
+    for expected_grads, actual_grads in zip(expected, actual):
+        for expected_grad, actual_grad in zip(expected_grads, actual_grads):
+            torch.testing.assert_close(actual_grad, expected_grad, rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("recurrent", [False, True])
+def test_indivisible_micro_batches_raise(recurrent):
+    alg = PPO(make_actor_critic(recurrent), num_mini_batches=3, num_micro_batches=2)
+    with pytest.raises(ValueError, match="not divisible"):
+        alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
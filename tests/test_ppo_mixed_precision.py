@@ -0,0 +1,59 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""A bf16 mixed precision update must stay close to the fp32 update."""
+
+from __future__ import annotations
+
+import copy
+import torch
+
+from rsl_rl.algorithms import PPO
+from rsl_rl.modules import ActorCritic
+
+NUM_ENVS = 64
+NUM_STEPS = 16
+NUM_OBS = 32
+NUM_ACTIONS = 8
+
+
+def update(actor_critic, mixed_precision):
+    """Returns the losses and the gradients of a single optimizer step."""
+    alg = PPO(
+        copy.deepcopy(actor_critic),
+        num_learning_epochs=1,
+        num_mini_batches=1,
+        max_grad_norm=1.0e9,
+        mixed_precision=mixed_precision,
+    )
+    alg.init_storage(NUM_ENVS, NUM_STEPS, [NUM_OBS], [None], [NUM_ACTIONS])
+    torch.manual_seed(1)
+    alg.train_mode()
+    with torch.inference_mode():
+        for _ in range(NUM_STEPS):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            alg.act(obs, obs)
+            alg.process_env_step(torch.randn(NUM_ENVS), (torch.rand(NUM_ENVS) < 0.05).long(), {})
+        alg.compute_returns(torch.randn(NUM_ENVS, NUM_OBS))
+    gradients = []
+    alg.optimizer.step = lambda: gradients.append([p.grad.clone() for p in alg.actor_critic.parameters()])
+    torch.manual_seed(2)
+    losses = alg.update()
+    return losses, gradients[0]
+
+
+def test_bf16_update_matches_fp32():
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(NUM_OBS, NUM_OBS, NUM_ACTIONS, actor_hidden_dims=[64, 64], critic_hidden_dims=[64, 64])
+    (value_loss, surrogate_loss), gradients = update(actor_critic, mixed_precision=False)
+    (bf16_value_loss, bf16_surrogate_loss), bf16_gradients = update(actor_critic, mixed_precision=True)
+
+    assert abs(bf16_value_loss - value_loss) <= 1e-2 * abs(value_loss)
+    # the surrogate loss of the first step is minus the mean of the normalized advantages (zero)
+    assert abs(bf16_surrogate_loss - surrogate_loss) <= 1e-3
+    # the forwards did run in bf16
+    assert not all(torch.equal(gradient, bf16_gradient) for gradient, bf16_gradient in zip(gradients, bf16_gradients))
+    for gradient, bf16_gradient in zip(gradients, bf16_gradients):
+        assert bf16_gradient.dtype == torch.float32
+        relative_error = (bf16_gradient - gradient).norm() / gradient.norm().clamp(min=1e-8)
+        assert relative_error < 5e-2
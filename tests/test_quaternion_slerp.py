@@ -0,0 +1,65 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Parity of the batched quaternion slerp with pybullet."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import subprocess
+import sys
+import torch
+
+from rsl_rl.utils.utils import quaternion_slerp
+
+transformations = pytest.importorskip("pybullet_utils.transformations")
+
+NUM_PAIRS = 500
+
+
+def random_quaternions(generator, num):
+    quaternions = torch.randn(num, 4, generator=generator, dtype=torch.float64)
+    return quaternions / quaternions.norm(dim=-1, keepdim=True)
+
+
+@pytest.mark.parametrize("shortestpath", [True, False])
+@pytest.mark.parametrize("spin", [0, 1])
+def test_matches_pybullet(shortestpath, spin):
+    generator = torch.Generator().manual_seed(0)
+    q0, q1 = random_quaternions(generator, NUM_PAIRS), random_quaternions(generator, NUM_PAIRS)
+    fraction = torch.rand(NUM_PAIRS, 1, generator=generator, dtype=torch.float64)
+    # end points, parallel and antipodal pairs
+    fraction[:10] = 0.0
+    fraction[10:20] = 1.0
+    q1[20:30] = q0[20:30]
+    q1[30:40] = -q0[30:40]
+    q0_input, q1_input = q0.clone(), q1.clone()
+
+    out = quaternion_slerp(q0, q1, fraction, spin=spin, shortestpath=shortestpath)
+
+    expected = torch.from_numpy(
+        np.stack(
+            [
+                transformations.quaternion_slerp(
+                    q0[i].numpy(), q1[i].numpy(), float(fraction[i]), spin=spin, shortestpath=shortestpath
+                )
+                for i in range(NUM_PAIRS)
+            ]
+        )
+    )
+    torch.testing.assert_close(out, expected, rtol=0.0, atol=1e-6)
+    # the inputs are not modified
+    assert torch.equal(q0, q0_input) and torch.equal(q1, q1_input)
+
+
+def test_antipodal_without_shortest_path_returns_q0():
+    q0 = torch.tensor([[0.0, 0.0, 0.0, 1.0]])
+    out = quaternion_slerp(q0, -q0, torch.tensor([[0.3]]), shortestpath=False)
+    torch.testing.assert_close(out, q0)
+
+
+def test_import_emits_no_warning():
+    subprocess.run(
+        [sys.executable, "-W", "error::FutureWarning", "-c", "import rsl_rl.utils.utils"], check=True, timeout=120
+    )
@@ -0,0 +1,70 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Recurrent memories of the actor and the critic."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from rsl_rl.modules.actor_critic_recurrent import Memory
+from rsl_rl.utils import split_and_pad_trajectories
+
+NUM_ENVS = 8
+NUM_OBS = 6
+NUM_STEPS = 7
+
+
+@pytest.mark.parametrize("rnn_type", ["lstm", "gru"])
+def test_collection_updates_preallocated_buffers_in_place(rnn_type):
+    torch.manual_seed(0)
+    memory = Memory(NUM_OBS, type=rnn_type, num_layers=2, hidden_size=16)
+    reference = Memory(NUM_OBS, type=rnn_type, num_layers=2, hidden_size=16)
+    reference.load_state_dict(memory.state_dict())
+    reference_states = None
+    with torch.inference_mode():
+        memory(torch.randn(NUM_ENVS, NUM_OBS))
+        buffer_ptrs = [buffer.data_ptr() for buffer in memory.hidden_state_buffers]
+        memory.reset()
+        for _ in range(6):
+            obs = torch.randn(NUM_ENVS, NUM_OBS)
+            expected, reference_states = reference.rnn(obs.unsqueeze(0), reference_states)
+            torch.testing.assert_close(memory(obs), expected)
+            dones = torch.rand(NUM_ENVS) < 0.3
+            memory.reset(dones)
+            states = reference_states if isinstance(reference_states, tuple) else (reference_states,)
+            states = tuple(state * (~dones).view(1, -1, 1) for state in states)
+            reference_states = states if rnn_type == "lstm" else states[0]
+    # the buffers are never reallocated
+    assert [buffer.data_ptr() for buffer in memory.hidden_state_buffers] == buffer_ptrs
+
+
+@pytest.mark.parametrize("rnn_type", ["lstm", "gru"])
+@pytest.mark.parametrize("checkpoint_chunk_size", [0, 1, 3, NUM_STEPS])
+def test_checkpointed_rnn_matches_the_plain_rnn(rnn_type, checkpoint_chunk_size):
+    torch.manual_seed(0)
+    memory = Memory(NUM_OBS, type=rnn_type, num_layers=2, hidden_size=16)
+    checkpointed = Memory(
+        NUM_OBS, type=rnn_type, num_layers=2, hidden_size=16, checkpoint_chunk_size=checkpoint_chunk_size
+    )
+    checkpointed.load_state_dict(memory.state_dict())
+    # padded trajectories of the policy update, as built by the recurrent mini-batch generator
+    dones = torch.rand(NUM_STEPS, NUM_ENVS) < 0.2
+    obs, masks = split_and_pad_trajectories(torch.randn(NUM_STEPS, NUM_ENVS, NUM_OBS), dones)
+    num_states = 2 if rnn_type == "lstm" else 1
+    states = [torch.randn(2, obs.shape[1], 16) for _ in range(num_states)]
+    weights = torch.randn(NUM_STEPS, NUM_ENVS, 16)
+
+    outputs, gradients = [], []
+    for module in (memory, checkpointed):
+        inputs = [tensor.clone().requires_grad_() for tensor in [obs] + states]
+        hidden_states = tuple(inputs[1:]) if rnn_type == "lstm" else inputs[1]
+        out = module(inputs[0], masks, hidden_states)
+        (out * weights).sum().backward()
+        outputs.append(out)
+        gradients.append([tensor.grad for tensor in inputs] + [param.grad for param in module.parameters()])
+
+    torch.testing.assert_close(outputs[1], outputs[0])
+    for actual, expected in zip(gradients[1], gradients[0]):
+        torch.testing.assert_close(actual, expected)
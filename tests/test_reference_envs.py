@@ -0,0 +1,29 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Asynchronous stepping of the reference environments."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from rsl_rl.env import AMPEnv, AMPEnvCfg, CartPoleEnv, CartPoleEnvCfg
+
+
+@pytest.mark.parametrize("env_class, cfg_class", [(CartPoleEnv, CartPoleEnvCfg), (AMPEnv, AMPEnvCfg)])
+def test_async_step_matches_step(env_class, cfg_class):
+    sync_env = env_class(cfg_class(num_envs=32, max_episode_length=5))
+    async_env = env_class(cfg_class(num_envs=32, max_episode_length=5, step_latency=1e-3))
+    generator = torch.Generator().manual_seed(0)
+    with torch.inference_mode():
+        for _ in range(12):
+            actions = torch.rand(32, sync_env.num_actions, generator=generator) * 2.0 - 1.0
+            expected = sync_env.step(actions)
+            async_env.step_async(actions)
+            result = async_env.step_wait()
+            assert len(result) == len(expected)
+            for value, expected_value in zip(result[:3] + result[4:], expected[:3] + expected[4:]):
+                torch.testing.assert_close(value, expected_value)
+            torch.testing.assert_close(result[3]["time_outs"], expected[3]["time_outs"])
+    async_env.close()
@@ -0,0 +1,90 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Stepping single-instance environments in worker processes must match stepping them in-process."""
+
+from __future__ import annotations
+
+import functools
+import numpy as np
+import torch
+from types import SimpleNamespace
+
+from rsl_rl.env import PointMassEnv, PointMassEnvCfg, SubprocVecEnv
+
+NUM_ENVS = 4
+MAX_EPISODE_LENGTH = 5
+
+
+class PointMassGymEnv:
+    """Gymnasium-style point mass that terminates after `terminal_length` steps.
+
+    The episodes of the wrapped `PointMassEnv` never time out, the truncation is left to the adapter.
+    """
+
+    def __init__(self, seed, terminal_length):
+        self.env = PointMassEnv(PointMassEnvCfg(num_envs=1, max_episode_length=10**9, seed=seed))
+        self.terminal_length = terminal_length
+        self.action_space = SimpleNamespace(shape=(self.env.num_actions,))
+
+    def reset(self):
+        obs, _ = self.env.reset()
+        return obs[0].numpy(), {}
+
+    def step(self, action):
+        obs, rewards, _, _ = self.env.step(torch.as_tensor(action).unsqueeze(0))
+        terminated = bool(self.env.episode_length_buf[0] >= self.terminal_length)
+        return obs[0].numpy(), float(rewards[0]), terminated, False, {}
+
+    def close(self):
+        self.env.close()
+
+
+def make_env_fns():
+    # the environments terminate before, at and after the truncation by the adapter
+    return [functools.partial(PointMassGymEnv, seed=i, terminal_length=3 + i) for i in range(NUM_ENVS)]
+
+
+def test_shared_memory_step_matches_in_process_envs():
+    vec_env = SubprocVecEnv(make_env_fns(), num_workers=2, max_episode_length=MAX_EPISODE_LENGTH)
+    try:
+        assert vec_env.obs_buf.is_shared() and vec_env.actions_buf.is_shared()
+        envs = [env_fn() for env_fn in make_env_fns()]
+        episode_lengths = [0] * NUM_ENVS
+        expected_obs = np.stack([env.reset()[0] for env in envs])
+        obs, _ = vec_env.get_observations()
+        torch.testing.assert_close(obs, torch.as_tensor(expected_obs))
+
+        generator = torch.Generator().manual_seed(0)
+        num_time_outs = num_terminations = 0
+        for _ in range(3 * MAX_EPISODE_LENGTH):
+            actions = torch.rand(NUM_ENVS, vec_env.num_actions, generator=generator) * 2.0 - 1.0
+            obs, rewards, dones, extras = vec_env.step(actions)
+            for i, env in enumerate(envs):
+                observation, reward, terminated, truncated, _ = env.step(actions[i].numpy())
+                episode_lengths[i] += 1
+                truncated = truncated or episode_lengths[i] >= MAX_EPISODE_LENGTH
+                if terminated or truncated:
+                    observation, _ = env.reset()
+                    episode_lengths[i] = 0
+                torch.testing.assert_close(obs[i], torch.as_tensor(observation))
+                torch.testing.assert_close(rewards[i], torch.tensor(reward, dtype=torch.float32))
+                assert dones[i] == int(terminated or truncated)
+                assert extras["time_outs"][i] == (truncated and not terminated)
+                num_time_outs += int(truncated and not terminated)
+                num_terminations += int(terminated)
+        # both ends of an episode were exercised
+        assert num_time_outs > 0 and num_terminations > 0
+    finally:
+        vec_env.close()
+    assert not any(worker.is_alive() for worker in vec_env.workers)
+
+
+def test_close_skips_dead_workers():
+    vec_env = SubprocVecEnv(make_env_fns(), num_workers=2, max_episode_length=MAX_EPISODE_LENGTH)
+    # the worker dies with a step pending
+    vec_env.step_async(torch.zeros(NUM_ENVS, vec_env.num_actions))
+    vec_env.workers[0].terminate()
+    vec_env.workers[0].join()
+    vec_env.close()
+    assert not any(worker.is_alive() for worker in vec_env.workers)
@@ -0,0 +1,55 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""V-trace targets and advantages of the rollout storage."""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from rsl_rl.storage import RolloutStorage
+
+NUM_ENVS = 8
+NUM_STEPS = 24
+
+
+def make_storage():
+    torch.manual_seed(0)
+    storage = RolloutStorage(NUM_ENVS, NUM_STEPS, [5], [None], [2])
+    storage.rewards.normal_()
+    storage.values.normal_()
+    storage.dones = (torch.rand(NUM_STEPS, NUM_ENVS, 1) < 0.1).byte()
+    return storage, torch.randn(NUM_ENVS, 1)
+
+
+@pytest.mark.parametrize("lam", [0.95, 1.0])
+def test_on_policy_targets_match_gae(lam):
+    storage, last_values = make_storage()
+    storage.compute_returns(last_values, 0.99, lam)
+    returns, advantages = storage.returns.clone(), storage.advantages.clone()
+    storage.compute_vtrace_returns(last_values, 0.99, lam, torch.zeros(NUM_STEPS, NUM_ENVS, 1))
+    torch.testing.assert_close(storage.returns, returns)
+    if lam == 1.0:
+        # the one-step advantages on the V-trace targets are the Monte-Carlo advantages
+        torch.testing.assert_close(storage.advantages, advantages)
+
+
+def test_truncated_ratios_match_on_policy():
+    storage, last_values = make_storage()
+    storage.compute_vtrace_returns(last_values, 0.99, 0.95, torch.zeros(NUM_STEPS, NUM_ENVS, 1))
+    returns, advantages = storage.returns.clone(), storage.advantages.clone()
+    # ratios above the truncation levels are clipped to them
+    storage.compute_vtrace_returns(last_values, 0.99, 0.95, torch.full((NUM_STEPS, NUM_ENVS, 1), 3.0))
+    torch.testing.assert_close(storage.returns, returns)
+    torch.testing.assert_close(storage.advantages, advantages)
+
+
+def test_stale_actions_are_down_weighted():
+    storage, last_values = make_storage()
+    log_ratios = torch.zeros(NUM_STEPS, NUM_ENVS, 1)
+    log_ratios[:, 0] = -20.0  # actions the current policy would not take
+    storage.compute_vtrace_returns(last_values, 0.99, 0.95, log_ratios)
+    # the targets fall back to the values and the advantages to the normalized zero
+    torch.testing.assert_close(storage.returns[:, 0], storage.values[:, 0], atol=1e-6, rtol=0.0)
+    torch.testing.assert_close(storage.advantages[:, 0], storage.advantages[0, 0].expand(NUM_STEPS, 1))
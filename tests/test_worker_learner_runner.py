@@ -0,0 +1,50 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""End-to-end training with rollout workers in separate processes."""
+
+from __future__ import annotations
+
+import os
+import torch
+
+from rsl_rl.env import PointMassEnv, PointMassEnvCfg
+from rsl_rl.runners import WorkerLearnerRunner
+
+NUM_ENVS = 4
+NUM_STEPS = 8
+
+
+def make_env(worker_id):
+    # the episodes time out within the fragments, the learner bootstraps them
+    return PointMassEnv(PointMassEnvCfg(num_envs=NUM_ENVS, max_episode_length=5, seed=worker_id))
+
+
+def make_train_cfg():
+    return {
+        "num_steps_per_env": NUM_STEPS,
+        "save_interval": 1,
+        "empirical_normalization": True,
+        "fragments_per_update": 3,
+        "logger": "tensorboard",
+        "algorithm": {"class_name": "PPO", "num_learning_epochs": 1, "num_mini_batches": 2},
+        "policy": {"class_name": "ActorCritic", "actor_hidden_dims": [16], "critic_hidden_dims": [16]},
+    }
+
+
+def test_workers_train_and_close(tmp_path):
+    runner = WorkerLearnerRunner(make_env, make_train_cfg(), num_workers=2, log_dir=str(tmp_path))
+    try:
+        initial_state = {key: value.clone() for key, value in runner.alg.actor_critic.state_dict().items()}
+        runner.learn(num_learning_iterations=3)
+
+        assert runner.current_learning_iteration == 2
+        assert all(os.path.exists(tmp_path / f"model_{it}.pt") for it in range(3))
+        # the workers act with the published weights of the learner
+        state = runner.alg.actor_critic.state_dict()
+        assert any(not torch.equal(state[key], initial_state[key]) for key in state)
+        for key, value in state.items():
+            torch.testing.assert_close(runner.shared_state["actor_critic"][key], value)
+    finally:
+        runner.close()
+    assert not any(worker.is_alive() for worker in runner.workers)